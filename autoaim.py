@@ -9,6 +9,8 @@ import modules.tools as tools
 from modules.io.robot import Robot
 from modules.io.recorder import Recorder
 from modules.io.communication import Communicator
+from modules.io.simulation import Replay
+from modules.io.trace import Stage
 from modules.autoaim.armor_solver import ArmorSolver
 from modules.autoaim.armor_detector import ArmorDetector, is_armor, is_lightbar, is_lightbar_pair
 from modules.autoaim.tracker import Tracker
@@ -23,6 +25,16 @@ enemy_color = 'blue'
 exposure_ms = 3
 port = '/dev/ttyUSB0'
 
+trace_path = None  # 例如'logs/trace.json', 退出时导出逐帧延迟, 可用Perfetto打开
+system_latency_s = None  # 例如0.12, 实测的取图到弹丸射出的总延迟, 不为None时减去实测的取图到写入串口的延迟, 作为目标写入之后的延迟
+use_bayer = False  # 进程间传递原始Bayer图像, 只在需要时去马赛克
+
+replay_path = None  # 例如'recordings/20230501-120000', 离线回放Recorder保存的录像, 不需要相机和串口
+replay_realtime = True  # False时尽可能快地回放, 用于测量整条流水线的吞吐
+
+record_pre_roll_s = None  # 例如3, 只保存事件(追踪状态变化, 开火, 异常)前后的帧, None时录下所有帧
+record_post_roll_s = 2
+
 
 if __name__ == '__main__':
     tools.config_logging()
@@ -31,13 +43,17 @@ if __name__ == '__main__':
     if len(sys.argv) > 1:
         enable = (sys.argv[1] == '-y')
 
-    with Communicator(port):
-        # 这里的作用是在程序正式运行前，打开串口再关闭。
-        # 因为每次开机后第一次打开串口，其输出全都是0，原因未知。
-        pass
+    replay = None
+    if replay_path is not None:
+        replay = Replay(replay_path, replay_realtime)
+    else:
+        with Communicator(port):
+            # 这里的作用是在程序正式运行前，打开串口再关闭。
+            # 因为每次开机后第一次打开串口，其输出全都是0，原因未知。
+            pass
 
     try:
-        with Robot(exposure_ms, port) as robot, Visualizer(enable=enable) as visualizer, Recorder() as recorder:
+        with Robot(exposure_ms, port, trace_path=trace_path, replay=replay, bayer=use_bayer) as robot, Visualizer(enable=enable) as visualizer, Recorder(robot.camera, pre_roll_s=record_pre_roll_s, post_roll_s=record_post_roll_s, clock=robot.clock) as recorder:
 
             if robot_id == 1:
                 from configs.hero import cameraMatrix, distCoeffs, R_camera2gimbal, t_camera2gimbal, gun_up_degree, gun_right_degree, whitelist
@@ -54,22 +70,22 @@ if __name__ == '__main__':
 
             armor_solver = ArmorSolver(cameraMatrix, distCoeffs, R_camera2gimbal, t_camera2gimbal)
 
-            tracker = Tracker()
+            tracker = Tracker(robot.clock)
 
             while True:
-                time.sleep(1e-4)
-
                 robot.update()
 
                 img = robot.img
                 img_time_s = robot.img_time_s
 
                 armors = armor_detector.detect(img)
+                robot.trace(Stage.DETECT)
 
                 yaw_degree, pitch_degree = robot.yaw_pitch_degree_at(img_time_s)
                 
                 armors = armor_solver.solve(armors, yaw_degree, pitch_degree)
                 armors = filter(lambda a: a.name not in whitelist, armors)
+                robot.trace(Stage.SOLVE)
 
                 recorder.record(img, (img_time_s, yaw_degree, pitch_degree, robot.bullet_speed, robot.flag))
 
@@ -79,23 +95,29 @@ if __name__ == '__main__':
                     tracker.init(armors, img_time_s)
                 else:
                     tracker.update(armors, img_time_s)
+                robot.trace(Stage.TRACK)
+                recorder.watch('tracker', tracker.state)
 
                 if tracker.state in ('TRACKING', 'TEMP_LOST'):
                     target = tracker.target
+                    if system_latency_s is not None and robot.pipeline_latency_s is not None:
+                        target.latency_s = max(system_latency_s - robot.pipeline_latency_s, 0.0)
                     try:
-                        aim_point_in_imu_m, fire_time_s = target.aim(robot.bullet_speed)
-                        # print(aim_point_in_imu_m)
-                        robot.shoot(gun_up_degree, gun_right_degree, aim_point_in_imu_m, fire_time_s)
+                        robot.track(gun_up_degree, gun_right_degree, target)
                     except Exception as e:
                         logging.exception(e)
+                elif tracker.state == 'LOST':
+                    robot.cancel_fire()
+                recorder.watch('fired', robot.fire_stats['fired'])
 
                 # 调试分割线
 
-                if not visualizer.enable:
+                # 没有打开网页或超过显示帧率时跳过绘图
+                if not visualizer.will_accept():
                     continue
 
                 # drawing = img.copy()
-                drawing = cv2.convertScaleAbs(img, alpha=5)
+                drawing = cv2.convertScaleAbs(img.bgr() if use_bayer else img, alpha=5)
 
                 for i, l in enumerate(armor_detector._raw_lightbars):
                     if not is_lightbar(l):
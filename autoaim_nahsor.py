@@ -6,12 +6,16 @@ import logging
 import numpy as np
 
 import modules.tools as tools
+from modules import ballistics
 from modules.io.robot import Robot
 from modules.io.recorder import Recorder
 from modules.io.communication import Communicator
+from modules.io.simulation import Replay
+from modules.io.trace import Stage
 from modules.autoaim.armor_solver import ArmorSolver
 from modules.autoaim.armor_detector import ArmorDetector, is_armor, is_lightbar, is_lightbar_pair
 from modules.Nahsor.nahsor_tracker import NahsorTracker 
+from configs.NahsorConfig import FIT_STATUS
 from modules.autoaim.tracker import Tracker
 
 from remote_visualizer import Visualizer
@@ -20,6 +24,12 @@ from remote_visualizer import Visualizer
 exposure_ms = 3
 port = '/dev/ttyUSB0'
 
+replay_path = None  # 例如'recordings/20230501-120000', 离线回放Recorder保存的录像, 不需要相机和串口
+replay_realtime = True  # False时尽可能快地回放, 用于测量整条流水线的吞吐
+
+record_pre_roll_s = None  # 例如3, 只保存事件(追踪状态变化, 开火, 异常, 能量机关拟合失败)前后的帧, None时录下所有帧
+record_post_roll_s = 2
+
 
 if __name__ == '__main__':
     tools.config_logging()
@@ -28,13 +38,17 @@ if __name__ == '__main__':
     if len(sys.argv) > 1:
         enable = (sys.argv[1] == '-y')
 
-    with Communicator(port):
-        # 这里的作用是在程序正式运行前，打开串口再关闭。
-        # 因为每次开机后第一次打开串口，其输出全都是0，原因未知。
-        pass
+    replay = None
+    if replay_path is not None:
+        replay = Replay(replay_path, replay_realtime)
+    else:
+        with Communicator(port):
+            # 这里的作用是在程序正式运行前，打开串口再关闭。
+            # 因为每次开机后第一次打开串口，其输出全都是0，原因未知。
+            pass
 
     try:
-        with Robot(exposure_ms, port) as robot, Visualizer(enable=enable) as visualizer, Recorder() as recorder:
+        with Robot(exposure_ms, port, replay=replay) as robot, Visualizer(enable=enable) as visualizer, Recorder(robot.camera, pre_roll_s=record_pre_roll_s, post_roll_s=record_post_roll_s, clock=robot.clock) as recorder:
             robot.update()
 
             if robot.id == 1:
@@ -53,13 +67,11 @@ if __name__ == '__main__':
 
             armor_solver = ArmorSolver(cameraMatrix, distCoeffs, R_camera2gimbal, t_camera2gimbal)
 
-            tracker = Tracker()
+            tracker = Tracker(robot.clock)
 
-            nahsor_tracker = NahsorTracker(robot_color=robot.color)
+            nahsor_tracker = NahsorTracker(robot_color=robot.color, clock=robot.clock)
 
             while True:
-                time.sleep(1e-4)
-
                 robot.update()
 
                 img = robot.img
@@ -73,6 +85,7 @@ if __name__ == '__main__':
                     # 能量机关模式                  
                     try:
                         nahsor_tracker.update(frame=img, robot_work_mode = robot.work_mode)
+                        recorder.watch('nahsor_fit', nahsor_tracker.nahsor.fit_status, on=FIT_STATUS.FAILED)
                         
                         target = nahsor_tracker.nahsor
                         predictedPtsInWorld = nahsor_tracker.getShotPoint(0.15, robot.bullet_speed, 
@@ -91,34 +104,45 @@ if __name__ == '__main__':
                                 logging.info(f"nahsor distance error--p_distance = {p_distance}")   
                                 armor_in_gun = None                             
                             else:                        
-                                armor_in_gun = tools.trajectoryAdjust(predictedPtsInWorld, robot, enableAirRes=0)                   
-                                if armor_in_gun is not None:                        
+                                gun_pitch_rad, _ = ballistics.solve(predictedPtsInWorld / 1e3, robot.bullet_speed)
+                                if np.isnan(gun_pitch_rad).any():
+                                    logging.info('nahsor out of range')
+                                    armor_in_gun = None
+                                else:
+                                    armor_in_gun = ballistics.compensate(predictedPtsInWorld, gun_pitch_rad)
                                     robot.shoot(gun_up_degree, gun_right_degree, armor_in_gun/1000)
+                                    recorder.trigger('shoot')
 
                     except Exception as e:
                         logging.exception(e)
                 
                 else :
                     # 自瞄模式                 
-                    nahsor_tracker = NahsorTracker(robot_color=robot.color)
+                    nahsor_tracker = NahsorTracker(robot_color=robot.color, clock=robot.clock)
 
                     armors = armor_detector.detect(img)
+                    robot.trace(Stage.DETECT)
                     
                     armors = armor_solver.solve(armors, yaw_degree, pitch_degree)
                     armors = filter(lambda a: a.name not in whitelist, armors)
+                    robot.trace(Stage.SOLVE)
                     
                     if tracker.state == 'LOST':
                         tracker.init(armors, img_time_s)
                     else:
                         tracker.update(armors, img_time_s)
+                    robot.trace(Stage.TRACK)
+                    recorder.watch('tracker', tracker.state)
 
                     if tracker.state in ('TRACKING', 'TEMP_LOST'):
                         target = tracker.target
                         try:
-                            aim_point_in_imu_m, fire_time_s = target.aim(robot.bullet_speed)
-                            robot.shoot(gun_up_degree, gun_right_degree, aim_point_in_imu_m, fire_time_s)
+                            robot.track(gun_up_degree, gun_right_degree, target)
                         except Exception as e:
                             logging.exception(e)
+                    elif tracker.state == 'LOST':
+                        robot.cancel_fire()
+                    recorder.watch('fired', robot.fire_stats['fired'])
                     # print(f'Tracker state: {tracker.state} ')                
                     
 
@@ -0,0 +1,23 @@
+'''
+进程放置: 各进程绑定的CPU核与调度策略, 每个进程启动时按名字(角色)应用.
+子进程会继承父进程的设置, 因此每个角色都显式设置全部三项.
+cores: 绑定的CPU核, None表示所有核(isolate_main时除去主进程的核), 机器上不存在的核会被忽略;
+nice: nice值, 负值需要root或CAP_SYS_NICE;
+fifo_priority: 不为None时使用SCHED_FIFO实时调度(1~99), 需要root或CAP_SYS_NICE, 否则为普通调度.
+'''
+
+enable = True
+isolate_main = True  # 主进程独占其核, 其余进程的cores中去掉这些核
+
+profile = {
+    'main': {'cores': (1,), 'nice': -10, 'fifo_priority': None},
+    'capture': {'cores': (2,), 'nice': 0, 'fifo_priority': 50},
+    'replay': {'cores': (2,), 'nice': 0, 'fifo_priority': None},
+    'receive': {'cores': (3,), 'nice': 0, 'fifo_priority': 60},
+    'transmit': {'cores': (3,), 'nice': 0, 'fifo_priority': 70},  # 开火时刻要求亚毫秒精度
+    'serial': {'cores': (3,), 'nice': 0, 'fifo_priority': 70},  # 收发合一, 代替receive和transmit
+    'record': {'cores': (0,), 'nice': 10, 'fifo_priority': None},  # 按序写入录像
+    'encode': {'cores': None, 'nice': 10, 'fifo_priority': None},  # 录像编码, 可以有多个
+    'visualize': {'cores': (0,), 'nice': 10, 'fifo_priority': None},
+    'mcu': {'cores': None, 'nice': 0, 'fifo_priority': None},  # 虚拟下位机, 仅测试时使用
+}
@@ -0,0 +1,37 @@
+import sys
+import time
+
+import modules.tools as tools
+from modules.autoaim.evaluation import find_recordings, evaluate_all
+
+
+robot_id = 3
+enemy_color = 'blue'
+
+process_num = None  # None时为CPU核数
+max_frames = None  # 每个录像最多评估的帧数, None时评估全部
+use_detection_cache = True  # 复用录像旁缓存的检测结果, 只重新运行追踪和瞄准; 检测参数或模型改变后自动重新检测
+
+
+if __name__ == '__main__':
+    # 用法: python evaluate.py recordings [logs/evaluation]
+    tools.config_logging()
+
+    recordings_dir = sys.argv[1] if len(sys.argv) > 1 else 'recordings'
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'logs/evaluation'
+
+    video_paths = find_recordings(recordings_dir)
+    print(f'{len(video_paths)} recordings in {recordings_dir}')
+
+    start_s = time.time()
+    total_frames = 0
+    for result in evaluate_all(video_paths, robot_id, enemy_color, output_dir, process_num, max_frames, use_detection_cache):
+        total_frames += result['frames']
+        detect_ms = result['stage_ms']['detect'].get('mean', 0)
+        print(
+            f"{result['recording']}: {result['frames']} frames {result['fps']:.1f}fps{' (cached)' if result['cached'] else ''} detect={detect_ms:.2f}ms "
+            f"armors={result['detections']['armors']} aims={len(result['aims']['values'])} -> {result['output_path']}"
+        )
+
+    cost_s = time.time() - start_s
+    print(f'{total_frames} frames in {cost_s:.2f}s, {total_frames / cost_s:.1f}fps')
@@ -5,7 +5,9 @@ import numpy as np
 from collections import deque
 
 import modules.tools as tools
+from modules import ballistics
 from modules.io.robot import Robot
+from modules.io.simulation import Replay
 
 from modules.autoaim.armor_detector import ArmorDetector
 from modules.autoaim.armor_solver import ArmorSolver
@@ -27,6 +29,10 @@ class Target_msg:
         self.y_2 = 0.0
 
 
+replay_path = None  # 例如'recordings/20230501-120000', 离线回放Recorder保存的录像, 不需要相机和串口
+replay_realtime = True  # False时尽可能快地回放, 用于测量整条流水线的吞吐
+
+
 if __name__ == '__main__':
     enable: str = None
     while True:
@@ -37,7 +43,9 @@ if __name__ == '__main__':
             print('请重新输入')
     enable = True if enable == 'y' else False
 
-    with Robot(5, '/dev/ttyUSB0') as robot, Visualizer(enable=enable) as visualizer:
+    replay = None if replay_path is None else Replay(replay_path, replay_realtime)
+
+    with Robot(5, '/dev/ttyUSB0', replay=replay) as robot, Visualizer(enable=enable) as visualizer:
         robot.update()
 
         if robot.id == 1:
@@ -96,11 +104,14 @@ if __name__ == '__main__':
 
                     # tools.drawPoint(drawing, Shot.shot_point_in_pixel,(0,0,255),radius = 10)#red 预测时间后待击打装甲板的位置
 
-                    # 重力补偿
-                    armor_in_gun = tools.trajectoryAdjust(predictedPtsInWorld, robot, enableAirRes=1)
+                    # 重力补偿, 打不到时跳过这次射击
+                    if predictedPtsInWorld is not None:
+                        gun_pitch_rad, _ = ballistics.solve(predictedPtsInWorld / 1e3, robot.bullet_speed, ballistics.k_over_m_of(robot.id))
+                        if not np.isnan(gun_pitch_rad).any():
+                            armor_in_gun = ballistics.compensate(predictedPtsInWorld, gun_pitch_rad)
 
-                    fire = 1 if tracker.tracker_state == TrackerState.TRACKING else 0
-                    robot.shoot(pitch_offset, armor_in_gun/1000)
+                            fire = 1 if tracker.tracker_state == TrackerState.TRACKING else 0
+                            robot.shoot(pitch_offset, armor_in_gun/1000)
 
                     # 调试用
                     # visualizer.plot((cy, y, robot_yaw_degree*10, robot_pitch_degree*10), ('cy', 'y', 'yaw', 'pitch'))
@@ -137,9 +148,11 @@ if __name__ == '__main__':
                                                                   enablePredict=0)
 
                 if predictedPtsInWorld is not None:
-                    armor_in_gun = tools.trajectoryAdjust(predictedPtsInWorld, robot, enableAirRes=0)                   
-                    # print(armor_in_gun)
-                    if armor_in_gun is not None:
+                    gun_pitch_rad, _ = ballistics.solve(predictedPtsInWorld / 1e3, robot.bullet_speed)
+                    # 打不到时跳过这次射击
+                    if not np.isnan(gun_pitch_rad).any():
+                        armor_in_gun = ballistics.compensate(predictedPtsInWorld, gun_pitch_rad)
+                        # print(armor_in_gun)
                         shoot_pts = robot.shoot(pitch_offset, armor_in_gun/1000)
 
                         # debug输出
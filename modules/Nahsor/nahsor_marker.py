@@ -8,9 +8,8 @@ from scipy.signal import medfilt
 from collections import Counter
 from scipy.optimize import curve_fit
 
-import time
-
 from modules.Nahsor.nahsor_utils import *
+from modules.clock import Clock, real_clock
 
 
 # 每局比赛旋转方向固定
@@ -32,15 +31,19 @@ class NahsorMarker(object):
     last_center_for_r = None  # 上一次的装甲板中心
     last_time_for_R = None  # 上次拟合时间
     last_center_for_speed = None
-    last_time_for_fit = time.time()
-    last_time_for_speed = time.time()  # 上帧图像的时间戳，为了计算两帧图像间的间隔
+    last_time_for_fit = None
+    last_time_for_speed = None  # 上帧图像的时间戳，为了计算两帧图像间的间隔
 
     def __init__(self, color: COLOR = COLOR.BLUE, fit_speed_mode: FIT_SPEED_MODE = FIT_SPEED_MODE.CURVE_FIT,
                  energy_mode: ENERGY_MODE = ENERGY_MODE.BIG, color_space: COLOR_SPACE = COLOR_SPACE.HSV, target_debug=0,
-                 fit_debug=0):
+                 fit_debug=0, clock: Clock = real_clock):
         # def __init__(self, color=COLOR.RED, fit_speed_mode=FIT_SPEED_MODE.BY_SPEED,
         #              energy_mode=ENERGY_MODE.BIG, color_space=COLOR_SPACE.BGR, debug=1):
 
+        self.clock = clock  # 测速和预测所用的时钟, 离线评估时跟随录像时间戳
+        self.last_time_for_fit = clock.time()
+        self.last_time_for_speed = clock.time()
+
         self.origin_frame = None  # 原图
         self.energy_mode = energy_mode  # 大符或小符
         self.target_debug = target_debug
@@ -72,7 +75,7 @@ class NahsorMarker(object):
             else:
                 self.speed_params_maxerror.append(1)
         self.speed_params_maxerror = np.array(self.speed_params_maxerror)
-        self.big_start_time = time.time()  # 大符开始的时间(实际只是一个基准，不必此时开始)
+        self.big_start_time = self.clock.time()  # 大符开始的时间(实际只是一个基准，不必此时开始)
 
         self.speed_params = None  # 速度正弦函数的参数
 
@@ -282,16 +285,16 @@ class NahsorMarker(object):
                     elif self.__fan_change == 1:
                         # 需要调整上一个点的位置
 
-                        self.last_time_for_speed = time.time()
+                        self.last_time_for_speed = self.clock.time()
                         self.last_center_for_speed = self.current_center
                         self.__fan_change = 0
                     elif self.fit_status == FIT_STATUS.FAILED:
                         self.fit_status = FIT_STATUS.FITTING
 
-                        self.last_time_for_speed = time.time()
+                        self.last_time_for_speed = self.clock.time()
                         self.last_center_for_speed = self.current_center
                     elif self.fit_status == FIT_STATUS.FITTING:
-                        if time.time() - self.last_time_for_speed > FIT_INTERVAL:
+                        if self.clock.time() - self.last_time_for_speed > FIT_INTERVAL:
                             self.set_fit_speeds()
 
                             if len(self.fit_speeds) > FIT_MIN_LEN:
@@ -305,7 +308,7 @@ class NahsorMarker(object):
                                     if (np.all(speed_err < self.speed_params_maxerror) and len(
                                             self.fit_speeds) > 5 * FIT_MIN_LEN):
                                         self.fit_status = FIT_STATUS.SUCCESS
-                                        self.last_time_for_fit = time.time()
+                                        self.last_time_for_fit = self.clock.time()
                                     self.speed_params = speed_params
 
                     elif self.fit_status == FIT_STATUS.SUCCESS:
@@ -378,8 +381,9 @@ class NahsorMarker(object):
                 # angle = self.get_predict_time() * self.rot_speed
                 # angle, _ = quad(speed_func, time.time() - self.big_start_time,
                 #                 time.time() + self.get_predict_time() - self.big_start_time, args=fit_param_args)
-                angle = angle_func(time.time() + predict_time - self.big_start_time,
-                                   *fit_param_args) - angle_func(time.time() - self.big_start_time,
+                current_time = self.clock.time()
+                angle = angle_func(current_time + predict_time - self.big_start_time,
+                                   *fit_param_args) - angle_func(current_time - self.big_start_time,
                                                                  *fit_param_args)
             else:
                 angle = predict_time * self.rot_speed
@@ -433,7 +437,7 @@ class NahsorMarker(object):
 
     # 拆出计算速度的部分，如果误差过大重新预测
     def set_fit_speeds(self):
-        current_time = time.time()
+        current_time = self.clock.time()
         interval = current_time - self.last_time_for_speed
         rot_angle = angle_between_points(self.r_center, self.current_center,
                                          self.last_center_for_speed)
@@ -1,12 +1,14 @@
 from modules.Nahsor.nahsor_marker import NahsorMarker
 import configs.NahsorConfig as NahsorConfig
-import modules.tools as tools
+from modules import ballistics
 from modules.Nahsor.nahsor_solver import NahsorSolver
 import numpy as np
+from modules.clock import Clock, real_clock
 
 class NahsorTracker():
     '''能量机关追踪器'''
-    def __init__(self,robot_color) -> None:
+    def __init__(self,robot_color, clock: Clock = real_clock) -> None:
+        self.clock = clock
         self.nahsor:NahsorMarker = None 
         self.nahsor_color = NahsorConfig.COLOR.RED if robot_color == 'red' else NahsorConfig.COLOR.BLUE
         self.last_mode = 0
@@ -23,7 +25,8 @@ class NahsorTracker():
         self.nahsor = NahsorMarker(color=self.nahsor_color, energy_mode = energy_mode,
                                    color_space=self.color_space,
                                    fit_debug=0, target_debug=1,
-                                   fit_speed_mode=NahsorConfig.FIT_SPEED_MODE.CURVE_FIT)
+                                   fit_speed_mode=NahsorConfig.FIT_SPEED_MODE.CURVE_FIT,
+                                   clock=self.clock)
 
 
     def update(self, frame, robot_work_mode):
@@ -71,7 +74,10 @@ class NahsorTracker():
             self.nahsor.fit_status is not NahsorConfig.FIT_STATUS.SUCCESS):            
             return None
             
-        flyTime_s = tools.getParaTime(current3DPos, bulletSpeed=bulletSpeed) / 1000 # 到观测靶心的子弹飞行时间(秒)(s)
+        _, (flyTime_s,) = ballistics.solve(current3DPos / 1e3, bulletSpeed) # 到观测靶心的子弹飞行时间(秒)(s)
+        if np.isnan(flyTime_s):
+            # 打不到, 不进行预测
+            return None
 
         predictTime_s = flyTime_s + deltatime # 预测时间
 
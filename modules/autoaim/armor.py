@@ -41,6 +41,7 @@ class Armor(LazyTransformation):
         self.name = name
         self.pattern = pattern
 
+        self.pair = pair
         self.left = pair.left
         self.right = pair.right
         self.center = pair.center
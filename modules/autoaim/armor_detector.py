@@ -6,6 +6,7 @@ from collections.abc import Iterable
 
 from modules.autoaim.armor import Lightbar, LightbarPair, Armor
 from modules.autoaim.classifier import Classifier
+from modules.io.bayer import BayerImage
 
 
 # 预处理
@@ -61,18 +62,28 @@ class ArmorDetector:
         self._raw_lightbar_pairs: list[LightbarPair] = None
         self._raw_armors: list[Armor] = None
 
-    def _get_processed_img(self, img: cv2.Mat) -> cv2.Mat:
+    def _get_processed_img(self, img: cv2.Mat | BayerImage) -> cv2.Mat:
+        # Bayer图像在半分辨率上找灯条
+        if isinstance(img, BayerImage):
+            img = img.half()
+
         gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         _, threshold_img = cv2.threshold(gray_img, threshold_value, 255, cv2.THRESH_BINARY)
 
         return threshold_img
 
-    def _get_raw_lightbars(self, img: cv2.Mat, processed_img: cv2.Mat) -> list[Lightbar]:
+    def _get_raw_lightbars(self, img: cv2.Mat | BayerImage, processed_img: cv2.Mat) -> list[Lightbar]:
         lightbars: list[Lightbar] = []
         contours, _ = cv2.findContours(processed_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
 
+        bayer = isinstance(img, BayerImage)
+
         for contour in contours:
-            rect = cv2.minAreaRect(contour)
+            # 半分辨率的轮廓换算回原图坐标, 半分辨率像素(x, y)对应原图2x2块的中心
+            if bayer:
+                rect = cv2.minAreaRect(np.float32(contour) * 2 + 0.5)
+            else:
+                rect = cv2.minAreaRect(contour)
             center = rect[0]  # (x, y)
             h, w = rect[1]
             angle = rect[2]
@@ -88,10 +99,15 @@ class ArmorDetector:
 
             # 判断颜色
             roi_x, roi_y, roi_w, roi_h = cv2.boundingRect(contour)  # (左上x, 左上y, w, h)
-            roi_blue = img[roi_y:roi_y+roi_h, roi_x:roi_x+roi_w, 0]
-            roi_red = img[roi_y:roi_y+roi_h, roi_x:roi_x+roi_w, 2]
-            blue_sum = np.count_nonzero(cv2.subtract(roi_blue, roi_red) > min_color_difference)
-            red_sum = np.count_nonzero(cv2.subtract(roi_red, roi_blue) > min_color_difference)
+            if bayer:
+                # 直接用Bayer的红蓝平面
+                red_minus_blue, blue_minus_red = img.red_blue_difference(roi_x, roi_y, roi_w, roi_h)
+            else:
+                roi_blue = img[roi_y:roi_y+roi_h, roi_x:roi_x+roi_w, 0]
+                roi_red = img[roi_y:roi_y+roi_h, roi_x:roi_x+roi_w, 2]
+                red_minus_blue, blue_minus_red = cv2.subtract(roi_red, roi_blue), cv2.subtract(roi_blue, roi_red)
+            blue_sum = np.count_nonzero(blue_minus_red > min_color_difference)
+            red_sum = np.count_nonzero(red_minus_blue > min_color_difference)
             color = 'blue' if blue_sum > red_sum else 'red'
             if color != self._enemy_color:
                 continue
@@ -119,7 +135,7 @@ class ArmorDetector:
 
         return lightbar_pairs
 
-    def _get_raw_armors(self, img: cv2.Mat, lightbar_pairs: Iterable[LightbarPair]) -> list[Armor]:
+    def _get_raw_armors(self, img: cv2.Mat | BayerImage, lightbar_pairs: Iterable[LightbarPair]) -> list[Armor]:
         armors: list[Armor] = []
 
         for lightbar_pair in lightbar_pairs:
@@ -132,11 +148,17 @@ class ArmorDetector:
             bottom_right = right.center - right.h * right.h_vector * pattern_h_coefficient
             from_points = np.float32([top_left, top_right, bottom_right, bottom_left])
 
+            # Bayer图像只对装甲板区域去马赛克
+            roi = img
+            if isinstance(img, BayerImage):
+                roi, roi_x, roi_y = img.roi_bgr(*cv2.boundingRect(from_points))
+                from_points -= (roi_x, roi_y)
+
             # 透视变换获得图案图片
             h, w = pattern_h, pattern_w + margin * 2
             to_points = np.float32(((0, 0), (w, 0), (w, h), (0, h)))
             transform = cv2.getPerspectiveTransform(from_points, to_points)
-            pattern = cv2.warpPerspective(img, transform, (w, h))
+            pattern = cv2.warpPerspective(roi, transform, (w, h))
 
             # 裁剪两侧灯条
             pattern = pattern[:, margin:-margin]
@@ -154,7 +176,7 @@ class ArmorDetector:
 
         return armors
 
-    def detect(self, img: cv2.Mat) -> Iterable[Armor]:
+    def detect(self, img: cv2.Mat | BayerImage) -> Iterable[Armor]:
         self._processed_img = self._get_processed_img(img)
 
         self._raw_lightbars = self._get_raw_lightbars(img, self._processed_img)
@@ -10,10 +10,12 @@ class_names = ('big_one', 'big_three', 'big_four', 'big_five', 'big_base',
                'small_base', 'small_sentry', 'small_outpost',
                'no_pattern')
 
+model_path = 'assets/model.onnx'
+
 
 class Classifier:
     def __init__(self) -> None:
-        self.net = cv2.dnn.readNetFromONNX('assets/model.onnx')
+        self.net = cv2.dnn.readNetFromONNX(model_path)
 
     def classify(self, pattern_img: cv2.Mat) -> tuple[float, str]:
         pattern_img = cv2.resize(pattern_img, (50, 50))
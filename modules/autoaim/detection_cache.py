@@ -0,0 +1,160 @@
+import os
+import hashlib
+import logging
+import numpy as np
+from collections.abc import Iterable
+
+import modules.autoaim.armor_detector as armor_detector
+import modules.autoaim.armor_solver as armor_solver
+import modules.autoaim.classifier as classifier
+from modules.autoaim.armor import Lightbar, LightbarPair, Armor
+from modules.io.recording import is_recording
+
+
+'''
+检测结果缓存: 逐帧保存检测和PnP的结果, 调追踪器, EKF噪声或瞄准偏置时不必重新检测.
+缓存按列存储在录像旁的npz中, 文件名带有检测参数, 模型文件和相机内参的哈希, 任一改变后自动失效.
+PnP的位姿在相机坐标系下, 与姿态无关, 换到imu坐标系仍由ArmorSolver按录像中的姿态完成.
+'''
+
+LIGHTBAR_FIELDS = ('h', 'angle', 'x', 'y', 'ratio')
+PAIR_FIELDS = ('side_ratio', 'angle', 'ratio')
+MAX_PNP_NUM = 2  # SOLVEPNP_IPPE最多两个解
+
+
+def _params(module) -> dict:
+    '''模块中的参数, 即公开的数值和字符串常量'''
+    return {
+        name: value for name, value in sorted(vars(module).items())
+        if not name.startswith('_') and isinstance(value, (int, float, str, tuple))
+    }
+
+
+def cache_key(enemy_color: str, cameraMatrix: np.ndarray, distCoeffs: np.ndarray) -> str:
+    '''检测器参数, 分类模型, 装甲板尺寸和相机内参的哈希'''
+    h = hashlib.sha1()
+    h.update(enemy_color.encode())
+    for module in (armor_detector, armor_solver, classifier):
+        h.update(repr(_params(module)).encode())
+    with open(classifier.model_path, 'rb') as f:
+        h.update(f.read())
+    h.update(np.float64(cameraMatrix).tobytes())
+    h.update(np.float64(distCoeffs).tobytes())
+    return h.hexdigest()[:16]
+
+
+def cache_path(video_path: str, key: str) -> str:
+    '''录像目录中的detections-<key>.npz, 或录像文件旁的<含扩展名的文件名>.detections-<key>.npz, a.avi与a.npy不会冲突'''
+    if is_recording(video_path):
+        return os.path.join(video_path, f'detections-{key}.npz')
+    return f'{video_path}.detections-{key}.npz'
+
+
+class DetectionCache:
+    '''
+    一个录像的检测结果, 每个装甲板一行, offsets[i]:offsets[i+1]为第i帧的装甲板.
+    add逐帧追加, save写入文件; load读取后armors(i)重建第i帧的装甲板, 位姿不再求解.
+    '''
+
+    def __init__(self, enemy_color: str, key: str) -> None:
+        self.enemy_color = enemy_color
+        self.key = key
+        self.complete = False  # 是否覆盖录像的所有帧
+
+        self._columns: dict[str, np.ndarray] = None
+        self._rows: list[tuple] = []
+        self._counts: list[int] = []
+
+    def __len__(self) -> int:
+        if self._columns is not None:
+            return len(self._columns['offsets']) - 1
+        return len(self._counts)
+
+    def add(self, armors: Iterable[Armor]) -> None:
+        '''追加一帧的装甲板, 装甲板需已经过ArmorSolver'''
+        count = 0
+        for armor in armors:
+            pnp_num = min(len(armor.rvecs), MAX_PNP_NUM)
+            rvecs = np.zeros((MAX_PNP_NUM, 3))
+            tvecs = np.zeros((MAX_PNP_NUM, 3))
+            errors = np.zeros(MAX_PNP_NUM)
+            rvecs[:pnp_num] = np.reshape(armor.rvecs[:pnp_num], (pnp_num, 3))
+            tvecs[:pnp_num] = np.reshape(armor.tvecs[:pnp_num], (pnp_num, 3))
+            errors[:pnp_num] = np.ravel(armor.errors)[:pnp_num]
+
+            pair = armor.pair
+            lightbars = [(l.h, l.angle, *l.center, l.ratio) for l in (pair.left, pair.right)]
+            self._rows.append((
+                lightbars, (pair.side_ratio, pair.angle, pair.ratio),
+                classifier.class_names.index(armor.name), armor.confidence,
+                pnp_num, rvecs, tvecs, errors
+            ))
+            count += 1
+        self._counts.append(count)
+
+    def save(self, path: str, complete: bool) -> None:
+        lightbars, pairs, names, confidences, pnp_nums, rvecs, tvecs, errors = zip(*self._rows) if self._rows else [()] * 8
+        columns = {
+            'offsets': np.int64(np.cumsum([0] + self._counts)),
+            'lightbars': np.float32(lightbars).reshape(-1, 2, len(LIGHTBAR_FIELDS)),
+            'pairs': np.float32(pairs).reshape(-1, len(PAIR_FIELDS)),
+            'names': np.uint8(names),
+            'confidences': np.float32(confidences),
+            'pnp_nums': np.uint8(pnp_nums),
+            'rvecs': np.float64(rvecs).reshape(-1, MAX_PNP_NUM, 3),
+            'tvecs': np.float64(tvecs).reshape(-1, MAX_PNP_NUM, 3),
+            'errors': np.float64(errors).reshape(-1, MAX_PNP_NUM),
+            'complete': np.bool_(complete),
+            'key': np.str_(self.key),
+        }
+
+        # 先写临时文件再改名, 中途退出时不会留下不完整的缓存
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, **columns)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, enemy_color: str, key: str) -> 'DetectionCache | None':
+        '''没有缓存或缓存无法读取时返回None'''
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path) as f:
+                columns = {name: f[name] for name in f.files}
+        except Exception as e:
+            logging.warning(f'Ignore broken detection cache {path}: {e}')
+            return None
+        if str(columns['key']) != key:
+            return None
+
+        cache = cls(enemy_color, key)
+        cache.complete = bool(columns['complete'])
+        cache._columns = columns
+        return cache
+
+    def armors(self, i: int) -> list[Armor]:
+        '''第i帧的装甲板, 没有图案图片, PnP结果已还原'''
+        c = self._columns
+        armors = []
+        for row in range(c['offsets'][i], c['offsets'][i + 1]):
+            left, right = (Lightbar(h, angle, (x, y), self.enemy_color, ratio) for h, angle, x, y, ratio in c['lightbars'][row].tolist())
+            side_ratio, angle, ratio = c['pairs'][row].tolist()
+            pair = LightbarPair(left, right, side_ratio, angle, ratio)
+            armor = Armor(pair, float(c['confidences'][row]), classifier.class_names[c['names'][row]], None)
+
+            pnp_num = int(c['pnp_nums'][row])
+            rvecs = tuple(rvec.reshape(3, 1) for rvec in c['rvecs'][row, :pnp_num])
+            tvecs = tuple(tvec.reshape(3, 1) for tvec in c['tvecs'][row, :pnp_num])
+            armor.restore_pnp(rvecs, tvecs, c['errors'][row, :pnp_num].reshape(-1, 1))
+            armors.append(armor)
+        return armors
+
+
+def remove_stale(video_path: str, key: str) -> None:
+    '''删除该录像其他key的缓存'''
+    current = cache_path(video_path, key)
+    directory = os.path.dirname(current) or '.'
+    prefix = os.path.basename(cache_path(video_path, ''))[:-len('.npz')]
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith('.npz') and name != os.path.basename(current):
+            os.remove(os.path.join(directory, name))
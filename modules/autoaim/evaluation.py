@@ -0,0 +1,216 @@
+import os
+import cv2
+import glob
+import json
+import time
+import logging
+import importlib
+import numpy as np
+from multiprocessing import Pool
+
+from modules.autoaim.armor_detector import ArmorDetector
+from modules.autoaim.armor_solver import ArmorSolver
+from modules.autoaim.tracker import Tracker
+from modules.clock import RecordedClock
+from modules.autoaim.detection_cache import DetectionCache, cache_key, cache_path, remove_stale
+from modules.io.parallel_tx_communicator import Tracking
+from modules.io.communication import TX_FLAG_FIRE
+from modules.io.recording import is_recording, prefetch
+from modules.io.recorder import H, W
+from modules.io.simulation import FPS, load_statuses, open_frames
+
+
+'''
+离线评估: 把录像逐帧送入 检测 -> 解算 -> 追踪 -> 瞄准, 姿态使用录像中记录的值, 不需要相机和串口.
+每个录像得到一个json: 吞吐, 各阶段耗时, 检测数量, 追踪器各状态的时长, 逐帧的瞄准输出.
+多个录像分给进程池并行评估, 每个进程内解码在预取线程中进行.
+目标外推使用跟随录像时间戳的时钟, 瞄准输出与评估速度无关, 可以复现.
+使用检测结果缓存时, 第二次评估跳过解码和检测, 只重新运行解算后的坐标变换, 追踪和瞄准.
+'''
+
+STAGES = ('decode', 'detect', 'solve', 'track', 'aim')
+
+robot_configs = {1: 'hero', 3: 'infantry3', 4: 'infantry4', 5: 'infantry5', 7: 'sentry'}
+
+video_extensions = ('.avi', '.mp4', '.npy', '.raw')
+
+
+def find_recordings(directory: str) -> list[str]:
+    '''directory下的录像目录和录像文件'''
+    paths = []
+    for path in sorted(glob.glob(os.path.join(directory, '*'))):
+        if is_recording(path) or os.path.splitext(path)[1] in video_extensions:
+            paths.append(path)
+    return paths
+
+
+def summarize_ms(costs_s: list[float]) -> dict[str, float]:
+    if len(costs_s) == 0:
+        return {}
+    costs_ms = np.float64(costs_s) * 1e3
+    summary = {'mean': costs_ms.mean(), 'max': costs_ms.max()}
+    for p in (50, 90, 99):
+        summary[f'p{p}'] = np.percentile(costs_ms, p)
+    return {name: round(float(value), 4) for name, value in summary.items()}
+
+
+def evaluate(video_path: str, robot_id: int, enemy_color: str, max_frames: int | None = None, use_cache: bool = False) -> dict:
+    '''评估一个录像, 没有状态时姿态为0, 按FPS生成时刻. use_cache时使用并更新检测结果缓存'''
+    config = importlib.import_module(f'configs.{robot_configs[robot_id]}')
+
+    armor_detector = ArmorDetector(enemy_color)
+    armor_solver = ArmorSolver(config.cameraMatrix, config.distCoeffs, config.R_camera2gimbal, config.t_camera2gimbal)
+    clock = RecordedClock()
+    tracker = Tracker(clock)
+
+    statuses = load_statuses(video_path)
+    if statuses is None:
+        logging.warning(f'No status for {video_path}, evaluate with zero attitude.')
+
+    # 缓存覆盖要评估的帧时跳过解码和检测, 否则检测并写入新的缓存
+    cache, new_cache = None, None
+    if use_cache:
+        key = cache_key(enemy_color, config.cameraMatrix, config.distCoeffs)
+        path = cache_path(video_path, key)
+        cache = DetectionCache.load(path, enemy_color, key)
+        if cache is not None and not cache.complete and (max_frames is None or max_frames > len(cache)):
+            cache = None
+        if cache is None:
+            new_cache = DetectionCache(enemy_color, key)
+
+    costs_s: dict[str, list[float]] = {stage: [] for stage in STAGES}
+    armor_counts: dict[str, int] = {}
+    frames_with_armor = 0
+    state_durations_s: dict[str, float] = {}
+    transitions = 0
+    aims: list[tuple] = []
+
+    count = 0
+    last_img_time_s: float = None
+    frames = prefetch(open_frames(video_path, (H, W, 3))) if cache is None else None
+    start_s = time.perf_counter()
+
+    while max_frames is None or count < max_frames:
+        if cache is not None and count == len(cache):
+            break
+
+        if statuses is None:
+            img_time_s, (yaw_degree, pitch_degree, bullet_speed, _) = count / FPS, (0.0, 0.0, 15.0, 3)
+        elif count < len(statuses[0]):
+            img_time_s, (yaw_degree, pitch_degree, bullet_speed, _) = statuses[0][count], statuses[1][count]
+        else:
+            break
+        clock.update(img_time_s)
+
+        if cache is None:
+            # 等待预取线程解码下一帧的时间
+            stage_start_s = time.perf_counter()
+            img = next(frames, None)
+            if img is None:
+                break
+            costs_s['decode'].append(time.perf_counter() - stage_start_s)
+
+            stage_start_s = time.perf_counter()
+            armors = list(armor_detector.detect(img))
+        else:
+            stage_start_s = time.perf_counter()
+            armors = cache.armors(count)
+        costs_s['detect'].append(time.perf_counter() - stage_start_s)
+
+        stage_start_s = time.perf_counter()
+        armors = list(armor_solver.solve(armors, yaw_degree, pitch_degree))
+        for armor in armors:
+            armor.in_imu_mm  # 解算是惰性的, 在这里计算以便计时
+        if new_cache is not None:
+            new_cache.add(armors)
+        armors = [a for a in armors if a.name not in config.whitelist]
+        costs_s['solve'].append(time.perf_counter() - stage_start_s)
+
+        if armors:
+            frames_with_armor += 1
+        for armor in armors:
+            armor_counts[armor.name] = armor_counts.get(armor.name, 0) + 1
+
+        last_state = tracker.state
+        stage_start_s = time.perf_counter()
+        if tracker.state == 'LOST':
+            tracker.init(armors, img_time_s)
+        else:
+            tracker.update(armors, img_time_s)
+        costs_s['track'].append(time.perf_counter() - stage_start_s)
+
+        if tracker.state != last_state:
+            transitions += 1
+        if last_img_time_s is not None:
+            state_durations_s[last_state] = state_durations_s.get(last_state, 0) + img_time_s - last_img_time_s
+        last_img_time_s = img_time_s
+
+        # 与发送进程相同的瞄准输出, 逐帧计算一次
+        if tracker.state in ('TRACKING', 'TEMP_LOST'):
+            stage_start_s = time.perf_counter()
+            tracking = Tracking(tracker.target, bullet_speed, config.gun_up_degree, config.gun_right_degree, None)
+            try:
+                (x, y, z, flag), fire_time_s = tracking.aim()
+                aims.append((img_time_s, x, y, z, flag == TX_FLAG_FIRE, fire_time_s))
+            except Exception as e:
+                logging.exception(e)
+            costs_s['aim'].append(time.perf_counter() - stage_start_s)
+
+        count += 1
+
+    cost_s = time.perf_counter() - start_s
+    if frames is not None:
+        frames.close()
+
+    if new_cache is not None and count > 0:
+        # 因max_frames停止时录像还有帧, 不算完整
+        new_cache.save(path, complete=max_frames is None or count < max_frames)
+        remove_stale(video_path, key)
+
+    return {
+        'recording': video_path,
+        'frames': count,
+        'cached': cache is not None,
+        'cost_s': round(cost_s, 4),
+        'fps': round(count / cost_s, 2) if cost_s > 0 else 0,
+        'stage_ms': {stage: summarize_ms(costs) for stage, costs in costs_s.items()},
+        'detections': {'frames_with_armor': frames_with_armor, 'armors': sum(armor_counts.values()), 'by_name': armor_counts},
+        'tracker': {'transitions': transitions, 'durations_s': {state: round(d, 4) for state, d in state_durations_s.items()}},
+        'aims': {
+            'fields': ('img_time_s', 'x_mm', 'y_mm', 'z_mm', 'fire_now', 'fire_time_s'),
+            'values': aims,
+        },
+    }
+
+
+def _init_worker() -> None:
+    # 每个进程单线程, 由进程池负责并行
+    cv2.setNumThreads(1)
+
+
+def _evaluate_to_file(args: tuple[str, int, str, str, int | None, bool]) -> dict:
+    video_path, robot_id, enemy_color, output_dir, max_frames, use_cache = args
+    result = evaluate(video_path, robot_id, enemy_color, max_frames, use_cache)
+
+    name = os.path.basename(os.path.normpath(video_path))
+    # 保留扩展名, 同名的a.avi与a.npy不会互相覆盖
+    output_path = os.path.join(output_dir, f'{name}.json')
+    with open(output_path, 'w') as f:
+        json.dump(result, f, indent=1)
+
+    result['output_path'] = output_path
+    return result
+
+
+def evaluate_all(
+    video_paths: list[str], robot_id: int, enemy_color: str, output_dir: str,
+    process_num: int | None = None, max_frames: int | None = None, use_cache: bool = False
+):
+    '''
+    用进程池并行评估多个录像, 每个录像的结果写入output_dir下的同名json.
+    按完成的顺序产生每个录像的结果.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(path, robot_id, enemy_color, output_dir, max_frames, use_cache) for path in video_paths]
+    with Pool(process_num, initializer=_init_worker) as pool:
+        yield from pool.imap_unordered(_evaluate_to_file, tasks)
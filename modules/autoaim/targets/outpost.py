@@ -1,10 +1,10 @@
-import time
 import numpy as np
-from math import sin, cos, tan, atan, pi, radians
+from math import sin, cos, atan, pi, radians
+from modules import ballistics
 from modules.ekf import ExtendedKalmanFilter, ColumnVector, Matrix
 from modules.tools import limit_rad
 from modules.autoaim.armor import Armor
-from modules.autoaim.targets.target import Target, z_yaw_subtract, get_z_xyz, get_z_yaw, get_trajectory_rad_and_s, R_xyz, adaptive_R_yaw
+from modules.autoaim.targets.target import Target, z_yaw_subtract, get_z_xyz, get_z_yaw, R_xyz, adaptive_R_yaw
 
 
 radius_m = 0.2765
@@ -77,6 +77,8 @@ def get_x0(z_xyz: ColumnVector, z_yaw: ColumnVector) -> ColumnVector:
 
 
 class Outpost(Target):
+    latency_s = 0.15  # 经验的写入串口之后的延迟
+
     def init(self, armor: Armor, img_time_s: float) -> None:
         z_xyz = get_z_xyz(armor)
         z_yaw = get_z_yaw(armor)
@@ -119,28 +121,28 @@ class Outpost(Target):
             center_x, _, center_z = center_in_imu_m.T[0]
             best_aim_yaw_rad = atan(center_x / center_z)
 
-            current_time_s = time.time()
+            current_time_s = self._clock.time()
             x = f(self._ekf.x, current_time_s - self._last_time_s)
             current_yaw_rad = x[3, 0]
 
             x[3, 0] = best_aim_yaw_rad
             aim_point_m = h_xyz(x)
-            _, fly_time_s = get_trajectory_rad_and_s(aim_point_m, bullet_speed_m_per_s)
-            fly_time_s += 0.15
+            _, (fly_time_s,) = ballistics.solve(aim_point_m, bullet_speed_m_per_s)
+            fly_time_s += self.latency_s
 
+            # 接下来依次转到最佳角度的装甲板所对应的时间窗口
             arrive_time_s = limit_rad(best_aim_yaw_rad - current_yaw_rad) / speed_rad_per_s
             rotate_to_next_time_s = 2 * pi / armor_num / abs(speed_rad_per_s)
+            arrive_times_s = arrive_time_s + np.arange(armor_num) * rotate_to_next_time_s
 
             fire_time_s = None
-            for _ in range(3):
-                if fly_time_s < arrive_time_s:
-                    fire_time_s = arrive_time_s - fly_time_s + current_time_s
-                    break
-                arrive_time_s += rotate_to_next_time_s
+            windows = np.flatnonzero(fly_time_s < arrive_times_s)
+            if windows.size > 0:
+                fire_time_s = arrive_times_s[windows[0]] - fly_time_s + current_time_s
 
         # 重力补偿
-        gun_pitch_rad, _ = get_trajectory_rad_and_s(aim_point_m, bullet_speed_m_per_s)
-        aim_point_m[1, 0] = -(aim_point_m[0, 0]**2 + aim_point_m[2, 0]**2)**0.5 * tan(gun_pitch_rad)
+        gun_pitch_rad, _ = ballistics.solve(aim_point_m, bullet_speed_m_per_s)
+        aim_point_m = ballistics.compensate(aim_point_m, gun_pitch_rad)
 
         return aim_point_m, fire_time_s
 
@@ -1,8 +1,8 @@
 import numpy as np
-from math import tan
+from modules import ballistics
 from modules.ekf import ExtendedKalmanFilter, ColumnVector, Matrix
 from modules.autoaim.armor import Armor
-from modules.autoaim.targets.target import Target, get_trajectory_rad_and_s
+from modules.autoaim.targets.target import Target
 
 
 max_match_m = 0.1
@@ -77,6 +77,8 @@ def get_x0(armor: Armor) -> ColumnVector:
 
 
 class Simple(Target):
+    latency_s = 0.05  # 经验的写入串口之后的延迟
+
     def init(self, armor: Armor, img_time_s: float) -> None:
         x0 = get_x0(armor)
         self._ekf = ExtendedKalmanFilter(f, jacobian_f, x0, P0, Q)
@@ -100,15 +102,15 @@ class Simple(Target):
         x_in_imu, _, y_in_imu, _, z_in_imu, _ = self._ekf.x.T[0]
         armor_in_imu = np.float64([[x_in_imu, y_in_imu, z_in_imu]]).T
 
-        _, fly_time_s = get_trajectory_rad_and_s(armor_in_imu, bullet_speed_m_per_s)
+        _, (fly_time_s,) = ballistics.solve(armor_in_imu, bullet_speed_m_per_s)
 
-        predicted_x = f(self._ekf.x, fly_time_s + 0.05)
+        predicted_x = f(self._ekf.x, fly_time_s + self.latency_s)
         x_in_imu, _, y_in_imu, _, z_in_imu, _ = predicted_x.T[0]
         aim_point_m = np.float64([[x_in_imu, y_in_imu, z_in_imu]]).T
 
         # 重力补偿
-        gun_pitch_rad, _ = get_trajectory_rad_and_s(aim_point_m, bullet_speed_m_per_s)
-        aim_point_m[1, 0] = -(aim_point_m[0, 0]**2 + aim_point_m[2, 0]**2)**0.5 * tan(gun_pitch_rad)
+        gun_pitch_rad, _ = ballistics.solve(aim_point_m, bullet_speed_m_per_s)
+        aim_point_m = ballistics.compensate(aim_point_m, gun_pitch_rad)
 
         return aim_point_m, 0.0
 
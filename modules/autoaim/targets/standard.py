@@ -1,10 +1,10 @@
-import time
 import numpy as np
-from math import sin, cos, tan, atan, pi, radians
+from math import sin, cos, atan, pi, radians
+from modules import ballistics
 from modules.ekf import ExtendedKalmanFilter, ColumnVector, Matrix
 from modules.tools import limit_rad
 from modules.autoaim.armor import Armor
-from modules.autoaim.targets.target import Target, z_yaw_subtract, get_z_xyz, get_z_yaw, get_trajectory_rad_and_s, R_xyz, adaptive_R_yaw
+from modules.autoaim.targets.target import Target, z_yaw_subtract, get_z_xyz, get_z_yaw, R_xyz, adaptive_R_yaw
 
 
 armor_num = 4
@@ -94,6 +94,8 @@ def get_x0(z_xyz: ColumnVector, z_yaw: ColumnVector, r_m: float) -> ColumnVector
 
 
 class Standard(Target):
+    latency_s = 0.1  # 经验的写入串口之后的延迟
+
     def init(self, armor: Armor, img_time_s: float) -> None:
         z_xyz = get_z_xyz(armor)
         z_yaw = get_z_yaw(armor)
@@ -128,15 +130,15 @@ class Standard(Target):
         return False
 
     def aim(self, bullet_speed_m_per_s: float) -> tuple[ColumnVector, float | None]:
-        current_time_s = time.time()
+        current_time_s = self._clock.time()
         current_state = f(self._ekf.x, current_time_s - self._last_time_s)
         current_yaw_rad = current_state[4, 0]
 
         # 近似估计子弹射出后目标的状态
         center_x, center_y1, center_y2, center_z = current_state[:4].T[0]
         center_m = np.float64([[center_x, min(center_y1, center_y2), center_z]]).T
-        _, fly_to_center_s = get_trajectory_rad_and_s(center_m, bullet_speed_m_per_s)
-        predicted_state = f(current_state, fly_to_center_s + 0.1)
+        _, (fly_to_center_s,) = ballistics.solve(center_m, bullet_speed_m_per_s)
+        predicted_state = f(current_state, fly_to_center_s + self.latency_s)
 
         speed_rad_per_s = predicted_state[-1, 0]
         predicted_yaw_rad = predicted_state[4, 0]
@@ -145,29 +147,43 @@ class Standard(Target):
         # 直接瞄准当前装甲板
         if abs(speed_rad_per_s) < min_anittop_rad_per_s:
             aim_point_m = h_xyz(predicted_state, self._use_r1_r2)
+            gun_pitch_rad, _ = ballistics.solve(aim_point_m, bullet_speed_m_per_s)
 
             if abs(limit_rad(predicted_yaw_rad - best_aim_yaw_rad)) < max_aim_yaw_rad:
                 fire_time_s = 0.0  # 立即射击
             else:
                 fire_time_s = None
 
-        # 反小陀螺
+        # 反小陀螺, 所有装甲板转到最佳角度时的弹道一起计算, 选择最早可以射击的装甲板
         else:
-            if abs(limit_rad(predicted_yaw_rad - best_aim_yaw_rad)) > max_aim_yaw_rad:
-                predicted_state[4, 0] = best_aim_yaw_rad
-            aim_point_m = h_xyz(predicted_state, self._use_r1_r2)
-            _, fly_to_armor_s = get_trajectory_rad_and_s(aim_point_m, bullet_speed_m_per_s)
-            fly_to_armor_s += 0
-
-            arrive_time_s = limit_rad(best_aim_yaw_rad - current_yaw_rad) / speed_rad_per_s
+            x = predicted_state.copy()
+            x[4, 0] = best_aim_yaw_rad
+            use_r1_r2 = self._use_r1_r2
+            candidates_m: list[ColumnVector] = []
+            for _ in range(armor_num):
+                candidates_m.append(h_xyz(x, use_r1_r2))
+                use_r1_r2 = not use_r1_r2
+            candidates_m = np.hstack(candidates_m)
+            candidates_pitch_rad, fly_to_armor_s = ballistics.solve(candidates_m, bullet_speed_m_per_s)
+
+            # 各装甲板沿旋转方向转到最佳角度所需的时间
+            armor_yaws_rad = current_yaw_rad + np.arange(armor_num) * 2 * pi / armor_num
+            rotate_rad = np.mod((best_aim_yaw_rad - armor_yaws_rad) * np.sign(speed_rad_per_s), 2 * pi)
+            arrive_time_s = rotate_rad / abs(speed_rad_per_s)
+
+            wait_time_s = arrive_time_s - fly_to_armor_s
+            wait_time_s[~(wait_time_s > 0)] = np.inf
+            best_index = np.argmin(wait_time_s)
+
+            aim_point_m = candidates_m[:, [best_index]]
+            gun_pitch_rad = candidates_pitch_rad[[best_index]]
 
             fire_time_s = None
-            if fly_to_armor_s < arrive_time_s:
-                fire_time_s = arrive_time_s - fly_to_armor_s + current_time_s
+            if np.isfinite(wait_time_s[best_index]):
+                fire_time_s = wait_time_s[best_index] + current_time_s
 
         # 重力补偿
-        gun_pitch_rad, _ = get_trajectory_rad_and_s(aim_point_m, bullet_speed_m_per_s)
-        aim_point_m[1, 0] = -(aim_point_m[0, 0]**2 + aim_point_m[2, 0]**2)**0.5 * tan(gun_pitch_rad)
+        aim_point_m = ballistics.compensate(aim_point_m, gun_pitch_rad)
 
         return aim_point_m, fire_time_s
 
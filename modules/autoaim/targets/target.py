@@ -1,8 +1,9 @@
 import numpy as np
-from math import sin, cos, atan, sqrt, radians
+from math import radians
 from modules.ekf import ExtendedKalmanFilter, ColumnVector
 from modules.autoaim.armor import Armor
 from modules.tools import limit_rad
+from modules.clock import Clock, real_clock
 
 
 R_xyz = np.diag([8e-2, 8e-2, 8e-2])
@@ -32,31 +33,12 @@ def get_z_yaw(armor: Armor) -> ColumnVector:
     return z_yaw
 
 
-def get_trajectory_rad_and_s(position_m: ColumnVector, bullet_speed_m_per_s: float) -> tuple[float, float]:
-    x, y, z = position_m.T[0]
-
-    g = 9.794
-    distance_m = (x**2 + z**2)**0.5
-
-    a = 0.5 * g * distance_m**2 / bullet_speed_m_per_s**2
-    b = -distance_m
-    c = a - y
-    result1 = (-b + sqrt(b**2-4*a*c))/(2*a)
-    result2 = (-b - sqrt(b**2-4*a*c))/(2*a)
-
-    pitch1 = atan(result1)
-    pitch2 = atan(result2)
-    t1 = distance_m / (bullet_speed_m_per_s * cos(pitch1))
-    t2 = distance_m / (bullet_speed_m_per_s * cos(pitch2))
-
-    pitch_rad = pitch1 if t1 < t2 else pitch2
-    fly_time_s = t1 if t1 < t2 else t2
-
-    return pitch_rad, fly_time_s
-
-
 class Target:
-    def __init__(self) -> None:
+    latency_s = 0.0  # 写入串口之后的延迟(下位机, 云台, 发射), 写入之前的部分aim已外推到当前时刻, 子类按经验设定
+
+    def __init__(self, clock: Clock = real_clock) -> None:
+        '''clock: aim外推到当前时刻所用的时钟'''
+        self._clock = clock
         self._last_time_s: float = None
         self._ekf: ExtendedKalmanFilter = None
 
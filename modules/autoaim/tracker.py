@@ -1,4 +1,5 @@
 from collections.abc import Iterable
+from modules.clock import Clock, real_clock
 from modules.autoaim.armor import Armor
 from modules.autoaim.targets.target import Target
 from modules.autoaim.targets.standard import Standard
@@ -11,7 +12,8 @@ min_detect_count = 3
 
 
 class Tracker:
-    def __init__(self) -> None:
+    def __init__(self, clock: Clock = real_clock) -> None:
+        self._clock = clock
         self.target: Target = None
         self.state = 'LOST'
 
@@ -26,10 +28,10 @@ class Tracker:
         armor = armors[0]
 
         # if armor.name == 'small_outpost':
-        #     self.target = Outpost()
+        #     self.target = Outpost(self._clock)
         # else:
-        #     self.target = Simple()
-        self.target = Simple()
+        #     self.target = Simple(self._clock)
+        self.target = Simple(self._clock)
 
         self.target.init(armor, img_time_s)
 
@@ -28,6 +28,10 @@ class LazyPNP:
         self._points_2d = points_2d
         self._points_3d = points_3d
 
+    def restore_pnp(self, rvecs: tuple[np.ndarray, ...], tvecs: tuple[np.ndarray, ...], errors: np.ndarray) -> None:
+        '''使用之前solvePnPGeneric的结果, 例如检测缓存中的位姿, 之后不再重新求解'''
+        self._rvecs, self._tvecs, self._errors = rvecs, tvecs, errors
+
     @property
     def rvecs(self) -> np.ndarray:
         if self._rvecs is None:
@@ -40,6 +44,12 @@ class LazyPNP:
             self._solve_pnp()
         return self._tvecs
 
+    @property
+    def errors(self) -> np.ndarray:
+        if self._errors is None:
+            self._solve_pnp()
+        return self._errors
+
     @property
     def rvec(self) -> np.ndarray:
         if self._rvecs is None:
@@ -0,0 +1,251 @@
+import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+
+g = 9.794  # 重力加速度 m/s^2
+
+# 空气阻力系数与弹丸质量之比 k/m (1/m), k = 0.5 * c * rho_air * A
+k_over_m_big = 0.00022802630547843214 / 0.041  # 老的大弹丸
+k_over_m_small = 6.0896287678629725e-05 / 0.0032  # 发光小弹丸
+
+dt_s = 40e-3  # RK4积分步长, 弹道的时间尺度远大于该步长, 步内用三次Hermite插值求到达目标距离的时刻, 步长大也不损失精度
+max_fly_time_s = 3.0  # 超过该时间仍未到达目标距离则认为打不到
+bracket_min_rad = np.radians(-2)  # 阻力弹道相对重力弹道pitch的搜索下界
+bracket_max_rad = np.radians(10)  # 阻力弹道相对重力弹道pitch的搜索上界
+bracket_num = 10  # 搜索的候选pitch数量, 所有候选只积分一次
+
+
+def gravity_trajectory(distance_m: ArrayLike, y_m: ArrayLike, bullet_speed_m_per_s: ArrayLike) -> tuple[NDArray, NDArray]:
+    '''
+    只考虑重力的抛物线弹道, 支持数组广播.
+    distance_m: 水平距离(m);
+    y_m: 目标高度(m), 与imu坐标系一致, 向下为正;
+    bullet_speed_m_per_s: 弹速(m/s);
+    return: 枪管pitch(rad, 向上为正), 飞行时间(s). 打不到的位置为nan.
+    '''
+    d = np.asarray(distance_m, dtype=np.float64)
+    y = np.asarray(y_m, dtype=np.float64)
+    v = np.asarray(bullet_speed_m_per_s, dtype=np.float64)
+
+    # tan(pitch)满足 a*r^2 - d*r + (a - y) = 0, 取飞行时间较短的小根
+    a = 0.5 * g * d**2 / v**2
+    c = a - y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sqrt_delta = np.sqrt(d**2 - 4*a*c)
+        pitch_rad = np.arctan(2*c / (d + sqrt_delta))
+        fly_time_s = d / (v * np.cos(pitch_rad))
+
+    return pitch_rad, fly_time_s
+
+
+def integrate_drag(
+    pitch_rad: ArrayLike, distance_m: ArrayLike, bullet_speed_m_per_s: ArrayLike, k_over_m: ArrayLike,
+    step_s: float | None = None, max_time_s: float = max_fly_time_s
+) -> tuple[NDArray, NDArray]:
+    '''
+    定步长RK4同时积分多条弹道, 并在越过目标水平距离的一步内用三次Hermite插值求得到达时的高度和时间.
+    pitch_rad: 发射pitch(rad, 向上为正);
+    distance_m: 目标水平距离(m);
+    return: 到达目标距离时的y(m, 向下为正), 飞行时间(s). 到达不了的为nan.
+    '''
+    pitch_rad, distance_m, v0, k = np.broadcast_arrays(
+        *(np.asarray(a, dtype=np.float64) for a in (pitch_rad, distance_m, bullet_speed_m_per_s, k_over_m))
+    )
+    shape = pitch_rad.shape
+    distance_m = distance_m.ravel()
+    k = k.ravel()
+
+    # 状态: 水平距离x, 高度z(向上为正), 以及对应速度
+    x = np.zeros(distance_m.size)
+    z = np.zeros(distance_m.size)
+    with np.errstate(invalid='ignore'):
+        vx = (v0 * np.cos(pitch_rad)).ravel()
+        vz = (v0 * np.sin(pitch_rad)).ravel()
+
+    hit_y_m = np.full(distance_m.size, np.nan)
+    hit_time_s = np.full(distance_m.size, np.nan)
+    # 距离为0时不用飞行, pitch非有限或距离为负时到达不了, 保持nan
+    finite = np.isfinite(vx) & np.isfinite(vz)
+    flying = (distance_m > 0) & finite
+    arrived = (distance_m == 0) & finite
+    hit_y_m[arrived] = 0
+    hit_time_s[arrived] = 0
+
+    # 已到达的弹道不再积分
+    lanes = np.flatnonzero(flying)
+    x, z, vx, vz, distance_m, k = x[lanes], z[lanes], vx[lanes], vz[lanes], distance_m[lanes], k[lanes]
+
+    h = dt_s if step_s is None else step_s
+    t = 0.0
+    while lanes.size > 0 and t < max_time_s:
+        # 阻力加速度为 -k*|v|*v, 重力只作用于z
+        drag1 = -k * np.hypot(vx, vz)
+        ax1, az1 = drag1 * vx, drag1 * vz - g
+        vx2, vz2 = vx + 0.5*h*ax1, vz + 0.5*h*az1
+        drag2 = -k * np.hypot(vx2, vz2)
+        ax2, az2 = drag2 * vx2, drag2 * vz2 - g
+        vx3, vz3 = vx + 0.5*h*ax2, vz + 0.5*h*az2
+        drag3 = -k * np.hypot(vx3, vz3)
+        ax3, az3 = drag3 * vx3, drag3 * vz3 - g
+        vx4, vz4 = vx + h*ax3, vz + h*az3
+        drag4 = -k * np.hypot(vx4, vz4)
+        ax4, az4 = drag4 * vx4, drag4 * vz4 - g
+
+        new_x = x + h/6 * (vx + 2*vx2 + 2*vx3 + vx4)
+        new_z = z + h/6 * (vz + 2*vz2 + 2*vz3 + vz4)
+        new_vx = vx + h/6 * (ax1 + 2*ax2 + 2*ax3 + ax4)
+        new_vz = vz + h/6 * (az1 + 2*az2 + 2*az3 + az4)
+
+        crossed = new_x >= distance_m
+        if crossed.any():
+            c = crossed
+            u = _hermite_root(x[c], vx[c], new_x[c], new_vx[c], h, distance_m[c])
+            z_at = _hermite(z[c], vz[c], new_z[c], new_vz[c], h, u)
+            hit_y_m[lanes[c]] = -z_at
+            hit_time_s[lanes[c]] = t + u * h
+
+            keep = ~crossed
+            lanes, distance_m, k = lanes[keep], distance_m[keep], k[keep]
+            new_x, new_z, new_vx, new_vz = new_x[keep], new_z[keep], new_vx[keep], new_vz[keep]
+
+        x, z, vx, vz = new_x, new_z, new_vx, new_vz
+        t += h
+
+    return hit_y_m.reshape(shape), hit_time_s.reshape(shape)
+
+
+def _hermite(p0: NDArray, v0: NDArray, p1: NDArray, v1: NDArray, h: float, u: NDArray) -> NDArray:
+    '''步内三次Hermite插值, u为步内比例[0, 1]'''
+    u2, u3 = u * u, u * u * u
+    return (2*u3 - 3*u2 + 1) * p0 + (u3 - 2*u2 + u) * h * v0 + (-2*u3 + 3*u2) * p1 + (u3 - u2) * h * v1
+
+
+def _hermite_root(p0: NDArray, v0: NDArray, p1: NDArray, v1: NDArray, h: float, target: NDArray) -> NDArray:
+    '''Hermite曲线到达target时的步内比例, 以线性插值为初值做两次牛顿迭代, 水平速度恒为正, 曲线单调'''
+    u = np.clip((target - p0) / (p1 - p0), 0, 1)
+    for _ in range(2):
+        u2 = u * u
+        derivative = (6*u2 - 6*u) * p0 + (3*u2 - 4*u + 1) * h * v0 + (-6*u2 + 6*u) * p1 + (3*u2 - 2*u) * h * v1
+        u = np.clip(u - (_hermite(p0, v0, p1, v1, h, u) - target) / derivative, 0, 1)
+    return u
+
+
+def drag_trajectory(
+    distance_m: ArrayLike, y_m: ArrayLike, bullet_speed_m_per_s: ArrayLike, k_over_m: ArrayLike
+) -> tuple[NDArray, NDArray]:
+    '''
+    考虑空气阻力的弹道, 以重力弹道为初值, 在其附近的bracket_num个候选pitch中找到越过目标的区间.
+    所有目标的所有候选只一起积分一次, 再以落点误差为自变量, 对区间两端及相邻共4个候选做三次逆插值求pitch与飞行时间.
+    搜索区间内无解时退回重力弹道.
+    return: 枪管pitch(rad, 向上为正), 飞行时间(s). 重力弹道也打不到的位置为nan.
+    '''
+    distance_m, y_m, v, k = np.broadcast_arrays(
+        *(np.asarray(a, dtype=np.float64) for a in (distance_m, y_m, bullet_speed_m_per_s, k_over_m))
+    )
+    shape = distance_m.shape
+    distance_m, y_m, v, k = (a.ravel()[:, np.newaxis] for a in (distance_m, y_m, v, k))
+
+    gravity_pitch_rad, gravity_time_s = gravity_trajectory(distance_m, y_m, v)
+
+    # 阻力只会缩短射程, 重力弹道打不到的目标不必积分
+    reachable = np.flatnonzero(np.isfinite(gravity_pitch_rad))
+    pitch_rad, fly_time_s = gravity_pitch_rad.ravel().copy(), gravity_time_s.ravel().copy()
+    if reachable.size > 0:
+        pitch_rad[reachable], fly_time_s[reachable] = _solve_drag(
+            distance_m[reachable], y_m[reachable], v[reachable], k[reachable], gravity_pitch_rad[reachable], gravity_time_s[reachable]
+        )
+
+    return pitch_rad.reshape(shape), fly_time_s.reshape(shape)
+
+
+def _solve_drag(
+    distance_m: NDArray, y_m: NDArray, v: NDArray, k: NDArray, gravity_pitch_rad: NDArray, gravity_time_s: NDArray
+) -> tuple[NDArray, NDArray]:
+    '''drag_trajectory的求解部分, 参数均为shape=(N, 1), 返回shape=(N,), 无解时为重力弹道'''
+    candidates_rad = gravity_pitch_rad + np.linspace(bracket_min_rad, bracket_max_rad, bracket_num)
+    hit_y_m, hit_time_s = integrate_drag(candidates_rad, distance_m, v, k)
+
+    # pitch增大时落点y减小, 找到第一个越过目标的区间
+    error_m = hit_y_m - y_m
+    crossing = (error_m[:, :-1] >= 0) & (error_m[:, 1:] < 0)
+    found = crossing.any(axis=1, keepdims=True)
+    index = np.argmax(crossing, axis=1)[:, np.newaxis]
+
+    # 区间内线性插值
+    low_error_m = np.take_along_axis(error_m, index, axis=1)
+    high_error_m = np.take_along_axis(error_m, index + 1, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = low_error_m / (low_error_m - high_error_m)
+    low_rad, high_rad = np.take_along_axis(candidates_rad, index, axis=1), np.take_along_axis(candidates_rad, index + 1, axis=1)
+    low_time_s, high_time_s = np.take_along_axis(hit_time_s, index, axis=1), np.take_along_axis(hit_time_s, index + 1, axis=1)
+    pitch_rad = low_rad + ratio * (high_rad - low_rad)
+    fly_time_s = low_time_s + ratio * (high_time_s - low_time_s)
+
+    # 三次逆插值: 以误差为自变量的Lagrange插值在误差为0处的值, 相邻候选打不到(nan)时保留线性插值
+    if bracket_num >= 4:
+        columns = np.clip(index - 1, 0, bracket_num - 4) + np.arange(4)
+        errors_m = np.take_along_axis(error_m, columns, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weights = np.ones(errors_m.shape)
+            for j in range(4):
+                for m in range(4):
+                    if m != j:
+                        weights[:, j] *= -errors_m[:, m] / (errors_m[:, j] - errors_m[:, m])
+            cubic_rad = np.sum(weights * np.take_along_axis(candidates_rad, columns, axis=1), axis=1, keepdims=True)
+            cubic_time_s = np.sum(weights * np.take_along_axis(hit_time_s, columns, axis=1), axis=1, keepdims=True)
+        valid = np.isfinite(cubic_rad) & np.isfinite(cubic_time_s)
+        pitch_rad = np.where(valid, cubic_rad, pitch_rad)
+        fly_time_s = np.where(valid, cubic_time_s, fly_time_s)
+
+    # 与原先的trajectoryAdjust一致, 阻力弹道求解失败时使用重力弹道
+    pitch_rad = np.where(found, pitch_rad, gravity_pitch_rad)
+    fly_time_s = np.where(found, fly_time_s, gravity_time_s)
+
+    return pitch_rad.ravel(), fly_time_s.ravel()
+
+
+def trajectory(
+    distance_m: ArrayLike, y_m: ArrayLike, bullet_speed_m_per_s: ArrayLike, k_over_m: ArrayLike = 0.0
+) -> tuple[NDArray, NDArray]:
+    '''
+    统一弹道接口, k_over_m为0时使用重力弹道解析解, 否则使用阻力弹道数值解.
+    return: 枪管pitch(rad, 向上为正), 飞行时间(s). 打不到的位置为nan.
+    '''
+    if np.all(np.asarray(k_over_m) == 0):
+        return gravity_trajectory(distance_m, y_m, bullet_speed_m_per_s)
+    return drag_trajectory(distance_m, y_m, bullet_speed_m_per_s, k_over_m)
+
+
+def solve(points_m: ArrayLike, bullet_speed_m_per_s: ArrayLike, k_over_m: ArrayLike = 0.0) -> tuple[NDArray, NDArray]:
+    '''
+    批量求解多个目标点的弹道.
+    points_m: 目标点在imu坐标系下的坐标(m), shape=(3, N), 单个点可直接传入列向量;
+    bullet_speed_m_per_s: 弹速(m/s), 标量或shape=(N,);
+    return: 枪管pitch(rad, 向上为正), 飞行时间(s), shape均为(N,). 打不到的位置为nan.
+    '''
+    x, y, z = np.asarray(points_m, dtype=np.float64).reshape(3, -1)
+    distance_m = np.hypot(x, z)
+    return trajectory(distance_m, y, bullet_speed_m_per_s, k_over_m)
+
+
+def compensate(points_m: ArrayLike, pitch_rad: ArrayLike) -> NDArray:
+    '''
+    弹道补偿, 将目标点抬高到枪管pitch所指的位置.
+    points_m: shape=(3, N), 单位任意;
+    pitch_rad: solve所求得的枪管pitch, shape=(N,);
+    return: 补偿后的目标点, 与points_m形状和单位相同.
+    打不到(pitch为nan)时抛出ValueError, 调用前可以用np.isnan检查以跳过这次射击.
+    '''
+    pitch_rad = np.asarray(pitch_rad, dtype=np.float64).ravel()
+    if np.isnan(pitch_rad).any():
+        raise ValueError('target out of range')
+
+    points = np.array(points_m, dtype=np.float64)
+    x, _, z = points.reshape(3, -1)
+    points.reshape(3, -1)[1] = -np.hypot(x, z) * np.tan(pitch_rad)
+    return points
+
+
+def k_over_m_of(robot_id: int) -> float:
+    '''英雄发射大弹丸, 其余发射小弹丸'''
+    return k_over_m_big if robot_id == 1 else k_over_m_small
@@ -0,0 +1,109 @@
+import time
+import ctypes
+from multiprocessing import RawValue
+
+
+'''
+可替换的时钟. 需要当前时刻的模块(目标外推, 发送调度, 能量机关测速, 录像, 可视化)都通过Clock取时间,
+在线运行时使用真实时钟, 离线评估时使用跟随录像时间戳的时钟, 结果与实时性无关且可以复现.
+time()与img_time_s(time.time())为同一时间轴, monotonic()只用于计算间隔和定时.
+'''
+
+
+class Clock:
+    def time(self) -> float:
+        raise NotImplementedError('该函数需子类实现')
+
+    def monotonic(self) -> float:
+        raise NotImplementedError('该函数需子类实现')
+
+    def sleep(self, duration_s: float) -> None:
+        raise NotImplementedError('该函数需子类实现')
+
+
+class RealClock(Clock):
+    '''
+    真实时钟. time()即time.time(), 与相机, 串口和日志的时间戳为同一时钟, 系统校时后仍可以直接相减;
+    monotonic()即time.monotonic(), 只用于计算间隔和定时.
+    '''
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, duration_s: float) -> None:
+        time.sleep(duration_s)
+
+
+class SimulatedClock(Clock):
+    '''手动推进的时钟, time()与monotonic()相同, sleep立即返回并推进时间'''
+
+    def __init__(self, start_s: float = 0.0) -> None:
+        self._now_s = start_s
+
+    def time(self) -> float:
+        return self._now_s
+
+    def monotonic(self) -> float:
+        return self._now_s
+
+    def sleep(self, duration_s: float) -> None:
+        self.advance(duration_s)
+
+    def advance(self, duration_s: float) -> None:
+        self._now_s += max(duration_s, 0.0)
+
+    def set(self, time_s: float) -> None:
+        '''不会倒退'''
+        self._now_s = max(self._now_s, time_s)
+
+
+class RecordedClock(SimulatedClock):
+    '''
+    跟随录像时间戳的时钟, 每帧调用update, 当前时刻为该帧的img_time_s加上latency_s.
+    latency_s: 取图到使用当前时刻(例如瞄准)之间的处理延迟.
+    '''
+
+    def __init__(self, latency_s: float = 0.0) -> None:
+        super().__init__(start_s=-float('inf'))
+        self.latency_s = latency_s
+
+    def update(self, img_time_s: float) -> None:
+        self.set(img_time_s + self.latency_s)
+
+
+class SharedRecordedClock(RecordedClock):
+    '''
+    跨进程的RecordedClock, 用于尽可能快的离线回放: 主进程每帧调用update, 发送进程等子进程看到同一时刻.
+    时刻存放在共享内存中, 经管道传递(例如随目标交给发送进程)时只传编号, 因此子进程必须在创建时钟之后fork.
+    只有主进程推进时间.
+    '''
+
+    def __init__(self, latency_s: float = 0.0) -> None:
+        self._shared_now_s = RawValue(ctypes.c_double)
+        self._key = len(_shared_clocks)
+        _shared_clocks.append(self)
+        super().__init__(latency_s)
+
+    @property
+    def _now_s(self) -> float:
+        return self._shared_now_s.value
+
+    @_now_s.setter
+    def _now_s(self, time_s: float) -> None:
+        self._shared_now_s.value = time_s
+
+    def __reduce__(self) -> tuple:
+        return _shared_clock, (self._key,)
+
+
+_shared_clocks: list[SharedRecordedClock] = []  # fork时由子进程继承
+
+
+def _shared_clock(key: int) -> SharedRecordedClock:
+    return _shared_clocks[key]
+
+
+real_clock = RealClock()
@@ -0,0 +1,181 @@
+import numpy as np
+from modules.io.communication import Status
+
+
+'''
+下位机姿态历史: NumPy环形缓冲区, 按时间查询任意时刻(可批量)的yaw, pitch.
+缓冲区长度为容量的两倍, 每个样本同时写在i和i+capacity处, 最近的样本总是一段连续内存,
+因此查询直接在其上二分(searchsorted), 耗时为O(log n), 与历史长度无关.
+yaw, pitch按相邻样本的最短角度差展开为连续值后存储, 跨越±180度时插值不会出错.
+'''
+
+sample_dtype = np.dtype([
+    ('time_s', np.float64),
+    ('yaw_degree', np.float64),  # AttitudeHistory中为展开后的连续值
+    ('pitch_degree', np.float64),
+    ('bullet_speed', np.float64),
+    ('flag', np.int64),
+    ('stamp', np.int64),
+    ('arrival_time_s', np.float64),  # 主机收到的时刻, time_s为时钟同步校正后的时刻
+])
+
+METHODS = ('linear', 'cubic')
+
+max_extrapolation_s = 20e-3  # 查询时刻晚于最新样本时, 最多按最后的角速度外推这么久
+velocity_window_s = 5e-3  # 外推所用的角速度由最近这段时间内的样本最小二乘拟合, 1kHz时约6个样本
+
+
+def limit_degree(angle_degree: float | np.ndarray) -> float | np.ndarray:
+    '''(-180,180]'''
+    return 180 - (180 - angle_degree) % 360
+
+
+class AttitudeHistory:
+    def __init__(self, capacity: int = 4096) -> None:
+        self._capacity = capacity
+        self._samples = np.zeros(2 * capacity, dtype=sample_dtype)
+        self._count = 0  # 已写入的样本总数
+
+        self.rejected_count = 0  # 时间早于最新样本而被丢弃的样本数
+
+    def __len__(self) -> int:
+        return min(self._count, self._capacity)
+
+    @property
+    def latest_time_s(self) -> float | None:
+        if self._count == 0:
+            return None
+        return float(self._samples[(self._count - 1) % self._capacity]['time_s'])
+
+    def append(self, time_s: float, status: Status) -> None:
+        self.extend([(time_s, status)])
+
+    def extend(self, samples: list[tuple[float, Status]]) -> None:
+        '''samples: 按到达顺序排列的(到达时刻, 状态)'''
+        if len(samples) == 0:
+            return
+
+        records = np.array(
+            [(time_s, yaw, pitch, bullet_speed, flag, stamp, time_s) for time_s, (stamp, yaw, pitch, bullet_speed, flag) in samples],
+            dtype=sample_dtype
+        )
+        self.extend_records(records)
+
+    def extend_records(self, records: np.ndarray) -> None:
+        '''records: sample_dtype数组, 角度为原始值, 会被修改'''
+        if len(records) == 0:
+            return
+
+        # 串口重新打开等情况下时间可能倒退, 这些样本无法插入有序的历史, 丢弃
+        last_time_s = self.latest_time_s
+        running_max_s = np.maximum.accumulate(records['time_s'])
+        ordered = records['time_s'] >= running_max_s
+        if last_time_s is not None:
+            ordered &= records['time_s'] >= last_time_s
+        self.rejected_count += int(np.count_nonzero(~ordered))
+        records = records[ordered][-self._capacity:]
+        if len(records) == 0:
+            return
+
+        # 以上一个样本为起点展开角度
+        for field in ('yaw_degree', 'pitch_degree'):
+            raw = records[field]
+            if self._count > 0:
+                last = self._samples[(self._count - 1) % self._capacity][field]
+            else:
+                last = raw[0]
+            steps = limit_degree(np.diff(raw, prepend=limit_degree(last)))
+            records[field] = last + np.cumsum(steps)
+
+        indices = (self._count + np.arange(len(records))) % self._capacity
+        self._samples[indices] = records
+        self._samples[indices + self._capacity] = records
+        self._count += len(records)
+
+    def view(self) -> np.ndarray:
+        '''按时间排列的全部样本, 不复制, 只读'''
+        start = (self._count - len(self)) % self._capacity
+        samples = self._samples[start:start + len(self)]
+        samples.flags.writeable = False
+        return samples
+
+    def after(self, time_s: float) -> np.ndarray:
+        '''到达时刻晚于time_s的样本'''
+        samples = self.view()
+        return samples[np.searchsorted(samples['time_s'], time_s, side='right'):]
+
+    def yaw_pitch_degree_at(
+        self, times_s: float | np.ndarray, method: str = 'linear', max_extrapolation_s: float = max_extrapolation_s
+    ) -> tuple[float, float] | tuple[np.ndarray, np.ndarray]:
+        '''
+        times_s: 查询时刻, 可以是数组;
+        method: 'linear'线性插值, 'cubic'三次Hermite插值(斜率由相邻样本差分得到), 角速度变化快时更准确;
+        早于最早样本时返回最早样本, 晚于最新样本时按最近velocity_window_s内样本拟合的角速度外推,
+        外推时长不超过max_extrapolation_s. 只用最后两个样本时, 1ms间隔上0.01度的量化就会带来10度/秒的速度误差.
+        '''
+        if method not in METHODS:
+            raise ValueError(f'Unknown interpolation method {method}')
+
+        samples = self.view()
+        if len(samples) == 0:
+            raise ValueError('Attitude history is empty')
+
+        query_s = np.asarray(times_s, dtype=np.float64)
+        times = samples['time_s']
+        extrapolating = len(samples) > 1 and np.any(query_s > times[-1])
+        if extrapolating:
+            # 窗口内至少两个样本
+            start = min(np.searchsorted(times, times[-1] - velocity_window_s), len(times) - 2)
+            window_s = times[start:] - times[-1]
+        result = []
+        for field in ('yaw_degree', 'pitch_degree'):
+            values = samples[field]
+            if len(samples) == 1:
+                angle = np.full(query_s.shape, values[0])
+            elif method == 'linear':
+                angle = np.interp(query_s, times, values)
+            else:
+                angle = _hermite(times, values, query_s)
+
+            # 外推
+            if extrapolating:
+                velocity = _fit_slope(window_s, values[start:])
+                ahead_s = np.clip(query_s - times[-1], 0, max_extrapolation_s)
+                angle = np.where(query_s > times[-1], values[-1] + velocity * ahead_s, angle)
+
+            result.append(limit_degree(angle))
+
+        yaw_degree, pitch_degree = result
+        if yaw_degree.ndim == 0:
+            return float(yaw_degree), float(pitch_degree)
+        return yaw_degree, pitch_degree
+
+
+def _fit_slope(times: np.ndarray, values: np.ndarray) -> float:
+    '''最小二乘直线的斜率, 时刻全部相同时为0'''
+    centered = times - times.mean()
+    variance = np.sum(centered * centered)
+    if variance == 0:
+        return 0.0
+    return float(np.sum(centered * (values - values.mean())) / variance)
+
+
+def _hermite(times: np.ndarray, values: np.ndarray, query_s: np.ndarray) -> np.ndarray:
+    '''只用查询点两侧各两个样本, 超出范围时取端点值'''
+    n = len(times)
+    i = np.clip(np.searchsorted(times, query_s, side='right') - 1, 0, n - 2)
+
+    def slope(j: np.ndarray) -> np.ndarray:
+        a, b = np.maximum(j - 1, 0), np.minimum(j + 1, n - 1)
+        dt = times[b] - times[a]
+        return np.divide(values[b] - values[a], dt, out=np.zeros_like(dt), where=dt > 0)
+
+    t0, t1 = times[i], times[i + 1]
+    h = t1 - t0
+    u = np.clip(np.divide(query_s - t0, h, out=np.zeros_like(h), where=h > 0), 0, 1)
+    u2, u3 = u * u, u * u * u
+
+    return (
+        (2*u3 - 3*u2 + 1) * values[i] + (u3 - 2*u2 + u) * h * slope(i)
+        + (-2*u3 + 3*u2) * values[i + 1] + (u3 - u2) * h * slope(i + 1)
+    )
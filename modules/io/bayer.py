@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+
+'''
+原始Bayer图像, 单通道, 大小为BGR图像的1/3.
+pattern为左上角2x2像素的排列, 例如'RG'表示第一行为R G, 第二行为G B.
+'''
+
+PATTERNS = ('RG', 'BG', 'GR', 'GB')
+
+# 2x2块中R, B以及两个G的位置(行, 列)
+_offsets = {
+    'RG': ((0, 0), (1, 1), (0, 1), (1, 0)),
+    'BG': ((1, 1), (0, 0), (0, 1), (1, 0)),
+    'GR': ((0, 1), (1, 0), (0, 0), (1, 1)),
+    'GB': ((1, 0), (0, 1), (0, 0), (1, 1)),
+}
+
+# OpenCV的Bayer命名以第二行第二列开始, 与左上角的排列不同
+_demosaic_codes = {
+    'RG': cv2.COLOR_BayerBG2BGR,
+    'BG': cv2.COLOR_BayerRG2BGR,
+    'GR': cv2.COLOR_BayerGB2BGR,
+    'GB': cv2.COLOR_BayerGR2BGR,
+}
+
+
+def mosaic(bgr: cv2.Mat, pattern: str) -> cv2.Mat:
+    '''由BGR图像生成Bayer图像, 用于离线回放时模拟相机的原始输出'''
+    (r_row, r_col), (b_row, b_col), (g1_row, g1_col), (g2_row, g2_col) = _offsets[pattern]
+    raw = np.empty(bgr.shape[:2], dtype=np.uint8)
+    raw[r_row::2, r_col::2] = bgr[r_row::2, r_col::2, 2]
+    raw[b_row::2, b_col::2] = bgr[b_row::2, b_col::2, 0]
+    raw[g1_row::2, g1_col::2] = bgr[g1_row::2, g1_col::2, 1]
+    raw[g2_row::2, g2_col::2] = bgr[g2_row::2, g2_col::2, 1]
+    return raw
+
+
+class BayerImage:
+    '''
+    相机共享内存中的一帧原始Bayer图像, 只在需要时去马赛克, 结果按帧缓存.
+    half: 每个2x2块合成一个像素的半分辨率BGR, 用于找灯条和判断颜色;
+    roi_bgr: 只对局部做完整去马赛克, 用于提取装甲板图案;
+    bgr: 整帧完整去马赛克, 仅调试显示和录像时使用.
+    '''
+
+    def __init__(self, raw: np.ndarray, pattern: str) -> None:
+        if pattern not in PATTERNS:
+            raise ValueError(f'Unknown bayer pattern {pattern}')
+        self.raw = raw
+        self.pattern = pattern
+        self._half: cv2.Mat = None
+        self._bgr: cv2.Mat = None
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        '''与对应的BGR图像一致'''
+        h, w = self.raw.shape
+        return h, w, 3
+
+    def plane(self, color: str) -> np.ndarray:
+        '''半分辨率的单色平面, color: 'r', 'b', 'g1', 'g2', 不复制'''
+        row, col = _offsets[self.pattern][('r', 'b', 'g1', 'g2').index(color)]
+        return self.raw[row::2, col::2]
+
+    def half(self) -> cv2.Mat:
+        if self._half is None:
+            g = cv2.addWeighted(self.plane('g1'), 0.5, self.plane('g2'), 0.5, 0)
+            self._half = cv2.merge((self.plane('b'), g, self.plane('r')))
+        return self._half
+
+    def bgr(self) -> cv2.Mat:
+        if self._bgr is None:
+            self._bgr = cv2.cvtColor(self.raw, _demosaic_codes[self.pattern])
+        return self._bgr
+
+    def roi_bgr(self, x: int, y: int, w: int, h: int) -> tuple[cv2.Mat, int, int]:
+        '''
+        对(x, y, w, h)区域去马赛克, 区域会向外对齐到偶数坐标以保持排列不变.
+        return: 区域的BGR图像, 区域实际左上角x, y
+        '''
+        height, width = self.raw.shape
+        x0, y0 = max(x - 2, 0) // 2 * 2, max(y - 2, 0) // 2 * 2
+        x1, y1 = min(x + w + 2, width), min(y + h + 2, height)
+        roi = np.ascontiguousarray(self.raw[y0:y1, x0:x1])
+        return cv2.cvtColor(roi, _demosaic_codes[self.pattern]), x0, y0
+
+    def red_blue_difference(self, x: int, y: int, w: int, h: int) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        直接在Bayer平面上求半分辨率坐标(x, y, w, h)区域内的 r-b 与 b-r, 饱和到0.
+        return: r-b, b-r
+        '''
+        r = self.plane('r')[y:y+h, x:x+w]
+        b = self.plane('b')[y:y+h, x:x+w]
+        return cv2.subtract(r, b), cv2.subtract(b, r)
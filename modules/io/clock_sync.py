@@ -0,0 +1,134 @@
+import numpy as np
+
+
+'''
+下位机时钟同步: 下位机按固定周期发送状态帧, 帧中的8位stamp每帧加1.
+把stamp展开为连续的帧计数n后, 下位机发送时刻与主机时钟满足 t = offset + period * n,
+而主机收到的时刻还叠加了USB串口攒批等非负的传输延迟.
+在最近window个样本上用最小二乘估计period(漂移), 再取所有样本之下的直线作为offset(下包络),
+每个样本的校正时刻为 offset + period * n, 去掉了攒批带来的抖动.
+'''
+
+CLOCK_STATS_FIELDS = ('samples', 'resets', 'period_s', 'drift_ppm', 'offset_s', 'delay_s', 'jitter_s')
+
+
+class ClockSync:
+    def __init__(self, window: int = 2000, min_samples: int = 50, mcu_rate_hz: float | None = None, max_gap_s: float = 0.2) -> None:
+        '''
+        window: 参与估计的最近样本数;
+        min_samples: 样本数少于该值时不校正;
+        mcu_rate_hz: 下位机标称发送频率, 用于计算漂移, None时漂移为nan;
+        max_gap_s: 两个样本间隔超过该值(下位机重启, 串口重连)时重新估计.
+        '''
+        self._window = window
+        self._min_samples = min_samples
+        self._nominal_period_s = None if mcu_rate_hz is None else 1 / mcu_rate_hz
+        self._max_gap_s = max_gap_s
+        self._envelope_quantile = 0.1
+
+        self._counters = np.empty(0, dtype=np.float64)
+        self._arrivals_s = np.empty(0, dtype=np.float64)
+        self._last_stamp: int = None
+        self._last_counter = 0
+
+        self.period_s: float = None
+        self.offset_s: float = None
+
+        self.resets = 0
+        self.sample_count = 0
+        self.delay_s = np.nan  # 收到时刻相对校正时刻的平均延迟
+        self.jitter_s = np.nan  # 上述延迟的标准差
+
+    def _reset(self) -> None:
+        self._counters = self._counters[:0]
+        self._arrivals_s = self._arrivals_s[:0]
+        self._last_stamp = None
+        self.period_s = None
+        self.offset_s = None
+        self.resets += 1
+
+    def _unwrap(self, stamps: np.ndarray, arrivals_s: np.ndarray) -> np.ndarray:
+        '''stamp展开为连续计数. 已知周期时按收到时刻的间隔判断中间丢了几圈, 否则假定丢帧不超过255'''
+        if self._last_stamp is None:
+            previous_stamps = np.concatenate(([stamps[0]], stamps[:-1]))
+            previous_arrivals_s = np.concatenate(([arrivals_s[0]], arrivals_s[:-1]))
+        else:
+            previous_stamps = np.concatenate(([self._last_stamp], stamps[:-1]))
+            previous_arrivals_s = np.concatenate(([self._arrivals_s[-1]], arrivals_s[:-1]))
+
+        steps = (stamps - previous_stamps) % 256
+        if self.period_s is not None:
+            expected = (arrivals_s - previous_arrivals_s) / self.period_s
+            steps = steps + 256 * np.maximum(np.round((expected - steps) / 256), 0)
+
+        counters = self._last_counter + np.cumsum(steps)
+        self._last_stamp = int(stamps[-1])
+        self._last_counter = counters[-1]
+        return counters
+
+    def correct(self, arrivals_s: np.ndarray, stamps: np.ndarray) -> np.ndarray:
+        '''
+        arrivals_s: 主机收到的时刻, stamps: 对应的8位stamp, 均按到达顺序排列.
+        return: 校正后的时刻, 样本不足时为收到的时刻
+        '''
+        if len(arrivals_s) == 0:
+            return arrivals_s
+
+        arrivals_s = np.asarray(arrivals_s, dtype=np.float64)
+        stamps = np.asarray(stamps, dtype=np.int64)
+
+        if len(self._arrivals_s) > 0 and arrivals_s[0] - self._arrivals_s[-1] > self._max_gap_s:
+            self._reset()
+
+        counters = self._unwrap(stamps, arrivals_s)
+        self._counters = np.concatenate((self._counters, counters))[-self._window:]
+        self._arrivals_s = np.concatenate((self._arrivals_s, arrivals_s))[-self._window:]
+        self.sample_count += len(arrivals_s)
+
+        if len(self._counters) < self._min_samples:
+            return arrivals_s
+
+        # 周期: 先对全部样本做最小二乘, 再只用延迟最小的一部分样本(接近下包络, 抖动小)重新拟合;
+        # 偏移: 使直线位于所有样本之下
+        n = self._counters - self._counters[0]
+        t = self._arrivals_s - self._arrivals_s[0]
+        fit = _fit_line(n, t)
+        if fit is None:
+            return arrivals_s
+        slope, intercept = fit
+        residuals_s = t - (intercept + slope * n)
+        envelope = residuals_s <= np.quantile(residuals_s, self._envelope_quantile)
+        slope, _ = _fit_line(n[envelope], t[envelope]) or fit
+
+        self.period_s = float(slope)
+        self.offset_s = float(np.min(self._arrivals_s - self.period_s * self._counters))
+
+        delays_s = self._arrivals_s - (self.offset_s + self.period_s * self._counters)
+        self.delay_s = float(delays_s.mean())
+        self.jitter_s = float(delays_s.std())
+
+        return self.offset_s + self.period_s * counters
+
+    def stats(self) -> tuple[float, ...]:
+        period_s = np.nan if self.period_s is None else self.period_s
+        offset_s = np.nan if self.offset_s is None else self.offset_s
+        if self._nominal_period_s is None or self.period_s is None:
+            drift_ppm = np.nan
+        else:
+            drift_ppm = (self.period_s / self._nominal_period_s - 1) * 1e6
+        return self.sample_count, self.resets, period_s, drift_ppm, offset_s, self.delay_s, self.jitter_s
+
+
+def format_stats(stats: dict[str, float]) -> str:
+    '''offset_s为time.time()时钟下的时刻, 保留到微秒, 其余保留6位有效数字'''
+    return ' '.join(f'{name}={value:.6f}' if name == 'offset_s' else f'{name}={value:.6g}' for name, value in stats.items())
+
+
+def _fit_line(x: np.ndarray, y: np.ndarray) -> tuple[float, float] | None:
+    '''最小二乘直线 y = slope * x + intercept, x全部相同时返回None'''
+    x_mean = x.mean()
+    variance = np.sum((x - x_mean) ** 2)
+    if variance == 0:
+        return None
+    slope = np.sum((x - x_mean) * (y - y.mean())) / variance
+    return slope, y.mean() - slope * x_mean
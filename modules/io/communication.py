@@ -3,7 +3,8 @@ import time
 import serial
 import struct
 import logging
-from typing import TypeAlias
+import numpy as np
+from typing import Any, Callable, TypeAlias
 from modules.io.context_manager import ContextManager
 
 
@@ -13,6 +14,12 @@ FRAME_TAIL = 0xf2
 TX_FRAME_LEN = 10
 RX_FRAME_LEN = 11
 
+BAUDRATE = 115200
+BYTE_TIME_S = 10 / BAUDRATE  # 起始位+8数据位+停止位
+MCU_RATE_HZ = 1000  # 下位机发送状态帧的标称频率, 每帧stamp加1
+
+min_retry_interval_s, max_retry_interval_s = 0.01, 1.0  # 重新打开串口失败后的重试间隔
+
 TX_FLAG_EMPTY = 0
 TX_FLAG_FIRE = 1
 
@@ -39,12 +46,27 @@ crc8Table = [
 ]
 
 
+_crc8_table = bytes(crc8Table)
+_crc8_table_array = np.frombuffer(_crc8_table, dtype=np.uint8)
+
+tx_struct = struct.Struct('=BhhhB')
+tx_frame_struct = struct.Struct('=BhhhBBB')
+rx_struct = struct.Struct('=BBhhhBBB')
+
+
 def calculateCrc8(data: bytes) -> int:
     crc = 0xff
-    index = 0
-    for i in range(len(data)):
-        index = crc ^ data[i]
-        crc = crc8Table[index]
+    table = _crc8_table
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+
+def calculate_crc8_batch(frames: np.ndarray) -> np.ndarray:
+    '''对shape=(N, L)的N段数据同时计算CRC8, 逐列查表'''
+    crc = np.full(len(frames), 0xff, dtype=np.uint8)
+    for column in frames.T:
+        crc = _crc8_table_array[crc ^ column]
     return crc
 
 
@@ -53,23 +75,120 @@ def pack_frame(x_in_imu_mm: float, y_in_imu_mm: float, z_in_imu_mm: float, flag:
     y_in_imu_mm = int(y_in_imu_mm)
     z_in_imu_mm = int(z_in_imu_mm)
 
-    crc_part = struct.pack('=BhhhB', FRAME_HEAD, x_in_imu_mm, y_in_imu_mm, z_in_imu_mm, flag)
+    crc_part = tx_struct.pack(FRAME_HEAD, x_in_imu_mm, y_in_imu_mm, z_in_imu_mm, flag)
     crc = calculateCrc8(crc_part)
-    frame = crc_part + struct.pack('BB', crc, FRAME_TAIL)
+    frame = crc_part + bytes((crc, FRAME_TAIL))
     return frame
 
 
+def pack_status_frame(stamp: int, yaw_degree: float, pitch_degree: float, bullet_speed: float, flag: int) -> bytes:
+    '''下位机发送的状态帧, 用于模拟下位机'''
+    crc_part = rx_struct.pack(
+        FRAME_HEAD, stamp, round(yaw_degree * 1e2), round(pitch_degree * 1e2), round(bullet_speed * 1e2), flag, 0, 0
+    )[:-2]
+    crc = calculateCrc8(crc_part)
+    return crc_part + bytes((crc, FRAME_TAIL))
+
+
+def _to_status(stamp: int, yaw: int, pitch: int, bullet_speed: int, flag: int) -> Status:
+    return stamp, yaw / 1e2, pitch / 1e2, bullet_speed / 1e2, flag
+
+
+def decode_status(fields: tuple) -> Status:
+    _, stamp, yaw, pitch, bullet_speed, flag, _, _ = fields
+    return _to_status(stamp, yaw, pitch, bullet_speed, flag)
+
+
+def decode_command(fields: tuple) -> Command:
+    _, x_in_imu_mm, y_in_imu_mm, z_in_imu_mm, flag, _, _ = fields
+    return float(x_in_imu_mm), float(y_in_imu_mm), float(z_in_imu_mm), flag
+
+
 def unpack_frame(frame: bytes) -> tuple[bool, None | Status]:
-    head, stamp, yaw, pitch, bullet_speed, flag, crc, tail = struct.unpack('=BBhhhBBB', frame)
+    head, stamp, yaw, pitch, bullet_speed, flag, crc, tail = rx_struct.unpack(frame)
 
     if head != FRAME_HEAD or tail != FRAME_TAIL or crc != calculateCrc8(frame[:-2]):
         return False, None
 
-    yaw = yaw / 1e2
-    pitch = pitch / 1e2
-    bullet_speed = bullet_speed / 1e2
-
-    return True, (stamp, yaw, pitch, bullet_speed, flag)
+    return True, _to_status(stamp, yaw, pitch, bullet_speed, flag)
+
+
+class FrameParser:
+    '''
+    串口帧的流式解析器, 默认解析下位机状态帧, 也可以解析发送的命令帧(用于模拟下位机).
+    串口数据按块喂入, 在缓冲区中寻找帧头与帧尾, 再批量校验CRC, 块中每一帧有效帧都会被解出;
+    数据损坏时从下一个字节重新寻找帧头, 不完整的帧留到下一块.
+    每帧的到达时刻按其最后一个字节在块中的位置, 在上一块与这一块的读取时刻之间线性插值.
+    '''
+
+    def __init__(self, frame_struct: struct.Struct = rx_struct, decode: Callable[[tuple], Any] = decode_status) -> None:
+        '''frame_struct: 整帧(含CRC和帧尾)的格式, decode: 由解出的字段得到结果'''
+        self._frame_struct = frame_struct
+        self._frame_len = frame_struct.size
+        self._decode = decode
+
+        self._buffer = bytearray()
+        self._last_read_time_s: float = None
+
+        self.frame_count = 0  # 解出的帧数
+        self.crc_error_count = 0  # 帧头帧尾正确但CRC错误的帧数
+        self.skipped_bytes = 0  # 不属于任何有效帧而被丢弃的字节数
+
+    def reset(self) -> None:
+        '''串口重新打开后丢弃残留的字节, 统计保留'''
+        self._buffer.clear()
+        self._last_read_time_s = None
+
+    def feed(self, data: bytes, read_time_s: float) -> list[tuple[float, Any]]:
+        '''return: 按到达顺序排列的(到达时刻, 解码结果)'''
+        if len(data) == 0:
+            return []
+
+        # 第一块没有上一次读取时刻, 按波特率估计
+        last_read_time_s = self._last_read_time_s
+        if last_read_time_s is None:
+            last_read_time_s = read_time_s - len(data) * BYTE_TIME_S
+        self._last_read_time_s = read_time_s
+
+        buffer = self._buffer
+        old_size = len(buffer)
+        buffer += data
+
+        frame_len = self._frame_len
+        frames: list[tuple[float, Any]] = []
+        end = 0
+        if len(buffer) >= frame_len:
+            array = np.frombuffer(buffer, dtype=np.uint8)
+            starts = np.flatnonzero(
+                (array[:1 - frame_len] == FRAME_HEAD) & (array[frame_len - 1:] == FRAME_TAIL)
+            )
+
+            if len(starts) > 0:
+                candidates = array[starts[:, np.newaxis] + np.arange(frame_len)]
+                valid = calculate_crc8_batch(candidates[:, :-2]) == candidates[:, -2]
+                self.crc_error_count += int(np.count_nonzero(~valid))
+
+                time_per_byte_s = (read_time_s - last_read_time_s) / len(data)
+                for start in starts[valid].tolist():
+                    # 与已接受的帧重叠的候选视为误匹配
+                    if start < end:
+                        continue
+                    self.skipped_bytes += start - end
+                    end = start + frame_len
+
+                    arrival_time_s = last_read_time_s + (end - old_size) * time_per_byte_s
+                    fields = self._frame_struct.unpack_from(buffer, start)
+                    frames.append((max(arrival_time_s, last_read_time_s), self._decode(fields)))
+
+            del array
+
+        # 最后不足一帧的字节可能是下一帧的开头, 保留
+        keep_from = max(end, len(buffer) - (frame_len - 1))
+        self.skipped_bytes += max(keep_from - end, 0)
+        del buffer[:keep_from]
+
+        self.frame_count += len(frames)
+        return frames
 
 
 def yaw_pitch_to_xyz(yaw: float, pitch: float) -> tuple[float, float, float]:
@@ -81,16 +200,38 @@ def yaw_pitch_to_xyz(yaw: float, pitch: float) -> tuple[float, float, float]:
     return x*1e3, y*1e3, z*1e3
 
 
+def apply_gun_offset(aim_point_in_imu_m: np.ndarray, gun_up_degree: float, gun_right_degree: float) -> tuple[float, float, float]:
+    '''补偿枪管相对imu的安装角度, 返回发送给下位机的瞄准点(mm)'''
+    yaw = math.radians(gun_right_degree)
+    R_y = np.array([[math.cos(yaw), 0, math.sin(yaw)],
+                    [0, 1, 0],
+                    [-math.sin(yaw), 0, math.cos(yaw)]])
+
+    aim_point_in_imu_m = R_y @ aim_point_in_imu_m
+
+    aim_point_in_imu_mm = aim_point_in_imu_m * 1e3
+    x_in_imu_mm, y_in_imu_mm, z_in_imu_mm = aim_point_in_imu_mm.T[0]
+
+    gun_up_rad = math.radians(gun_up_degree)
+    distance_mm = (x_in_imu_mm**2 + z_in_imu_mm**2)**0.5
+    aim_pitch_rad = math.atan(-y_in_imu_mm/distance_mm)
+    y_in_imu_mm = -distance_mm * math.tan(aim_pitch_rad + gun_up_rad)
+
+    return x_in_imu_mm, y_in_imu_mm, z_in_imu_mm
+
+
 class Communicator(ContextManager):
     def __init__(self, port: str, use_rx=True, ues_tx=True) -> None:
         self._port = port
         self._use_rx = use_rx
         self._use_tx = ues_tx
         self.read_time_s: float = None
+        self._parser = FrameParser()
         self._open()
 
     def _open(self) -> None:
-        self._serial = serial.Serial(self._port, 115200)
+        self._parser.reset()
+        self._serial = serial.Serial(self._port, BAUDRATE)
         if self._use_rx:
             self._serial.reset_input_buffer()
         if self._use_tx:
@@ -106,18 +247,30 @@ class Communicator(ContextManager):
         self._close()
 
         last_error = None
+        retry_interval_s = min_retry_interval_s
         while True:
             try:
                 self._open()
                 break
             except Exception as error:
-                if type(last_error) == type(error):
-                    continue
-                logging.error(error)
-                last_error = error
+                if type(last_error) != type(error):
+                    logging.error(error)
+                    last_error = error
+
+            # 退避重试, 实时调度的进程不会在设备拔出时空转占满所在的核
+            time.sleep(retry_interval_s)
+            retry_interval_s = min(retry_interval_s * 2, max_retry_interval_s)
 
         logging.info('Communicator reopened.')
 
+    def fileno(self) -> int:
+        '''用于select等待串口可读'''
+        return self._serial.fileno()
+
+    @property
+    def in_waiting(self) -> int:
+        return self._serial.in_waiting
+
     def send(
         self,
         x_in_imu_mm: float, y_in_imu_mm: float, z_in_imu_mm: float, flag: int = TX_FLAG_EMPTY,
@@ -130,31 +283,27 @@ class Communicator(ContextManager):
         if debug:
             print(f'sent x={x_in_imu_mm} y={y_in_imu_mm} z={z_in_imu_mm} {flag=} {frame.hex()}')
 
-    def read_no_wait(self, debug: bool = False) -> tuple[bool, None | Status]:
-        frame = self._serial.read_all()
+    def read_frames(self, debug: bool = False) -> list[tuple[float, Status]]:
+        '''读取串口中已有的全部数据, 返回其中所有有效帧的(到达时刻, 状态)'''
+        data = self._serial.read_all()
         read_time_s = time.time()
 
-        if len(frame) == 0:
-            return False, None
-
-        if len(frame) < RX_FRAME_LEN:
-            logging.debug(f'failed to read {frame.hex()}')
-            return False, None
-        else:
-            frame = frame[-RX_FRAME_LEN:]
-
-        success, status = unpack_frame(frame)
-        if not success:
-            logging.debug(f'failed to unpack {frame.hex()}')
-            return False, None
-
-        self.read_time_s = read_time_s
+        frames = self._parser.feed(data, read_time_s)
+        if len(frames) > 0:
+            self.read_time_s = frames[-1][0]
 
         if debug:
-            stamp, yaw, pitch, bullet_speed, flag = status
-            print(f'read {stamp=} yaw={yaw:.2f} pitch={pitch:.2f} bullet_speed={bullet_speed:.2f} {flag=} {frame.hex()}')
+            for arrival_time_s, (stamp, yaw, pitch, bullet_speed, flag) in frames:
+                print(f'read {stamp=} yaw={yaw:.2f} pitch={pitch:.2f} bullet_speed={bullet_speed:.2f} {flag=} at {arrival_time_s:.4f}')
 
-        return True, status
+        return frames
+
+    def read_no_wait(self, debug: bool = False) -> tuple[bool, None | Status]:
+        '''只返回最新的一帧'''
+        frames = self.read_frames(debug)
+        if len(frames) == 0:
+            return False, None
+        return True, frames[-1][1]
 
     def read(self, debug: bool = False) -> Status:
         '''注意阻塞'''
@@ -164,3 +313,11 @@ class Communicator(ContextManager):
                 continue
 
             return status
+
+    @property
+    def parser_stats(self) -> dict[str, int]:
+        return {
+            'frames': self._parser.frame_count,
+            'crc_errors': self._parser.crc_error_count,
+            'skipped_bytes': self._parser.skipped_bytes,
+        }
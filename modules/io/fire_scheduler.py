@@ -0,0 +1,114 @@
+import heapq
+import logging
+import itertools
+from modules.io.communication import Command
+
+
+FIRE_STATS_FIELDS = ('fired', 'missed', 'replaced', 'cancelled', 'rejected', 'mean_error_s', 'max_error_s')
+
+
+class FireScheduler:
+    '''
+    定时命令调度器, 所有时间均为time.monotonic()时钟.
+    同一tag最多只有一条待发送命令, 新命令会替换旧命令.
+    '''
+
+    def __init__(self, tolerance_s: float = 1e-3, max_ahead_s: float = 1.0) -> None:
+        '''
+        tolerance_s: 超过截止时间该值仍未发送则视为错过
+        max_ahead_s: 截止时间距今超过该值的命令直接拒绝
+        '''
+        self._tolerance_s = tolerance_s
+        self._max_ahead_s = max_ahead_s
+
+        self._heap: list[tuple[float, int, str]] = []
+        self._pending: dict[str, tuple[int, Command, float]] = {}
+        self._counter = itertools.count()
+
+        self.fired = 0
+        self.missed = 0
+        self.replaced = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self._error_sum_s = 0.0
+        self.max_error_s = 0.0
+
+    def schedule(self, tag: str, command: Command, deadline_s: float, now_s: float) -> bool:
+        if deadline_s - now_s > self._max_ahead_s:
+            logging.debug(f'Scheduled {tag} is so far over {deadline_s - now_s}s.')
+            self.rejected += 1
+            return False
+
+        if tag in self._pending:
+            seq, _, old_deadline_s = self._pending[tag]
+
+            # 截止时间几乎不变时视为同一次开火, 只更新命令
+            if abs(deadline_s - old_deadline_s) < self._tolerance_s:
+                self._pending[tag] = (seq, command, old_deadline_s)
+                return True
+
+            self.replaced += 1
+
+        seq = next(self._counter)
+        self._pending[tag] = (seq, command, deadline_s)
+        heapq.heappush(self._heap, (deadline_s, seq, tag))
+        return True
+
+    def update(self, tag: str, command: Command) -> None:
+        '''只更新待发送命令的内容, 保持截止时间不变'''
+        if tag not in self._pending:
+            return
+        seq, _, deadline_s = self._pending[tag]
+        self._pending[tag] = (seq, command, deadline_s)
+
+    def cancel(self, tag: str) -> None:
+        if self._pending.pop(tag, None) is not None:
+            self.cancelled += 1
+
+    def _drop_stale(self) -> None:
+        # 被替换或取消的条目惰性删除
+        while self._heap:
+            _, seq, tag = self._heap[0]
+            pending = self._pending.get(tag)
+            if pending is not None and pending[0] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    def timeout_s(self, now_s: float) -> float | None:
+        '''距离下一个截止时间的秒数, 没有待发送命令时返回None'''
+        self._drop_stale()
+        if not self._heap:
+            return None
+        deadline_s, _, _ = self._heap[0]
+        return max(deadline_s - now_s, 0.0)
+
+    def pop_due(self, now_s: float) -> list[Command]:
+        '''弹出所有已到截止时间的命令, 超时过多的计为错过'''
+        due: list[Command] = []
+
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now_s:
+            deadline_s, _, tag = heapq.heappop(self._heap)
+            _, command, _ = self._pending.pop(tag)
+
+            error_s = now_s - deadline_s
+            if error_s > self._tolerance_s:
+                logging.debug(f'Scheduled {tag} expired over {error_s}s.')
+                self.missed += 1
+            else:
+                self.fired += 1
+                self._error_sum_s += error_s
+                self.max_error_s = max(self.max_error_s, error_s)
+                due.append(command)
+
+            self._drop_stale()
+
+        return due
+
+    @property
+    def mean_error_s(self) -> float:
+        return self._error_sum_s / self.fired if self.fired > 0 else 0.0
+
+    def stats(self) -> tuple[float, ...]:
+        '''与FIRE_STATS_FIELDS顺序一致'''
+        return tuple(float(getattr(self, field)) for field in FIRE_STATS_FIELDS)
@@ -0,0 +1,116 @@
+import ctypes
+import numpy as np
+from multiprocessing import Condition, RawArray
+
+
+FRAME_STATS_FIELDS = ('published', 'consumed', 'dropped', 'no_free_buffer')
+
+
+class FrameExchange:
+    '''
+    进程间共享内存帧交换(多缓冲, 最新帧优先).
+    生产者: acquire_write -> 写入 -> publish
+    消费者: acquire_latest -> 读取 -> release
+    被占用(引用计数>0)或正在写入的缓冲区不会被覆盖, 消费者总是拿到最新的完整帧.
+    '''
+
+    def __init__(self, shape: tuple[int, ...], buffer_num: int = 3) -> None:
+        self.shape = shape
+        self.buffer_num = buffer_num
+
+        size = int(np.prod(shape))
+        self._buffers = [RawArray(ctypes.c_uint8, size) for _ in range(buffer_num)]
+
+        self._condition = Condition()
+        self._seqs = RawArray(ctypes.c_int64, buffer_num)  # 各缓冲区中帧的序号, 0表示无效
+        self._refs = RawArray(ctypes.c_int64, buffer_num)  # 引用计数
+        self._writing = RawArray(ctypes.c_int64, buffer_num)
+        self._read_times_s = RawArray(ctypes.c_double, buffer_num)
+        self._trace_ids = RawArray(ctypes.c_int64, buffer_num)
+        self._latest = RawArray(ctypes.c_int64, 2)  # 最新帧的缓冲区索引, 序号
+        self._consumed_seq = RawArray(ctypes.c_int64, 1)  # 消费者最后拿到的序号
+        self._stats = RawArray(ctypes.c_int64, len(FRAME_STATS_FIELDS))
+
+        self._latest[0] = -1
+
+    def array(self, index: int) -> np.ndarray:
+        return np.frombuffer(self._buffers[index], dtype=np.uint8).reshape(self.shape)
+
+    def address(self, index: int) -> int:
+        return ctypes.addressof(self._buffers[index])
+
+    def _count(self, field: str) -> None:
+        self._stats[FRAME_STATS_FIELDS.index(field)] += 1
+
+    def acquire_write(self) -> int | None:
+        '''获得一个可写的缓冲区, 优先选择最旧的, 没有空闲缓冲区时返回None'''
+        with self._condition:
+            latest_index = self._latest[0]
+            free = [
+                i for i in range(self.buffer_num)
+                if self._refs[i] == 0 and not self._writing[i] and i != latest_index
+            ]
+            if not free:
+                self._count('no_free_buffer')
+                return None
+
+            index = min(free, key=lambda i: self._seqs[i])
+            self._writing[index] = 1
+            self._seqs[index] = 0
+            return index
+
+    def publish(self, index: int, read_time_s: float, trace_id: int = 0) -> None:
+        with self._condition:
+            latest_index, latest_seq = self._latest
+            if latest_index >= 0 and latest_seq > self._consumed_seq[0]:
+                self._count('dropped')  # 上一帧还没被消费就被新帧取代
+
+            seq = latest_seq + 1
+            self._writing[index] = 0
+            self._seqs[index] = seq
+            self._read_times_s[index] = read_time_s
+            self._trace_ids[index] = trace_id
+            self._latest[0], self._latest[1] = index, seq
+            self._count('published')
+
+            self._condition.notify_all()
+
+    def abort(self, index: int) -> None:
+        '''写入失败时归还缓冲区'''
+        with self._condition:
+            self._writing[index] = 0
+
+    def acquire_latest(self, timeout_s: float | None = None) -> tuple[int, float, int] | None:
+        '''
+        等待并占用一帧比上次更新的帧, 超时返回None.
+        return: 缓冲区索引, 取图时间, trace_id
+        '''
+        with self._condition:
+            has_new = self._condition.wait_for(lambda: self._latest[1] > self._consumed_seq[0], timeout_s)
+            if not has_new:
+                return None
+
+            index, seq = self._latest
+            self._refs[index] += 1
+            self._consumed_seq[0] = seq
+            self._count('consumed')
+            self._condition.notify_all()
+            return index, self._read_times_s[index], self._trace_ids[index]
+
+    def wait_consumed(self, timeout_s: float | None = None) -> bool:
+        '''等待消费者拿走最新帧, 用于不丢帧的回放'''
+        with self._condition:
+            return self._condition.wait_for(lambda: self._latest[1] <= self._consumed_seq[0], timeout_s)
+
+    def pin(self, index: int) -> None:
+        '''额外占用一个已被持有的缓冲区(例如交给录像进程), 之后需要对应的release'''
+        with self._condition:
+            self._refs[index] += 1
+
+    def release(self, index: int) -> None:
+        with self._condition:
+            self._refs[index] -= 1
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return dict(zip(FRAME_STATS_FIELDS, self._stats))
@@ -1,15 +1,29 @@
 import cv2
 import time
+import ctypes
 import logging
 import numpy as np
 import modules.io.mvsdk as mvsdk
 from modules.io.context_manager import ContextManager
 
 
+min_retry_interval_s, max_retry_interval_s = 0.01, 1.0  # 重新打开相机失败后的重试间隔
+
+_bayer_patterns = {
+    mvsdk.CAMERA_MEDIA_TYPE_BAYRG8: 'RG',
+    mvsdk.CAMERA_MEDIA_TYPE_BAYBG8: 'BG',
+    mvsdk.CAMERA_MEDIA_TYPE_BAYGR8: 'GR',
+    mvsdk.CAMERA_MEDIA_TYPE_BAYGB8: 'GB',
+}
+
+
 class Camera(ContextManager):
-    def __init__(self, exposure_ms: float) -> None:
+    def __init__(self, exposure_ms: float, bayer: bool = False) -> None:
+        '''bayer: 不经过ISP, 直接输出单通道原始Bayer图像, 排列见bayer_pattern'''
         self._exposure_ms = exposure_ms
+        self._bayer = bayer
         self.read_time_s: float = None
+        self.bayer_pattern: str = None
         self._open()
 
     def _open(self) -> None:
@@ -24,6 +38,17 @@ class Camera(ContextManager):
         mvsdk.CameraSetFrameSpeed(self._handle, mvsdk.FRAME_SPEED_LOW)
         mvsdk.CameraSetIspOutFormat(self._handle, mvsdk.CAMERA_MEDIA_TYPE_BGR8)
 
+        if self._bayer:
+            capability = mvsdk.CameraGetCapability(self._handle)
+            for i in range(capability.iMediaTypeDesc):
+                media_type = capability.pMediaTypeDesc[i]
+                if media_type.iMediaType in _bayer_patterns:
+                    mvsdk.CameraSetMediaType(self._handle, media_type.iIndex)
+                    self.bayer_pattern = _bayer_patterns[media_type.iMediaType]
+                    break
+            else:
+                raise RuntimeError("相机不支持8位Bayer输出")
+
         buffer_size = 1024 * 1280 * 3
         self._buffer = mvsdk.CameraAlignMalloc(buffer_size)
 
@@ -40,6 +65,18 @@ class Camera(ContextManager):
             raw, head = mvsdk.CameraGetImageBuffer(self._handle, 200)
             self.read_time_s = time.time()
 
+            if self._bayer:
+                # 原始数据直接复制, 去马赛克留给需要的地方
+                address = self._buffer if buffer_address == None else buffer_address
+                ctypes.memmove(address, raw, head.uBytes)
+                mvsdk.CameraReleaseImageBuffer(self._handle, raw)
+                if buffer_address != None:
+                    return True, None
+                img = (mvsdk.c_ubyte * head.uBytes).from_address(self._buffer)
+                img = np.frombuffer(img, dtype=np.uint8)
+                img = img.reshape((head.iHeight, head.iWidth))
+                return True, img
+
             if buffer_address != None:
                 mvsdk.CameraImageProcess(self._handle, raw, buffer_address, head)
                 mvsdk.CameraReleaseImageBuffer(self._handle, raw)
@@ -64,14 +101,18 @@ class Camera(ContextManager):
         self._close()
 
         last_error = None
+        retry_interval_s = min_retry_interval_s
         while True:
             try:
                 self._open()
                 break
             except Exception as error:
-                if type(last_error) == type(error):
-                    continue
-                logging.error(error)
-                last_error = error
+                if type(last_error) != type(error):
+                    logging.error(error)
+                    last_error = error
+
+            # 退避重试, 实时调度的进程不会在设备拔出时空转占满所在的核
+            time.sleep(retry_interval_s)
+            retry_interval_s = min(retry_interval_s * 2, max_retry_interval_s)
 
         logging.info('Camera reopened.')
@@ -1,85 +1,123 @@
 import cv2
 import time
-import queue
 import ctypes
 import logging
-import numpy as np
-from multiprocessing import Process, Queue, RawArray
-from modules.io.mindvision import Camera
+from multiprocessing import Process, RawArray
 from modules.io.context_manager import ContextManager
-from modules.tools import clear_queue
+from modules.io.frame_exchange import FrameExchange
+from modules.io.quit_signal import QuitSignal
+from modules.io import process_profile
+from modules.io.bayer import BayerImage
+from modules.io.trace import TraceRing, Stage
 
 
-def capture(exposure_ms: float, buffers: list[RawArray], tx_queue: Queue, quit_queue: Queue) -> None:
-    logging.info('Capture started.')
-
-    with Camera(exposure_ms) as camera:
-        successed_count = 0
-        last_buffer_index = -1
+def capture(
+    exposure_ms: float, bayer: bool, exchange: FrameExchange, bayer_pattern: RawArray, quit_signal: QuitSignal,
+    trace_ring: TraceRing | None
+) -> None:
+    # 在子进程中导入, 没有相机SDK的机器上也能使用离线回放
+    from modules.io.mindvision import Camera
 
-        while True:
-            time.sleep(1e-4)
+    logging.info('Capture started.')
 
-            # 判断是否退出
-            try:
-                quit = quit_queue.get_nowait()
-                if quit:
-                    break
-            except queue.Empty:
-                pass
+    with Camera(exposure_ms, bayer) as camera:
+        if bayer:
+            bayer_pattern.value = camera.bayer_pattern.encode()
 
-            buffer_index = last_buffer_index + 1
-            if buffer_index == len(buffers):
-                buffer_index = 0
+        trace_id = 0
 
-            buffer_address = ctypes.addressof(buffers[buffer_index])
-            last_buffer_index = buffer_index
+        # camera.read阻塞等待下一帧, 无需额外休眠
+        while not quit_signal.is_set():
+            # 所有缓冲区都被占用时仍需取图, 以免相机内部堆积旧帧
+            buffer_index = exchange.acquire_write()
+            if buffer_index is None:
+                success, _ = camera.read()
+            else:
+                success, _ = camera.read(exchange.address(buffer_index))
 
-            success, _ = camera.read(buffer_address)
             if not success:
+                if buffer_index is not None:
+                    exchange.abort(buffer_index)
                 logging.warning('Camera lost.')
                 camera.reopen()
                 continue
 
-            try:
-                tx_queue.put_nowait((camera.read_time_s, buffer_index))
-            except queue.Full:
-                logging.debug(f'Capture tx_queue full! Successed count: {successed_count}')
-                successed_count = -1
-            successed_count += 1
+            if buffer_index is None:
+                logging.debug('Capture has no free buffer!')
+                continue
+
+            # 每帧分配一个trace_id, 取图时刻从time.time()换算到time.monotonic_ns()
+            trace_id += 1
+            if trace_ring is not None:
+                capture_ns = time.monotonic_ns() - int((time.time() - camera.read_time_s) * 1e9)
+                trace_ring.write(trace_id, Stage.CAPTURE, capture_ns)
 
-    clear_queue(tx_queue)
-    clear_queue(quit_queue)
+            exchange.publish(buffer_index, camera.read_time_s, trace_id)
 
     logging.info('Capture ended.')
 
 
 class ParallelCamera(ContextManager):
-    def __init__(self, exposure_ms: float) -> None:
+    def __init__(self, exposure_ms: float, trace_ring: TraceRing | None = None, buffer_num: int = 5, bayer: bool = False) -> None:
+        '''
+        buffer_num: 共享内存缓冲区数量, 取图与主进程需要3个, 其余留给按引用录像等同时占用帧的进程;
+        bayer: 进程间传递单通道原始Bayer图像, img为BayerImage, 按需去马赛克.
+        '''
+        self._setup(buffer_num, bayer)
+        self._process = Process(
+            target=capture,
+            name='capture',
+            args=(exposure_ms, bayer, self._exchange, self._bayer_pattern, self._quit_signal, trace_ring)
+        )
+
+        self._process.start()
+        process_profile.apply(self._process.name, self._process.pid)
+
+    def _setup(self, buffer_num: int, bayer: bool) -> None:
         self._height = 1024
         self._width = 1280
-        self._channel = 3
-        self._buffer_num = 4
+        self._bayer = bayer
 
-        img_size = self._height * self._width * self._channel
-        self._buffers = [RawArray(ctypes.c_uint8, img_size) for _ in range(self._buffer_num)]
-        self._quit_queue = Queue()
-        self._rx_queue = Queue(maxsize=1)
-        self._process = Process(target=capture, args=(exposure_ms, self._buffers, self._rx_queue, self._quit_queue))
+        shape = (self._height, self._width) if bayer else (self._height, self._width, 3)
+        self._exchange = FrameExchange(shape, buffer_num)
+        self._bayer_pattern = RawArray(ctypes.c_char, 2)  # 由取图进程填写
+        self._quit_signal = QuitSignal()
 
-        self._process.start()
-
-        self.img: cv2.Mat = None
+        self._buffer_index: int = None
+        self.img: cv2.Mat | BayerImage = None
         self.read_time_s: float = None
+        self.trace_id: int = None
 
     def _close(self) -> None:
         '''注意阻塞'''
-        self._quit_queue.put(True)
+        self._quit_signal.set()
         self._process.join()
+
+        summary = ' '.join(f'{name}={value}' for name, value in self.frame_stats.items())
+        logging.info(f'Frame exchange: {summary}')
         logging.info('ParallelCamera closed.')
 
+    def _release(self) -> None:
+        if self._buffer_index is not None:
+            self._exchange.release(self._buffer_index)
+            self._buffer_index = None
+
+    def _set_frame(self, frame: tuple[int, float, int]) -> None:
+        self._buffer_index, self.read_time_s, self.trace_id = frame
+        img = self._exchange.array(self._buffer_index)
+        self.img = BayerImage(img, self._bayer_pattern.value.decode()) if self._bayer else img
+
+    def pin(self) -> int:
+        '''额外占用当前帧的缓冲区, 交给其他进程按引用使用, 用完后由其调用exchange.release'''
+        self._exchange.pin(self._buffer_index)
+        return self._buffer_index
+
     def update(self) -> None:
-        '''注意阻塞'''
-        self.read_time_s, buffer_index = self._rx_queue.get()
-        img = np.frombuffer(self._buffers[buffer_index], dtype=np.uint8)
-        self.img = img.reshape((self._height, self._width, self._channel))
+        '''注意阻塞, 总是拿到最新的一帧, 上一帧的缓冲区在此时归还'''
+        self._release()
+        self._set_frame(self._exchange.acquire_latest())
+
+    @property
+    def frame_stats(self) -> dict[str, int]:
+        '''published: 发布的帧数, consumed: 主进程拿到的帧数, dropped: 未被拿到就被更新帧取代的帧数'''
+        return self._exchange.stats
@@ -1,73 +1,104 @@
-import time
-import queue
 import logging
-from collections import deque
-from multiprocessing import Process, Queue
-from modules.io.communication import Communicator, Status
+from multiprocessing import Process
+from multiprocessing.connection import wait
+from modules.io.communication import Communicator, Status, MCU_RATE_HZ
 from modules.io.context_manager import ContextManager
-from modules.tools import clear_queue
+from modules.io.attitude import AttitudeHistory
+from modules.io.status_ring import StatusRing
+from modules.io.clock_sync import ClockSync, CLOCK_STATS_FIELDS, format_stats
+from modules.io.quit_signal import QuitSignal
+from modules.io import process_profile
 
 
-def receive(port: str, tx_queue: Queue, quit_queue: Queue) -> None:
+def receive(port: str, ring: StatusRing, quit_signal: QuitSignal) -> None:
     logging.info('Receive process started.')
 
-    buffer = []
     with Communicator(port, ues_tx=False) as communicator:
         while True:
-            time.sleep(1e-4)
-
             try:
-                # 判断是否退出
-                try:
-                    quit = quit_queue.get_nowait()
-                    if quit:
-                        break
-                except queue.Empty:
-                    pass
-
-                # 接收机器人状态
-                success, status = communicator.read_no_wait(debug=False)
-                if not success:
+                # 阻塞等待串口可读或退出
+                ready = wait([communicator, quit_signal])
+                if quit_signal in ready:
+                    break
+
+                # 接收机器人状态, 不完整的帧留在解析器中等下一次可读
+                frames = communicator.read_frames(debug=False)
+                if len(frames) == 0:
                     continue
 
-                buffer.append((communicator.read_time_s, status))
-
-                try:
-                    tx_queue.put_nowait(buffer)
-                    buffer = []
-                except queue.Full:
-                    pass
+                ring.write(frames)
 
             except OSError:
                 logging.warning('RxCommunicator lost.')
                 communicator.reopen()
 
-    clear_queue(tx_queue)
-    clear_queue(quit_queue)
+        summary = ' '.join(f'{name}={value}' for name, value in communicator.parser_stats.items())
+        logging.info(f'Frame parser: {summary}')
 
     logging.info('Receive process ended.')
 
 
 class ParallelRxCommunicator(ContextManager):
-    def __init__(self, port: str) -> None:
-        self._rx_queue = Queue(maxsize=1)
-        self._quit_queue = Queue()
-        self._process = Process(target=receive, args=(port, self._rx_queue, self._quit_queue))
+    def __init__(self, port: str, sync_clock: bool = True, mcu_rate_hz: float = MCU_RATE_HZ) -> None:
+        '''
+        sync_clock: 用下位机的stamp校正每个样本的时刻, 见ClockSync;
+        mcu_rate_hz: 下位机标称发送频率, 用于估计时钟漂移.
+        '''
+        self._ring = StatusRing()
+        self._quit_signal = QuitSignal()
+        self._process = Process(target=receive, name='receive', args=(port, self._ring, self._quit_signal))
 
         self._process.start()
+        process_profile.apply(self._process.name, self._process.pid)
+
+        self._init_reader(sync_clock, mcu_rate_hz)
+
+    def _init_reader(self, sync_clock: bool, mcu_rate_hz: float) -> None:
+        '''主进程一侧读取self._ring的状态'''
+        self._next_index = 0
+        self._clock_sync = ClockSync(mcu_rate_hz=mcu_rate_hz) if sync_clock else None
 
-        self.history: deque[tuple[float, Status]] = deque(maxlen=1000)
+        self.attitude = AttitudeHistory()
         self.latest_read_time_s: float = None
         self.latest_status: Status = None
+        self.lost_count = 0  # 主进程来不及读取而被覆盖的样本数
+
+    def _log_reader(self) -> None:
+        logging.info(f'{type(self).__name__} closed: received={self._ring.count} lost={self.lost_count}')
+        if self._clock_sync is not None:
+            logging.info(f'Clock sync: {format_stats(self.clock_stats)}')
 
     def _close(self) -> None:
         '''注意阻塞'''
-        self._quit_queue.put(True)
+        self._quit_signal.set()
         self._process.join()
-        logging.info('ParallelRxCommunicator closed.')
-
-    def update(self) -> None:
-        '''注意阻塞'''
-        buffer = self._rx_queue.get()
-        self.history.extend(buffer)
-        self.latest_read_time_s, self.latest_status = self.history[-1]
+        self._log_reader()
+
+    def update(self, timeout_s: float | None = None) -> bool:
+        '''
+        读取接收进程写入的所有新样本, 有新样本时不阻塞.
+        没有新样本时最多等待timeout_s, None时一直等待, 超时返回False.
+        '''
+        if not self._ring.wait(self._next_index, timeout_s):
+            return False
+
+        records, self._next_index, lost = self._ring.read(self._next_index)
+        self.lost_count += lost
+        if len(records) == 0:
+            return False
+
+        if self._clock_sync is not None:
+            records['time_s'] = self._clock_sync.correct(records['arrival_time_s'], records['stamp'])
+
+        time_s, yaw_degree, pitch_degree, bullet_speed, flag, stamp, _ = records[-1].tolist()
+        self.latest_read_time_s = time_s
+        self.latest_status = (stamp, yaw_degree, pitch_degree, bullet_speed, flag)
+
+        self.attitude.extend_records(records)
+        return True
+
+    @property
+    def clock_stats(self) -> dict[str, float]:
+        if self._clock_sync is None:
+            return {}
+        return dict(zip(CLOCK_STATS_FIELDS, self._clock_sync.stats()))
@@ -0,0 +1,102 @@
+import math
+import ctypes
+import logging
+from multiprocessing import Process, Pipe, BoundedSemaphore, RawArray, RawValue
+from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Semaphore
+from modules.io.communication import Communicator, MCU_RATE_HZ
+from modules.io.status_ring import StatusRing
+from modules.io.parallel_rx_communicator import ParallelRxCommunicator
+from modules.io.parallel_tx_communicator import ParallelTxCommunicator, Transmitter, wait_ready, handle_messages, MAX_PENDING_MESSAGES
+from modules.io.fire_scheduler import FIRE_STATS_FIELDS
+from modules.io.trace import TraceRing
+from modules.io import process_profile
+from modules.clock import Clock, real_clock
+
+
+def communicate(
+    port: str, ring: StatusRing, rx_connection: Connection, pending: Semaphore, stats: RawArray, write_time_s: RawValue,
+    stream_hz: float, trace_ring: TraceRing | None, clock: Clock = real_clock
+) -> None:
+    '''
+    在一个进程中收发同一个串口: 同时等待串口可读, 新消息, 下一个开火时刻和下一次外推.
+    消息与transmit相同, 收到的状态写入ring. 接收时刻使用time.time()时钟, 写入时刻使用clock.time(), 真实时钟下二者相同.
+    '''
+    logging.info('Serial process started.')
+
+    with Communicator(port) as communicator:
+        transmitter = Transmitter(communicator, stream_hz, trace_ring, clock)
+
+        quit = False
+        while not quit:
+            try:
+                ready = wait_ready([communicator, rx_connection], transmitter.timeout_s())
+
+                if rx_connection in ready:
+                    quit = handle_messages(rx_connection, pending, transmitter)
+
+                transmitter.service()
+
+                # 接收机器人状态, 不完整的帧留在解析器中等下一次可读
+                if communicator in ready:
+                    frames = communicator.read_frames(debug=False)
+                    if len(frames) > 0:
+                        ring.write(frames)
+
+                stats[:] = transmitter.scheduler.stats()
+                if transmitter.write_time_s is not None:
+                    write_time_s.value = transmitter.write_time_s
+
+            except OSError:
+                # 收发共用一个重连策略
+                logging.warning('Communicator lost.')
+                communicator.reopen()
+
+        summary = ' '.join(f'{name}={value}' for name, value in communicator.parser_stats.items())
+        logging.info(f'Frame parser: {summary}')
+
+    transmitter.log_stats()
+    logging.info('Serial process ended.')
+
+
+class ParallelSerialCommunicator(ParallelRxCommunicator, ParallelTxCommunicator):
+    '''用一个进程收发同一个串口, 接收接口与ParallelRxCommunicator一致, 发送接口与ParallelTxCommunicator一致'''
+
+    def __init__(
+        self, port: str, stream_hz: float = 500, trace_ring: TraceRing | None = None, sync_clock: bool = True,
+        clock: Clock = real_clock, mcu_rate_hz: float = MCU_RATE_HZ
+    ) -> None:
+        '''
+        stream_hz: 跟踪目标时发送瞄准点的频率;
+        sync_clock: 用下位机的stamp校正每个样本的时刻, 见ClockSync;
+        mcu_rate_hz: 下位机标称发送频率, 用于估计时钟漂移;
+        clock: 发送调度所用的时钟.
+        '''
+        self._clock = clock
+        self._ring = StatusRing()
+        self._rx_connection, self._tx_connection = Pipe(duplex=False)
+        self._pending = BoundedSemaphore(MAX_PENDING_MESSAGES)
+        self._stats = RawArray(ctypes.c_double, len(FIRE_STATS_FIELDS))
+        self._write_time_s = RawValue(ctypes.c_double, math.nan)
+        self._process = Process(
+            target=communicate,
+            name='serial',
+            args=(port, self._ring, self._rx_connection, self._pending, self._stats, self._write_time_s, stream_hz, trace_ring, clock)
+        )
+
+        self._process.start()
+        process_profile.apply(self._process.name, self._process.pid)
+
+        self._init_reader(sync_clock, mcu_rate_hz)
+
+    def _close(self) -> None:
+        '''注意阻塞'''
+        self._tx_connection.send(None)
+        self._process.join()
+        self._log_reader()
+
+    @property
+    def latest_write_time_s(self) -> float | None:
+        '''最后一次写入串口的时刻, 与latest_read_time_s为同一时钟'''
+        write_time_s = self._write_time_s.value
+        return None if math.isnan(write_time_s) else write_time_s
@@ -1,87 +1,264 @@
 import time
-import queue
+import ctypes
 import logging
-from collections import deque
-from multiprocessing import Process, Queue
-from modules.io.communication import Communicator, Command, TX_FLAG_EMPTY, TX_FLAG_FIRE
+from collections.abc import Callable
+from multiprocessing import Process, Pipe, BoundedSemaphore, RawArray
+from multiprocessing.connection import Connection, wait
+from multiprocessing.synchronize import Semaphore
+from modules.io.communication import Communicator, Command, apply_gun_offset, TX_FLAG_EMPTY, TX_FLAG_FIRE
 from modules.io.context_manager import ContextManager
-from modules.tools import clear_queue
+from modules.io import process_profile
+from modules.io.fire_scheduler import FireScheduler, FIRE_STATS_FIELDS
+from modules.io.trace import TraceRing, Stage
+from modules.autoaim.targets.target import Target
+from modules.clock import Clock, real_clock
 
 
-def transmit(port: str, rx_queue: Queue, quit_queue: Queue) -> None:
+FIRE_TAG = 'fire'
+MAX_PENDING_MESSAGES = 16
+poll_resolution_s = 1e-3
+aim_error_log_interval_s = 1.0  # 外推失败日志的最小间隔
+
+
+class Tracking:
+    '''发送进程中持续外推的目标'''
+
+    def __init__(self, target: Target, bullet_speed_m_per_s: float, gun_up_degree: float, gun_right_degree: float, trace_id: int | None) -> None:
+        self.target = target
+        self.trace_id = trace_id
+        self.bullet_speed_m_per_s = bullet_speed_m_per_s
+        self.gun_up_degree = gun_up_degree
+        self.gun_right_degree = gun_right_degree
+
+        # 立即开火的命令每次刷新目标后最多发送一次, 与逐帧发送时的开火频率一致
+        self.fire_now_allowed = True
+
+    def aim(self) -> tuple[Command, float | None]:
+        aim_point_in_imu_m, fire_time_s = self.target.aim(self.bullet_speed_m_per_s)
+        x, y, z = apply_gun_offset(aim_point_in_imu_m, self.gun_up_degree, self.gun_right_degree)
+
+        flag = TX_FLAG_EMPTY
+        if fire_time_s == 0:
+            fire_time_s = None
+            if self.fire_now_allowed:
+                flag = TX_FLAG_FIRE
+                self.fire_now_allowed = False
+
+        return (x, y, z, flag), fire_time_s
+
+
+def to_monotonic(time_s: float, clock: Clock = real_clock) -> float:
+    '''clock.time()时钟换算到clock.monotonic()时钟'''
+    return time_s - clock.time() + clock.monotonic()
+
+
+class Transmitter:
+    '''
+    发送进程的状态: 定时开火与目标外推, 发送进程和串口收发进程共用.
+    communicator: 已打开的Communicator或与其接口一致的对象
+    clock: 开火定时和外推频率所用的时钟, 离线时可以用SimulatedClock逐步推进
+    '''
+
+    def __init__(self, communicator: Communicator, stream_hz: float, trace_ring: TraceRing | None, clock: Clock = real_clock) -> None:
+        self.communicator = communicator
+        self.clock = clock
+        self.scheduler = FireScheduler()
+        self._trace_ring = trace_ring
+        self._tracking: Tracking = None
+        self._stream_period_s = 1 / stream_hz
+        self._next_stream_s = clock.monotonic()
+        self._traced_id: int = None
+        self._next_error_log_s = -float('inf')
+
+        self.write_time_s: float = None  # 最后一次写入串口的时刻, clock.time()时钟, 与接收时刻可以直接比较
+
+    def _trace(self, trace_id: int | None, stage: Stage) -> None:
+        if self._trace_ring is not None and trace_id is not None:
+            self._trace_ring.write(trace_id, stage)
+
+    def _write(self, command: Command) -> None:
+        self.communicator.send(*command)
+        self.write_time_s = self.clock.time()
+
+    def _send(self, command: Command, deadline_s: float | None, trace_id: int | None) -> None:
+        self._write(command)
+
+        # 每帧只记录第一次写入串口的时刻
+        if trace_id != self._traced_id:
+            self._trace(trace_id, Stage.WRITTEN)
+            self._traced_id = trace_id
+
+        # 开火时使用最新的瞄准点
+        x, y, z, _ = command
+        fire_command = (x, y, z, TX_FLAG_FIRE)
+        if deadline_s is None:
+            self.scheduler.update(FIRE_TAG, fire_command)
+        else:
+            self.scheduler.schedule(FIRE_TAG, fire_command, deadline_s, self.clock.monotonic())
+
+    def timeout_s(self) -> float | None:
+        '''距下一个开火时刻或下一次外推的时间, 没有时为None'''
+        now_s = self.clock.monotonic()
+        timeout_s = self.scheduler.timeout_s(now_s)
+        if self._tracking is not None:
+            stream_timeout_s = max(self._next_stream_s - now_s, 0.0)
+            timeout_s = stream_timeout_s if timeout_s is None else min(timeout_s, stream_timeout_s)
+        return timeout_s
+
+    def handle(self, message: tuple) -> None:
+        kind = message[0]
+        if kind == 'shoot':
+            self._tracking = None
+            _, command, deadline_s, trace_id = message
+            self._send(command, deadline_s, trace_id)
+
+        elif kind == 'track':
+            if self._tracking is None:
+                self._next_stream_s = self.clock.monotonic()
+            _, self._tracking = message
+
+        elif kind == 'cancel':
+            self._tracking = None
+            self.scheduler.cancel(FIRE_TAG)
+
+    def service(self) -> None:
+        '''发送到期的定时命令和外推的瞄准点'''
+        for command in self.scheduler.pop_due(self.clock.monotonic()):
+            self._write(command)
+            logging.debug('Scheduled command sent.')
+
+        # 外推目标并发送, 在定时命令之后以免到期的开火被下一个时间窗口替换
+        now_s = self.clock.monotonic()
+        tracking = self._tracking
+        if tracking is not None and now_s >= self._next_stream_s:
+            self._next_stream_s = max(self._next_stream_s + self._stream_period_s, now_s)
+            try:
+                command, fire_time_s = tracking.aim()
+                if tracking.trace_id != self._traced_id:
+                    self._trace(tracking.trace_id, Stage.AIM)
+                self._send(command, None if fire_time_s is None else to_monotonic(fire_time_s, self.clock), tracking.trace_id)
+            except Exception as error:
+                # 打不到或外推出错时停止跟随该目标, 不再用旧的瞄准点开火, 等待下一次track
+                self._tracking = None
+                self.scheduler.cancel(FIRE_TAG)
+                if now_s >= self._next_error_log_s:
+                    self._next_error_log_s = now_s + aim_error_log_interval_s
+                    logging.warning(f'Stream aim failed, tracking dropped: {error!r}')
+
+    def log_stats(self) -> None:
+        summary = ' '.join(f'{name}={value:.6g}' for name, value in zip(FIRE_STATS_FIELDS, self.scheduler.stats()))
+        logging.info(f'Fire scheduler: {summary}')
+
+
+def wait_ready(objects: list, timeout_s: float | None) -> list:
+    '''wait基于poll, 超时精度为1ms, 不足1ms的部分用sleep补齐'''
+    if timeout_s is not None and timeout_s < poll_resolution_s:
+        time.sleep(timeout_s)
+        return wait(objects, 0)
+    return wait(objects, None if timeout_s is None else timeout_s - poll_resolution_s)
+
+
+def handle_messages(rx_connection: Connection, pending: Semaphore, transmitter: Transmitter) -> bool:
+    '''处理管道中所有消息, 收到退出消息时返回True'''
+    while rx_connection.poll():
+        message = rx_connection.recv()
+        if message is None:
+            return True
+        pending.release()
+        transmitter.handle(message)
+    return False
+
+
+def transmit(
+    port: str, rx_connection: Connection, pending: Semaphore, stats: RawArray, stream_hz: float, trace_ring: TraceRing | None,
+    communicator_type: Callable[..., Communicator] = Communicator, clock: Clock = real_clock
+) -> None:
+    '''
+    rx_connection收到的消息:
+    ('shoot', command, deadline_s, trace_id): 立即发送command, deadline_s不为None时在该时刻(clock.monotonic)开火;
+    ('track', Tracking): 以stream_hz的频率外推目标并发送瞄准点;
+    ('cancel',): 停止外推, 取消待发送的开火命令;
+    None: 退出.
+    communicator_type: 创建与Communicator接口一致的对象, 离线回放时用于记录发送的命令.
+    '''
     logging.info('Transmit process started.')
 
-    scheduled_command: Command = None
-    scheduled_time_s: float = None
-    with Communicator(port, use_rx=False) as communicator:
-        while True:
-            time.sleep(1e-4)
+    with communicator_type(port, use_rx=False) as communicator:
+        transmitter = Transmitter(communicator, stream_hz, trace_ring, clock)
 
+        quit = False
+        while not quit:
             try:
-                # 判断是否退出
-                try:
-                    quit = quit_queue.get_nowait()
-                    if quit:
-                        break
-                except queue.Empty:
-                    pass
-
-                # 发送命令
-                try:
-                    command, fire_time_s = rx_queue.get_nowait()
-                    communicator.send(*command)
-
-                    x, y, z, _ = command
-                    scheduled_command = (x, y, z, TX_FLAG_FIRE)
-
-                    if scheduled_time_s is None:
-                        scheduled_time_s = fire_time_s
-
-                except queue.Empty:
-                    pass
-
-                # 发送定时命令
-                if scheduled_time_s is not None:
-                    current_time_s = time.time()
-                    dt_s = scheduled_time_s - current_time_s
-                    if abs(dt_s) < 1e-3:
-                        print(f'Scheduled command sent.')
-                        communicator.send(*scheduled_command)
-                        scheduled_time_s = None
-                    elif dt_s < 0:
-                        print(f'Scheduled command expired over {-dt_s}s.')
-                        scheduled_time_s = None
-                    elif dt_s > 1:
-                        print(f'Scheduled command is so far over {dt_s}s.')
-                        scheduled_time_s = None
+                # 阻塞等待新消息, 下一个开火时刻或下一次外推
+                if wait_ready([rx_connection], transmitter.timeout_s()):
+                    quit = handle_messages(rx_connection, pending, transmitter)
+
+                transmitter.service()
+                stats[:] = transmitter.scheduler.stats()
 
             except OSError:
                 logging.warning('TxCommunicator lost.')
                 communicator.reopen()
 
-    clear_queue(rx_queue)
-    clear_queue(quit_queue)
-
+    transmitter.log_stats()
     logging.info('Transmit process ended.')
 
 
 class ParallelTxCommunicator(ContextManager):
-    def __init__(self, port: str) -> None:
-        self._tx_queue = Queue(maxsize=1)
-        self._quit_queue = Queue()
-        self._process = Process(target=transmit, args=(port, self._tx_queue, self._quit_queue))
+    def __init__(
+        self, port: str, stream_hz: float = 500, trace_ring: TraceRing | None = None,
+        communicator_type: Callable[..., Communicator] = Communicator, clock: Clock = real_clock
+    ) -> None:
+        '''
+        stream_hz: 跟踪目标时发送瞄准点的频率;
+        clock: 开火定时和外推所用的时钟.
+        '''
+        self._clock = clock
+        self._rx_connection, self._tx_connection = Pipe(duplex=False)
+        self._pending = BoundedSemaphore(MAX_PENDING_MESSAGES)
+        self._stats = RawArray(ctypes.c_double, len(FIRE_STATS_FIELDS))
+        self._process = Process(
+            target=transmit,
+            name='transmit',
+            args=(port, self._rx_connection, self._pending, self._stats, stream_hz, trace_ring, communicator_type, clock)
+        )
 
         self._process.start()
+        process_profile.apply(self._process.name, self._process.pid)
 
     def _close(self) -> None:
         '''注意阻塞'''
-        self._quit_queue.put(True)
+        self._tx_connection.send(None)
         self._process.join()
         logging.info('ParallelTxCommunicator closed.')
 
-    def send(self, x_in_imu_mm: float, y_in_imu_mm: float, z_in_imu_mm: float, flag: int = TX_FLAG_EMPTY, fire_time_s: float | None = None) -> None:
+    def _put(self, message: tuple) -> bool:
+        # 发送进程来不及处理时丢弃, 不阻塞主循环
+        if not self._pending.acquire(block=False):
+            logging.debug(f'ParallelTxCommunicator pipe full!')
+            return False
+        self._tx_connection.send(message)
+        return True
+
+    def send(
+        self, x_in_imu_mm: float, y_in_imu_mm: float, z_in_imu_mm: float, flag: int = TX_FLAG_EMPTY,
+        fire_time_s: float | None = None, trace_id: int | None = None
+    ) -> bool:
+        '''fire_time_s: clock.time()时钟下的开火时刻, 换算到单调时钟后交给发送进程'''
         command = (x_in_imu_mm, y_in_imu_mm, z_in_imu_mm, flag)
-        try:
-            self._tx_queue.put_nowait((command, fire_time_s))
-        except queue.Full:
-            logging.debug(f'ParallelCommunicator tx_queue full!')
+        deadline_s = None if fire_time_s is None else to_monotonic(fire_time_s, self._clock)
+        return self._put(('shoot', command, deadline_s, trace_id))
+
+    def track(
+        self, target: Target, bullet_speed_m_per_s: float, gun_up_degree: float, gun_right_degree: float,
+        trace_id: int | None = None
+    ) -> bool:
+        '''刷新目标状态, 发送进程据此持续外推瞄准点, 直到cancel_fire或send'''
+        return self._put(('track', Tracking(target, bullet_speed_m_per_s, gun_up_degree, gun_right_degree, trace_id)))
+
+    def cancel_fire(self) -> None:
+        self._put(('cancel',))
+
+    @property
+    def fire_stats(self) -> dict[str, float]:
+        return dict(zip(FIRE_STATS_FIELDS, self._stats))
@@ -0,0 +1,113 @@
+import os
+import logging
+import functools
+import multiprocessing
+import configs.process_profile as config
+
+
+_policy_names = {os.SCHED_OTHER: 'OTHER', os.SCHED_FIFO: 'FIFO', os.SCHED_RR: 'RR', os.SCHED_BATCH: 'BATCH', os.SCHED_IDLE: 'IDLE'}
+
+
+def online_cores() -> set[int]:
+    return set(range(os.cpu_count()))
+
+
+_warned_roles: set[str] = set()
+
+
+def _configured_cores(role: str) -> set[int]:
+    cores = config.profile[role]['cores']
+    return online_cores() if cores is None else set(cores) & online_cores()
+
+
+@functools.cache
+def _main_cores() -> frozenset[int]:
+    return frozenset(_configured_cores('main'))
+
+
+def cores_of(role: str) -> set[int] | None:
+    '''role应绑定的核, 配置的核都不可用时返回None, 每个角色只警告一次'''
+    cores = _configured_cores(role)
+    if config.isolate_main and role != 'main':
+        cores -= _main_cores()
+
+    if not cores:
+        if role not in _warned_roles:
+            _warned_roles.add(role)
+            logging.warning(f'No core is available for {role}, placement ignored.')
+        return None
+    return cores
+
+
+def apply(role: str, pid: int = 0) -> None:
+    '''按configs.process_profile放置进程pid(0为当前进程), 权限不足等失败只打印警告'''
+    if not config.enable or role not in config.profile:
+        return
+
+    placement = config.profile[role]
+
+    try:
+        cores = cores_of(role)
+        if cores is not None:
+            os.sched_setaffinity(pid, cores)
+
+        if placement['fifo_priority'] is None:
+            os.sched_setscheduler(pid, os.SCHED_OTHER, os.sched_param(0))
+        else:
+            os.sched_setscheduler(pid, os.SCHED_FIFO, os.sched_param(placement['fifo_priority']))
+
+        os.setpriority(os.PRIO_PROCESS, pid, placement['nice'])
+
+    except OSError as error:
+        logging.warning(f'Failed to place {role}: {error}')
+
+
+def _read_status(pid: int) -> dict[str, str]:
+    with open(f'/proc/{pid}/status') as f:
+        return dict(line.rstrip('\n').split(':\t', 1) for line in f if ':\t' in line)
+
+
+def _context_switches(pid: int) -> tuple[int, int]:
+    '''进程所有线程的主动与被动(被抢占)上下文切换次数'''
+    voluntary, involuntary = 0, 0
+    for tid in os.listdir(f'/proc/{pid}/task'):
+        try:
+            status = _read_status(f'{pid}/task/{tid}')
+        except FileNotFoundError:
+            continue
+        voluntary += int(status['voluntary_ctxt_switches'])
+        involuntary += int(status['nonvoluntary_ctxt_switches'])
+    return voluntary, involuntary
+
+
+def report() -> str:
+    '''从/proc读取主进程及所有子进程的实际放置与上下文切换'''
+    # 同一角色可以有多个进程(例如encode)
+    processes = [('main', os.getpid())] + [(p.name, p.pid) for p in multiprocessing.active_children()]
+
+    lines = []
+    for role, pid in processes:
+        try:
+            status = _read_status(pid)
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            voluntary, involuntary = _context_switches(pid)
+        except FileNotFoundError:
+            continue
+
+        # 字段序号见man proc, fields从第3个字段state开始
+        nice, last_core, rt_priority, policy = int(fields[16]), int(fields[36]), int(fields[37]), int(fields[38])
+        lines.append(
+            f'{role}({pid}): cores={status["Cpus_allowed_list"]} last_core={last_core} '
+            f'policy={_policy_names.get(policy, policy)} rt_priority={rt_priority} nice={nice} '
+            f'voluntary_switches={voluntary} involuntary_switches={involuntary}'
+        )
+
+    try:
+        with open('/sys/devices/system/cpu/isolated') as f:
+            isolated = f.read().strip() or 'none'
+        lines.append(f'isolcpus: {isolated}')
+    except FileNotFoundError:
+        pass
+
+    return '\n'.join(lines)
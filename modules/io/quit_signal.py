@@ -0,0 +1,24 @@
+from multiprocessing import Pipe
+
+
+class QuitSignal:
+    '''
+    跨进程的退出信号, 基于管道.
+    可以与串口等文件描述符一起用multiprocessing.connection.wait阻塞等待, 子进程无需轮询.
+    '''
+
+    def __init__(self) -> None:
+        self._reader, self._writer = Pipe(duplex=False)
+
+    def set(self) -> None:
+        self._writer.send(True)
+
+    def is_set(self) -> bool:
+        return self._reader.poll()
+
+    def wait(self, timeout_s: float | None = None) -> bool:
+        '''阻塞直到退出或超时, 可代替time.sleep'''
+        return self._reader.poll(timeout_s)
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
@@ -1,24 +1,42 @@
 import os
 import cv2
+import math
 import time
-import queue
+import ctypes
 import logging
 import datetime
+import collections
 import numpy as np
-from multiprocessing import Process, Queue, shared_memory
-from modules.tools import clear_queue
+from multiprocessing import Process, Queue, RawArray, RawValue, shared_memory
 from modules.io.context_manager import ContextManager
+from modules.io import process_profile
+from modules.io.bayer import BayerImage
+from modules.io.slot_ring import SlotRing, DROP_NEWEST
+from modules.io.frame_exchange import FrameExchange
+from modules.io.parallel_camera import ParallelCamera
+from modules.io.recording import RecordingWriter, encode
+from modules.clock import Clock, real_clock
 
 
 H, W = 1024, 1280
-FPS = 30
 DIR = 'recordings'
 BUFFER_NUM = 4
+ENCODER_NUM = 2
+STATUS_LEN = 5  # (img_time_s, yaw_degree, pitch_degree, bullet_speed, flag)
 
+ENCODER_STATS_FIELDS = ('frames', 'encode_total_s')
 
-def record(buffer_names: tuple[str], index_with_status_queue: Queue, quit_queue: Queue) -> None:
-    logging.info('Record started.')
 
+def encode_frames(
+    worker: int, buffer_names: tuple[str], exchange: FrameExchange | None, bayer_pattern: RawArray, ring: SlotRing,
+    format: str, results: Queue, stats: RawArray
+) -> None:
+    '''
+    编码进程, 可以有多个: 从ring取帧编码, 把(取帧序号, 数据, 帧形状, 状态)交给write_frames.
+    exchange不为None时帧在相机的共享内存中, 编码后归还; 否则在buffer_names的共享内存中.
+    results有界, 结果交出后才归还槽位, 写盘跟不上时槽位被占满, 由ring按丢帧策略丢帧并计数.
+    ring关闭后编码完剩余的帧, 最后交出None表示结束.
+    '''
     imgs: list[cv2.Mat] = []
     buffers: list[shared_memory.SharedMemory] = []
     for name in buffer_names:
@@ -27,97 +45,357 @@ def record(buffer_names: tuple[str], index_with_status_queue: Queue, quit_queue:
         buffers.append(buffer)
         imgs.append(img)
 
-    if not os.path.isdir(DIR):
-        os.mkdir(DIR)
-
-    filename = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    video_path = f'{DIR}/{filename}.avi'
-    status_path = f'{DIR}/{filename}.txt'
-
-    video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), FPS, (W, H))
-    status_writer = open(status_path, 'w')
+    offset = worker * len(ENCODER_STATS_FIELDS)
 
     try:
         while True:
-            # 判断是否退出
-            try:
-                quit = quit_queue.get_nowait()
-                if quit:
-                    break
-            except queue.Empty:
-                pass
-
-            try:
-                index, status = index_with_status_queue.get_nowait()
+            # 阻塞等待下一帧
+            slot = ring.take()
+            if slot is None:
+                break
+
+            index, seq, (buffer_index, *status) = slot
+            status[-1] = int(status[-1])
+            start_s = time.perf_counter()
+
+            if exchange is None:
                 img = imgs[index]
-                video_writer.write(img)
-                status_writer.write(f'{status}\n')
-            except queue.Empty:
-                pass
+            else:
+                buffer_index = int(buffer_index)
+                img = exchange.array(buffer_index)
+                if img.ndim == 2 and format == 'jpeg':
+                    img = BayerImage(img, bayer_pattern.value.decode()).bgr()
+
+            data = encode(img, format)
+
+            if exchange is not None:
+                exchange.release(buffer_index)
+
+            encode_time_s = time.perf_counter() - start_s
+            stats[offset] += 1
+            stats[offset + 1] += encode_time_s
+
+            # 写盘跟不上时在这里阻塞, 期间继续占用槽位
+            results.put((seq, data, img.shape, tuple(status)))
+            ring.done(index, encode_time_s)
 
     except KeyboardInterrupt:
         pass
 
     finally:
-        video_writer.release()
-        logging.info(f'Video is saved at {video_path}')
-        status_writer.close()
-        logging.info(f'State is saved at {status_path}')
+        results.put(None)
 
     for buffer in buffers:
         buffer.close()
 
-    clear_queue(index_with_status_queue)
-    clear_queue(quit_queue)
+
+class PreRoll:
+    '''
+    事件触发录制: 按顺序经过push的帧只有落在事件窗口[t - pre_roll_s, t + post_roll_s]内的才写入,
+    其余的帧在内存中保留pre_roll_s, 之后的事件可以把它们补写进去.
+    '''
+
+    def __init__(self, pre_roll_s: float, post_roll_s: float) -> None:
+        self._pre_roll_s = pre_roll_s
+        self._post_roll_s = post_roll_s
+        self._frames: collections.deque[tuple[bytes, tuple[float, ...]]] = collections.deque()
+        self._end_s = -math.inf  # 已触发窗口的结束时刻
+        self.discarded = 0
+
+    def trigger(self, time_s: float) -> list[tuple[bytes, tuple[float, ...]]]:
+        '''return: 内存中落在新窗口内的帧, 按顺序写入'''
+        start_s = time_s - self._pre_roll_s
+        self._end_s = max(self._end_s, time_s + self._post_roll_s)
+
+        # 更早的帧之后只能乱序写入, 直接丢弃
+        while self._frames and self._frames[0][1][0] < start_s:
+            self._frames.popleft()
+            self.discarded += 1
+
+        frames = list(self._frames)
+        self._frames.clear()
+        return frames
+
+    def push(self, frame: tuple[bytes, tuple[float, ...]]) -> list[tuple[bytes, tuple[float, ...]]]:
+        '''frame: (数据, 状态), 状态的第一项为img_time_s. return: 需要写入的帧'''
+        time_s = frame[1][0]
+        if time_s <= self._end_s:
+            return [frame]
+
+        self._frames.append(frame)
+        while self._frames[0][1][0] < time_s - self._pre_roll_s:
+            self._frames.popleft()
+            self.discarded += 1
+        return []
+
+    def close(self) -> None:
+        '''内存中剩余的帧不再有事件, 计入丢弃'''
+        self.discarded += len(self._frames)
+        self._frames.clear()
+
+
+def write_frames(
+    path: str, format: str, bayer_pattern: RawArray, results: Queue, events: Queue, worker_num: int,
+    pre_roll_s: float | None, post_roll_s: float, written: RawValue
+) -> None:
+    '''
+    按取帧序号重组各编码进程的结果, 顺序写入录像, 所有编码进程结束后退出.
+    events中的事件(time_s, reason)记录到录像的events.txt;
+    pre_roll_s不为None时只写入事件前后的帧, 见PreRoll;
+    written: 实际写入录像的帧数.
+    '''
+    logging.info('Record started.')
+
+    # 相机进程启动后才知道Bayer排列, 收到第一帧时再创建
+    writer: RecordingWriter = None
+    pending: dict[int, tuple[bytes, tuple[float, ...], tuple[int, ...]]] = {}
+    next_seq = 0
+    running = worker_num
+    shape: tuple[int, ...] = None
+
+    pre_roll = None if pre_roll_s is None else PreRoll(pre_roll_s, post_roll_s)
+    os.makedirs(path, exist_ok=True)
+    event_file = open(os.path.join(path, 'events.txt'), 'w')
+
+    def write(frames: list[tuple[bytes, tuple[float, ...]]]) -> None:
+        nonlocal writer
+        if writer is None and frames:
+            pattern = bayer_pattern.value.decode() if format == 'bayer' else None
+            writer = RecordingWriter(path, format, shape, pattern)
+        for data, status in frames:
+            writer.write(data, status)
+            written.value += 1
+
+    events_open = True
+
+    def handle_events(block: bool) -> None:
+        '''block: 一直读到主进程关闭时发送的None'''
+        nonlocal events_open
+        while events_open and (block or not events.empty()):
+            event = events.get()
+            if event is None:
+                events_open = False
+                break
+
+            time_s, reason = event
+            event_file.write(f'{(time_s, reason)}\n')
+            if pre_roll is not None:
+                write(pre_roll.trigger(time_s))
+
+    try:
+        while running > 0:
+            result = results.get()
+            handle_events(block=False)
+            if result is None:
+                running -= 1
+                continue
+
+            seq, data, shape, status = result
+            pending[seq] = (data, status)
+            while next_seq in pending:
+                frame = pending.pop(next_seq)
+                write([frame] if pre_roll is None else pre_roll.push(frame))
+                next_seq += 1
+
+        handle_events(block=True)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        event_file.close()
+        if pre_roll is not None:
+            pre_roll.close()
+            logging.info(f'{pre_roll.discarded} frames outside event windows are discarded.')
+        if writer is not None:
+            writer.close()
+            logging.info(f'Recording is saved at {path}, {writer.frame_count} frames, {writer.byte_count / 1e6:.1f}MB')
 
     logging.info('Record ended.')
 
 
 class Recorder(ContextManager):
-    def __init__(self) -> None:
+    def __init__(
+        self, camera: ParallelCamera | None = None, drop_policy: str = DROP_NEWEST, format: str = 'jpeg',
+        worker_num: int = ENCODER_NUM, max_fps: float | None = None,
+        pre_roll_s: float | None = None, post_roll_s: float = 2.0, clock: Clock = real_clock
+    ) -> None:
+        '''
+        camera: 不为None时按引用录制该相机的帧: 占用相机的共享内存直到编码完成, 主进程不复制图像,
+                Bayer图像也由编码进程去马赛克. 同时占用的帧数为相机多于3个的缓冲区数, 否则取图进程会因没有空闲缓冲区而丢帧;
+        drop_policy: 编码跟不上时丢弃新帧(DROP_NEWEST)还是最旧的未编码帧(DROP_OLDEST);
+        format: 'jpeg'或'bayer', 'bayer'不压缩地保存原始图像, 只能按引用录制bayer模式的相机;
+        worker_num: 并行编码的进程数, 结果按帧的顺序写入;
+        max_fps: 不为None时限制录制的帧率, 超过的帧直接跳过;
+        pre_roll_s: None时录下所有帧, 否则只录下每个事件(trigger, watch, 主进程记录的错误)
+                    前pre_roll_s到后post_roll_s的帧, 其余编码后在内存中保留pre_roll_s即丢弃;
+        clock: 限制帧率, 统计帧率和事件默认时刻所用的时钟, 事件时刻与img_time_s为同一时钟.
+        录像保存为DIR下以时刻命名的目录, 格式见recording.
+        '''
+        if format == 'bayer' and (camera is None or len(camera._exchange.shape) != 2):
+            raise ValueError('Raw bayer recording requires a camera in bayer mode')
+
+        self._camera = camera
+        self._clock = clock
+        self._min_interval_s = 0 if max_fps is None else 1 / max_fps
+        self.path = os.path.join(DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+
         buffer_names: list[str] = []
         self._imgs: list[cv2.Mat] = []
         self._buffers: list[shared_memory.SharedMemory] = []
-        for _ in range(BUFFER_NUM):
-            buffer = shared_memory.SharedMemory(create=True, size=H*W*3)
-            img = np.ndarray((H, W, 3), np.uint8, buffer.buf)
-            self._buffers.append(buffer)
-            buffer_names.append(buffer.name)
-            self._imgs.append(img)
-
-        self._index_status_queue = Queue()
-        self._quit_queue = Queue()
-        self._process = Process(
-            target=record,
-            args=(buffer_names, self._index_status_queue, self._quit_queue)
-        )
-
-        self._process.start()
-        self._last_put_time = 0
-        self._last_index = -1
+        if camera is None:
+            for _ in range(max(BUFFER_NUM, worker_num)):
+                buffer = shared_memory.SharedMemory(create=True, size=H*W*3)
+                img = np.ndarray((H, W, 3), np.uint8, buffer.buf)
+                self._buffers.append(buffer)
+                buffer_names.append(buffer.name)
+                self._imgs.append(img)
+            slot_num = len(self._buffers)
+        else:
+            slot_num = camera._exchange.buffer_num - 3
+            if slot_num < worker_num:
+                logging.warning(f'Camera has {slot_num} spare buffers, only {slot_num} of {worker_num} encoders can work at once.')
+
+        # 每个槽位附带: 相机缓冲区索引(复制时为-1), 状态
+        self._ring = SlotRing(slot_num, 1 + STATUS_LEN, drop_policy)
+        self._results = Queue(maxsize=slot_num)  # 有界, 写盘的积压反映到ring的丢帧中
+        self._events = Queue()
+        self._worker_stats = RawArray(ctypes.c_double, worker_num * len(ENCODER_STATS_FIELDS))
+        self._written = RawValue(ctypes.c_int64, 0)
+        bayer_pattern = RawArray(ctypes.c_char, 8) if camera is None else camera._bayer_pattern
+
+        self._processes: list[Process] = [Process(
+            target=write_frames,
+            name='record',
+            args=(self.path, format, bayer_pattern, self._results, self._events, worker_num, pre_roll_s, post_roll_s, self._written)
+        )]
+        for worker in range(worker_num):
+            self._processes.append(Process(
+                target=encode_frames,
+                name='encode',
+                args=(
+                    worker,
+                    buffer_names,
+                    None if camera is None else camera._exchange,
+                    bayer_pattern,
+                    self._ring,
+                    format,
+                    self._results,
+                    self._worker_stats
+                )
+            ))
+
+        for process in self._processes:
+            process.start()
+            process_profile.apply(process.name, process.pid)
+
+        self._last_put_time_s = -math.inf
+        self._start_time_s = clock.monotonic()
+        self._watched: dict[str, object] = {}
+
+        # 子进程启动后再安装, 只截获主进程记录的错误
+        self._log_handler = _TriggerHandler(self)
+        logging.getLogger().addHandler(self._log_handler)
 
     def _close(self) -> None:
-        '''注意阻塞'''
-        self._quit_queue.put(True)
-        self._process.join()
+        '''注意阻塞, 在相机关闭之前调用, 以便归还占用的缓冲区'''
+        logging.getLogger().removeHandler(self._log_handler)
+        self._events.put(None)
+        self._ring.close()
+        for process in self._processes:
+            process.join()
 
         for buffer in self._buffers:
             buffer.close()
             buffer.unlink()
 
-        logging.info('Recorder closed.')
+        summary = ' '.join(f'{name}={value:.6g}' for name, value in self.stats.items())
+        logging.info(f'Recorder closed: {summary}')
+        for worker, stats in enumerate(self.worker_stats):
+            summary = ' '.join(f'{name}={value:.6g}' for name, value in stats.items())
+            logging.info(f'Encoder {worker}: {summary}')
+
+    def record(self, img: cv2.Mat | BayerImage, status: tuple[float, float, float, float, int]) -> None:
+        '''
+        status: (img_time_s, yaw_degree, pitch_degree, bullet_speed, flag).
+        按引用录制时img必须是相机当前的帧.
+        '''
+        current_time_s = self._clock.monotonic()
+        if current_time_s - self._last_put_time_s < self._min_interval_s:
+            return
+        self._last_put_time_s = current_time_s
+
+        if self._camera is not None and img is not self._camera.img:
+            raise ValueError('Only the current camera frame can be recorded by reference')
 
-    def record(self, img: cv2.Mat, status: list) -> None:
-        current_time = time.time()
-        if 1 / (current_time - self._last_put_time) > FPS:
+        slot = self._ring.acquire()
+        if slot is None:
             return
-        
-        index = self._last_index + 1
-        if index == len(self._buffers):
-            index = 0
 
-        self._imgs[index][:] = img[:]
-        self._index_status_queue.put((index, status))
+        index, dropped_meta = slot
+        if dropped_meta is not None and dropped_meta[0] >= 0:
+            # 被覆盖的帧不会再编码, 由这里归还它占用的相机缓冲区
+            self._camera._exchange.release(int(dropped_meta[0]))
+
+        if self._camera is not None:
+            buffer_index = self._camera.pin()
+        else:
+            # 只对要录下的帧去马赛克
+            if isinstance(img, BayerImage):
+                img = img.bgr()
+            self._imgs[index][:] = img
+            buffer_index = -1
+
+        self._ring.commit(index, (buffer_index, *status))
+
+    def trigger(self, reason: str, time_s: float | None = None) -> None:
+        '''
+        记录一个事件, 事件触发录制时写入其前后的帧.
+        time_s: 事件时刻, 与img_time_s为同一时钟, None时为当前时刻.
+        '''
+        self._events.put((self._clock.time() if time_s is None else time_s, reason))
+
+    def watch(self, name: str, value: object, on: object | None = None) -> None:
+        '''
+        每帧调用, value与上一次不同时触发事件, 例如recorder.watch('tracker', tracker.state).
+        on: 不为None时只在value变为on时触发.
+        '''
+        last_value = self._watched.get(name, value)
+        self._watched[name] = value
+        if value != last_value and (on is None or value == on):
+            self.trigger(f'{name}: {last_value} -> {value}')
+
+    @property
+    def stats(self) -> dict[str, float]:
+        '''
+        committed, encoded, dropped, encode_total_s, encode_max_s, queued, 以及written(实际写入录像的帧数).
+        录下所有帧时written最终等于encoded, pre_roll_s不为None时只包括事件前后的帧.
+        '''
+        stats = self._ring.stats
+        stats['written'] = self._written.value
+        return stats
+
+    @property
+    def worker_stats(self) -> list[dict[str, float]]:
+        '''每个编码进程的frames, encode_total_s, 以及fps(实际录制帧率)和capacity_fps(按编码耗时算的最大帧率)'''
+        elapsed_s = self._clock.monotonic() - self._start_time_s
+        size = len(ENCODER_STATS_FIELDS)
+        worker_stats = []
+        for offset in range(0, len(self._worker_stats), size):
+            stats = dict(zip(ENCODER_STATS_FIELDS, self._worker_stats[offset:offset + size]))
+            stats['fps'] = stats['frames'] / elapsed_s
+            stats['capacity_fps'] = stats['frames'] / stats['encode_total_s'] if stats['encode_total_s'] > 0 else math.nan
+            worker_stats.append(stats)
+        return worker_stats
+
+
+class _TriggerHandler(logging.Handler):
+    '''主进程记录ERROR及以上的日志(例如logging.exception)时触发录制'''
+
+    def __init__(self, recorder: Recorder) -> None:
+        super().__init__(logging.ERROR)
+        self._recorder = recorder
 
-        self._last_put_time = current_time
-        self._last_index = index
+    def emit(self, record: logging.LogRecord) -> None:
+        # 使用录像器的时钟而不是record.created, 离线回放时事件时刻与录像时间戳一致
+        self._recorder.trigger(f'{record.levelname}: {record.getMessage()}')
@@ -0,0 +1,256 @@
+import os
+import ast
+import cv2
+import json
+import glob
+import queue
+import logging
+import threading
+import numpy as np
+
+
+'''
+分段录像格式, 一次录像为一个目录:
+meta.json: 帧格式('jpeg'或'bayer'), 帧的形状, Bayer排列;
+000.frames, 001.frames, ...: 帧数据依次拼接, 超过segment_bytes后换下一段;
+000.index, 001.index, ...: 每帧一条定长记录(index_dtype), 与同名frames对应;
+events.txt: 可选, 录制期间的事件, 每行为(time_s, reason).
+帧数据写完后才写索引, 程序中途退出时索引只会少不会错.
+'''
+
+FORMATS = ('jpeg', 'bayer')
+
+index_dtype = np.dtype([
+    ('offset', np.int64),  # 在本段frames中的偏移
+    ('size', np.int64),
+    ('img_time_s', np.float64),
+    ('yaw_degree', np.float64),
+    ('pitch_degree', np.float64),
+    ('bullet_speed', np.float64),
+    ('flag', np.int64),
+])
+
+
+def is_recording(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+def encode(img: np.ndarray, format: str, quality: int = 90) -> bytes:
+    '''jpeg: BGR图像压缩; bayer: 单通道原始图像, 不压缩'''
+    if format == 'jpeg':
+        success, data = cv2.imencode('.jpg', img, (cv2.IMWRITE_JPEG_QUALITY, quality))
+        if not success:
+            raise ValueError('JPEG encoding failed')
+        return data.tobytes()
+    return np.ascontiguousarray(img).tobytes()
+
+
+class RecordingWriter:
+    '''
+    写入分段录像. 文件写入在后台线程中进行, write只在队列满时阻塞.
+    '''
+
+    def __init__(
+        self, path: str, format: str, shape: tuple[int, ...], bayer_pattern: str | None = None,
+        segment_bytes: int = 1 << 30, queue_size: int = 16
+    ) -> None:
+        '''
+        path: 录像目录, 不存在时创建;
+        shape: 解码后帧的形状, bayer为(H, W), jpeg为(H, W, 3);
+        segment_bytes: 每段frames文件的最大字节数.
+        '''
+        if format not in FORMATS:
+            raise ValueError(f'Unknown recording format {format}')
+
+        self.path = path
+        self._segment_bytes = segment_bytes
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'format': format, 'shape': list(shape), 'bayer_pattern': bayer_pattern}, f)
+
+        self._segment = -1
+        self._frames_file = None
+        self._index_file = None
+        self._offset = 0
+
+        self.frame_count = 0
+        self.byte_count = 0
+
+        self._queue: queue.Queue[tuple[bytes, tuple] | None] = queue.Queue(maxsize=queue_size)
+        self._error: Exception = None
+        self._thread = threading.Thread(target=self._run, name='RecordingWriter', daemon=True)
+        self._thread.start()
+
+    def _open_segment(self) -> None:
+        self._close_segment()
+        self._segment += 1
+        self._frames_file = open(os.path.join(self.path, f'{self._segment:03d}.frames'), 'wb')
+        self._index_file = open(os.path.join(self.path, f'{self._segment:03d}.index'), 'wb')
+        self._offset = 0
+
+    def _close_segment(self) -> None:
+        if self._frames_file is not None:
+            self._frames_file.close()
+            self._index_file.close()
+
+    def _run(self) -> None:
+        record = np.zeros(1, dtype=index_dtype)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+
+                data, status = item
+                if self._frames_file is None or (self._offset > 0 and self._offset + len(data) > self._segment_bytes):
+                    self._open_segment()
+
+                self._frames_file.write(data)
+                record[0] = (self._offset, len(data), *status)
+                self._index_file.write(record.tobytes())
+
+                self._offset += len(data)
+                self.frame_count += 1
+                self.byte_count += len(data)
+
+        except Exception as error:
+            self._error = error
+            logging.exception(error)
+
+        finally:
+            self._close_segment()
+
+    def write(self, data: bytes, status: tuple[float, float, float, float, int]) -> None:
+        '''
+        data: encode得到的帧数据;
+        status: (img_time_s, yaw_degree, pitch_degree, bullet_speed, flag).
+        '''
+        if self._error is not None:
+            raise self._error
+        self._queue.put((data, status))
+
+    def close(self) -> None:
+        '''注意阻塞, 等待队列中的帧全部写完'''
+        self._queue.put(None)
+        self._thread.join()
+
+
+class RecordingReader:
+    '''
+    读取分段录像. 索引与帧数据都用内存映射, 任意一帧的索引和数据都可以直接定位.
+    frames按顺序解码时默认在后台线程中预取.
+    '''
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.path = path
+        self.format: str = meta['format']
+        self.shape = tuple(meta['shape'])
+        self.bayer_pattern: str | None = meta['bayer_pattern']
+
+        self._indices: list[np.ndarray] = []
+        self._datas: list[np.ndarray] = []
+        for index_path in sorted(glob.glob(os.path.join(path, '*.index'))):
+            count = os.path.getsize(index_path) // index_dtype.itemsize
+            if count == 0:
+                continue
+            frames_path = index_path[:-len('.index')] + '.frames'
+            self._indices.append(np.memmap(index_path, dtype=index_dtype, mode='r', shape=(count,)))
+            self._datas.append(np.memmap(frames_path, dtype=np.uint8, mode='r'))
+
+        # 各段第一帧的全局序号
+        self._starts = np.cumsum([0] + [len(index) for index in self._indices])
+        self._records: np.ndarray = None
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def _locate(self, i: int) -> tuple[int, int]:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        segment = int(np.searchsorted(self._starts, i, side='right')) - 1
+        return segment, i - int(self._starts[segment])
+
+    def index(self, i: int) -> np.void:
+        segment, local = self._locate(i)
+        return self._indices[segment][local]
+
+    def status(self, i: int) -> tuple[float, float, float, float, int]:
+        '''(img_time_s, yaw_degree, pitch_degree, bullet_speed, flag)'''
+        _, _, img_time_s, yaw_degree, pitch_degree, bullet_speed, flag = self.index(i).tolist()
+        return img_time_s, yaw_degree, pitch_degree, bullet_speed, flag
+
+    @property
+    def records(self) -> np.ndarray:
+        '''所有帧的索引, 第一次访问时拼接各段'''
+        if self._records is None:
+            self._records = np.concatenate(self._indices) if self._indices else np.empty(0, dtype=index_dtype)
+        return self._records
+
+    @property
+    def times_s(self) -> np.ndarray:
+        return self.records['img_time_s']
+
+    @property
+    def events(self) -> list[tuple[float, str]]:
+        '''(time_s, reason), 没有events.txt时为空'''
+        events_path = os.path.join(self.path, 'events.txt')
+        if not os.path.isfile(events_path):
+            return []
+        with open(events_path) as f:
+            return [ast.literal_eval(line) for line in f if line.strip()]
+
+    def find(self, time_s: float) -> int:
+        '''img_time_s不早于time_s的第一帧'''
+        return min(int(np.searchsorted(self.times_s, time_s)), len(self) - 1)
+
+    def frame(self, i: int) -> np.ndarray:
+        '''jpeg解码为BGR图像; bayer返回原始图像, 为只读的内存映射'''
+        segment, local = self._locate(i)
+        offset, size = self._indices[segment][local][['offset', 'size']].tolist()
+        data = self._datas[segment][offset:offset + size]
+        if self.format == 'jpeg':
+            return cv2.imdecode(data, cv2.IMREAD_COLOR)
+        return data.reshape(self.shape)
+
+    def frames(self, start: int = 0, stop: int | None = None, prefetch_num: int = 8):
+        '''按顺序产生(序号, 帧, 状态), prefetch_num大于0时在后台线程中提前解码'''
+        stop = len(self) if stop is None else min(stop, len(self))
+        frames = ((i, self.frame(i), self.status(i)) for i in range(start, stop))
+        return prefetch(frames, prefetch_num) if prefetch_num > 0 else frames
+
+
+def prefetch(iterable, size: int = 8):
+    '''在后台线程中提前迭代最多size项, 用于把解码与处理重叠. 迭代中的异常在取到该位置时抛出'''
+    prefetched: queue.Queue = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    errors: list[Exception] = []
+    end = object()
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if stopped.is_set():
+                    return
+                prefetched.put(item)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            prefetched.put(end)
+
+    thread = threading.Thread(target=produce, name='Prefetch', daemon=True)
+    thread.start()
+    try:
+        while (item := prefetched.get()) is not end:
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        # 提前停止迭代时让预取线程退出
+        stopped.set()
+        while thread.is_alive():
+            try:
+                prefetched.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -1,14 +1,20 @@
 import cv2
-import math
+import time
 import logging
 import numpy as np
 from enum import IntEnum
 from modules.ekf import ColumnVector
 from modules.io.parallel_camera import ParallelCamera
-from modules.io.parallel_rx_communicator import ParallelRxCommunicator
-from modules.io.parallel_tx_communicator import ParallelTxCommunicator
+from modules.io.parallel_serial_communicator import ParallelSerialCommunicator
 from modules.io.context_manager import ContextManager
-from modules.io.communication import Status, TX_FLAG_FIRE
+from modules.io.communication import apply_gun_offset, TX_FLAG_FIRE
+from modules.autoaim.targets.target import Target
+from modules.io.trace import Tracer, Stage
+from modules.io import process_profile
+from modules.io.simulation import Replay
+from modules.io.bayer import BayerImage
+from modules.io.attitude import AttitudeHistory
+from modules.clock import Clock, RecordedClock, real_clock
 
 
 class WorkMode(IntEnum):
@@ -17,29 +23,42 @@ class WorkMode(IntEnum):
     BIGNASHOR = 3
 
 
-def limit_degree(angle_degree: float) -> float:
-    '''(-180,180]'''
-    while angle_degree <= -180:
-        angle_degree += 360
-    while angle_degree > 180:
-        angle_degree -= 360
-    return angle_degree
-
-
-def interpolate_degree(from_degree: float, to_degree: float, k: float) -> float:
-    delta_degree = limit_degree(to_degree - from_degree)
-    result_degree = limit_degree(k * delta_degree + from_degree)
-    return result_degree
+max_imu_wait_s = 5e-3  # 查询姿态时等待下位机数据的最长时间, 超过后外推
 
 
 class Robot(ContextManager):
-    def __init__(self, exposure_ms: float, port: str) -> None:
-        self._camera = ParallelCamera(exposure_ms)
-        self._rx_communicator = ParallelRxCommunicator(port)
-        self._tx_communicator = ParallelTxCommunicator(port)
+    def __init__(
+        self, exposure_ms: float, port: str, stream_hz: float = 500, trace_path: str | None = None,
+        replay: Replay | None = None, bayer: bool = False
+    ) -> None:
+        '''
+        trace_path: 关闭时将延迟追踪导出为Chrome trace json的路径;
+        replay: 不为None时离线回放录像, 不需要相机和串口, 发送的命令记录到replay.commands_path,
+                时钟为replay.clock, 见clock;
+        bayer: 相机输出原始Bayer图像, img为BayerImage, 按需去马赛克.
+        '''
+        self.tracer = Tracer()
+        self._trace_path = trace_path
+        self._trace_ring = self.tracer.rings['main']
+        self._pipeline_latency_s: float = None
+        self._latency_update_time_s = 0
+
+        process_profile.apply('main')
+
+        self.clock: Clock = real_clock if replay is None else replay.clock  # 追踪器与录像器应使用的时钟, 每帧推进
+
+        if replay is None:
+            self._camera = ParallelCamera(exposure_ms, self.tracer.rings['capture'], bayer=bayer)
+            # 一个进程收发同一个串口
+            self._rx_communicator = self._tx_communicator = ParallelSerialCommunicator(port, stream_hz, self.tracer.rings['transmit'])
+        else:
+            self._camera = replay.camera(self.tracer.rings['capture'], bayer)
+            self._rx_communicator = replay.rx_communicator()
+            self._tx_communicator = replay.tx_communicator(stream_hz, self.tracer.rings['transmit'])
 
-        self.img: cv2.Mat = None
+        self.img: cv2.Mat | BayerImage = None
         self.img_time_s: float = None
+        self.trace_id: int = None
         self.bullet_speed: float = None
         self.flag: int = None
         self.color: str = None
@@ -47,9 +66,20 @@ class Robot(ContextManager):
         self.work_mode = WorkMode.AUTOAIM
 
     def _close(self) -> None:
+        logging.info('Process placement:\n' + process_profile.report())
+
         self._camera._close()
         self._rx_communicator._close()
-        self._tx_communicator._close()
+        if self._tx_communicator is not self._rx_communicator:
+            self._tx_communicator._close()
+
+        percentiles = self.tracer.percentiles_s()
+        if percentiles is not None:
+            logging.info('Capture to serial latency: ' + ' '.join(f'p{p:g}={v*1e3:.2f}ms' for p, v in percentiles.items()))
+        if self._trace_path is not None:
+            self.tracer.export_chrome_trace(self._trace_path)
+            logging.info(f'Trace is saved at {self._trace_path}')
+
         logging.info('Robot closed.')
 
     def update(self):
@@ -57,8 +87,14 @@ class Robot(ContextManager):
         self._camera.update()
         self.img = self._camera.img
         self.img_time_s = self._camera.read_time_s
+        self.trace_id = self._camera.trace_id
+        self.trace(Stage.HANDOFF)
 
-        self._rx_communicator.update()
+        if isinstance(self.clock, RecordedClock):
+            self.clock.update(self.img_time_s)
+
+        # 只有第一次需要等待下位机, 之后不阻塞, 姿态在yaw_pitch_degree_at中按需等待
+        self._rx_communicator.update(None if self._rx_communicator.latest_status is None else 0)
         _, _, _, bullet_speed, flag = self._rx_communicator.latest_status
         self.bullet_speed = bullet_speed if bullet_speed > 5 else 15
 
@@ -77,48 +113,73 @@ class Robot(ContextManager):
         else:
             self.work_mode = WorkMode.BIGNASHOR
 
-    def yaw_pitch_degree_at(self, time_s: float) -> tuple[float, float]:
-        '''注意阻塞'''
-        while self._rx_communicator.latest_read_time_s < time_s:
-            self._rx_communicator.update()
-
-        status_before: Status = None
-        for read_time_s, status in reversed(self._rx_communicator.history):
-            if read_time_s < time_s:
-                time_s_before, status_before = read_time_s, status
+    def yaw_pitch_degree_at(self, time_s: float | np.ndarray, method: str = 'linear') -> tuple[float, float] | tuple[np.ndarray, np.ndarray]:
+        '''
+        注意阻塞, 下位机数据还没到time_s时最多等待max_imu_wait_s, 之后外推.
+        time_s可以是数组, 一次查询多个时刻; method见AttitudeHistory.yaw_pitch_degree_at.
+        '''
+        deadline_s = time.time() + max_imu_wait_s
+        latest_time_s = np.max(time_s)
+        while self.attitude.latest_time_s < latest_time_s:
+            remaining_s = deadline_s - time.time()
+            if remaining_s <= 0:
+                logging.debug(f'IMU lags {(latest_time_s - self.attitude.latest_time_s)*1e3:.2f}ms, extrapolated.')
                 break
-            time_s_after, status_after = read_time_s, status
+            self._rx_communicator.update(remaining_s)
 
-        _, yaw_degree_after, pitch_degree_after, _, _, = status_after
+        return self.attitude.yaw_pitch_degree_at(time_s, method)
 
-        if status_before is None:
-            return yaw_degree_after, pitch_degree_after
+    @property
+    def camera(self) -> ParallelCamera:
+        '''用于按引用录像: Recorder(robot.camera)'''
+        return self._camera
 
-        _, yaw_degree_before, pitch_degree_before, _, _, = status_before
-
-        k = (time_s - time_s_before) / (time_s_after - time_s_before)
-        yaw_degree = interpolate_degree(yaw_degree_before, yaw_degree_after, k)
-        pitch_degree = interpolate_degree(pitch_degree_before, pitch_degree_after, k)
-
-        return yaw_degree, pitch_degree
+    @property
+    def attitude(self) -> AttitudeHistory:
+        return self._rx_communicator.attitude
 
     def shoot(self, gun_up_degree: float, gun_right_degree: float, aim_point_in_imu_m: ColumnVector, fire_time_s: float | None = None) -> None:
-        yaw = math.radians(gun_right_degree)
-        R_y = np.array([[math.cos(yaw), 0, math.sin(yaw)],
-                        [0, 1, 0],
-                        [-math.sin(yaw), 0, math.cos(yaw)]])
-        
-        aim_point_in_imu_m = R_y @ aim_point_in_imu_m
-
-        aim_point_in_imu_mm = aim_point_in_imu_m * 1e3
-        x_in_imu_mm, y_in_imu_mm, z_in_imu_mm = aim_point_in_imu_mm.T[0]
+        x_in_imu_mm, y_in_imu_mm, z_in_imu_mm = apply_gun_offset(aim_point_in_imu_m, gun_up_degree, gun_right_degree)
 
-        gun_up_rad = math.radians(gun_up_degree)
-        distance_mm = (x_in_imu_mm**2 + z_in_imu_mm**2)**0.5
-        aim_pitch_rad = math.atan(-y_in_imu_mm/distance_mm)
-        y_in_imu_mm = -distance_mm * math.tan(aim_pitch_rad + gun_up_rad)
+        self.trace(Stage.AIM)
 
         if fire_time_s == 0:
-            self._tx_communicator.send(x_in_imu_mm, y_in_imu_mm, z_in_imu_mm, flag=TX_FLAG_FIRE)
+            queued = self._tx_communicator.send(x_in_imu_mm, y_in_imu_mm, z_in_imu_mm, flag=TX_FLAG_FIRE, trace_id=self.trace_id)
         else:
-            self._tx_communicator.send(x_in_imu_mm, y_in_imu_mm, z_in_imu_mm, fire_time_s=fire_time_s)
+            queued = self._tx_communicator.send(x_in_imu_mm, y_in_imu_mm, z_in_imu_mm, fire_time_s=fire_time_s, trace_id=self.trace_id)
+
+        if queued:
+            self.trace(Stage.QUEUED)
+
+    def track(self, gun_up_degree: float, gun_right_degree: float, target: Target) -> None:
+        '''将目标交给发送进程, 以高于相机帧率的频率外推并发送瞄准点'''
+        if self._tx_communicator.track(target, self.bullet_speed, gun_up_degree, gun_right_degree, self.trace_id):
+            self.trace(Stage.QUEUED)
+
+    def trace(self, stage: Stage) -> None:
+        '''记录当前帧到达stage的时刻'''
+        if self.trace_id is not None:
+            self._trace_ring.write(self.trace_id, stage)
+
+    @property
+    def pipeline_latency_s(self) -> float | None:
+        '''
+        实测的取图到写入串口的延迟中位数, 每秒更新一次.
+        发送进程在写入时才外推目标, 这段延迟已被补偿, 不能直接作为target.latency_s.
+        '''
+        current_time_s = time.time()
+        if current_time_s - self._latency_update_time_s > 1:
+            self._latency_update_time_s = current_time_s
+            percentiles = self.tracer.percentiles_s(percentiles=(50,))
+            if percentiles is not None:
+                self._pipeline_latency_s = percentiles[50]
+        return self._pipeline_latency_s
+
+    @property
+    def fire_stats(self) -> dict[str, float]:
+        '''发送进程的定时开火统计, 见FIRE_STATS_FIELDS'''
+        return self._tx_communicator.fire_stats
+
+    def cancel_fire(self) -> None:
+        '''停止外推目标, 取消尚未发出的定时开火'''
+        self._tx_communicator.cancel_fire()
@@ -0,0 +1,359 @@
+import os
+import ast
+import cv2
+import time
+import logging
+import functools
+import numpy as np
+from multiprocessing import Process
+from modules.io.communication import Status, Command, TX_FLAG_EMPTY
+from modules.io.context_manager import ContextManager
+from modules.io.attitude import AttitudeHistory
+from modules.io.frame_exchange import FrameExchange
+from modules.io.quit_signal import QuitSignal
+from modules.io import process_profile
+from modules.io.parallel_camera import ParallelCamera
+from modules.io.bayer import BayerImage, mosaic
+from modules.io.recording import RecordingReader, is_recording, prefetch
+from modules.io.trace import TraceRing, Stage
+from modules.io.parallel_tx_communicator import ParallelTxCommunicator
+from modules.clock import Clock, SharedRecordedClock, real_clock
+
+
+'''
+离线回放: 用录像代替相机, 用录像的状态代替下位机, 发送的命令记录到文件.
+录像为Recorder保存的录像目录(见recording, 状态在索引中),
+或avi, 原始帧(npy: shape=(N,H,W,C), raw: 连续的H*W*C字节), 状态在同名txt中.
+状态txt每行对应一帧: (img_time_s, yaw_degree, pitch_degree, bullet_speed, flag).
+录制时刻统一映射为 start_time_s + (t - t0), 相机与下位机回放共用同一映射.
+'''
+
+FPS = 30  # 没有状态txt时回放的帧率
+H, W = 1024, 1280  # 相机图像大小, 与ParallelCamera一致
+
+
+def load_status(status_path: str) -> tuple[np.ndarray, list[tuple[float, float, float, int]]]:
+    '''return: 每帧的录制时刻, 每帧的(yaw_degree, pitch_degree, bullet_speed, flag)'''
+    times_s, statuses = [], []
+    with open(status_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            img_time_s, yaw_degree, pitch_degree, bullet_speed, flag = ast.literal_eval(line)
+            times_s.append(img_time_s)
+            statuses.append((yaw_degree, pitch_degree, bullet_speed, int(flag)))
+    return np.float64(times_s), statuses
+
+
+def load_commands(commands_path: str) -> np.ndarray:
+    '''读取CommandLogger记录的命令, 每行为(send_time_s, x, y, z, flag)'''
+    with open(commands_path) as f:
+        return np.float64([ast.literal_eval(line) for line in f if line.strip()]).reshape(-1, 5)
+
+
+def load_recording(path: str) -> tuple[np.ndarray, list[tuple[float, float, float, int]]]:
+    '''与load_status相同, 从录像目录的索引中读取'''
+    records = RecordingReader(path).records
+    statuses = list(zip(
+        records['yaw_degree'].tolist(), records['pitch_degree'].tolist(),
+        records['bullet_speed'].tolist(), records['flag'].tolist()
+    ))
+    return records['img_time_s'].copy(), statuses
+
+
+def load_statuses(video_path: str) -> tuple[np.ndarray, list[tuple[float, float, float, int]]] | None:
+    '''录像目录的索引, 或录像文件同名txt中的状态, 都没有时返回None'''
+    if is_recording(video_path):
+        return load_recording(video_path)
+
+    status_path = f'{os.path.splitext(video_path)[0]}.txt'
+    if os.path.isfile(status_path):
+        return load_status(status_path)
+
+    return None
+
+
+def open_frames(video_path: str, shape: tuple[int, ...]):
+    '''
+    按顺序产生录像中的每一帧.
+    shape: 共享内存中帧的形状, raw必须与之一致, npy和avi也可以是同样大小的BGR帧.
+    录像目录中的Bayer原始图像在shape为BGR时去马赛克.
+    '''
+    accepted_shapes = (shape, (*shape[:2], 3))
+    extension = os.path.splitext(video_path)[1]
+
+    if is_recording(video_path):
+        reader = RecordingReader(video_path)
+        if reader.shape[:2] != shape[:2]:
+            raise ValueError(f'Frame shape {reader.shape} does not match {shape}')
+        demosaic = (reader.format == 'bayer' and len(shape) == 3)
+        for _, frame, _ in reader.frames(prefetch_num=0):
+            yield BayerImage(frame, reader.bayer_pattern).bgr() if demosaic else frame
+
+    elif extension == '.npy':
+        frames = np.load(video_path, mmap_mode='r')
+        if frames.shape[1:] not in accepted_shapes:
+            raise ValueError(f'Frame shape {frames.shape[1:]} does not match {shape}')
+        yield from frames
+
+    elif extension == '.raw':
+        frames = np.memmap(video_path, dtype=np.uint8, mode='r')
+        frame_size = int(np.prod(shape))
+        yield from frames[:frames.size // frame_size * frame_size].reshape(-1, *shape)
+
+    else:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise FileNotFoundError(video_path)
+        try:
+            while True:
+                success, frame = cap.read()
+                if not success:
+                    break
+                if frame.shape not in accepted_shapes:
+                    raise ValueError(f'Frame shape {frame.shape} does not match {shape}')
+                yield frame
+        finally:
+            cap.release()
+
+
+def count_frames(video_path: str, frame_bytes: int) -> int:
+    '''
+    录像的帧数, 不解码.
+    frame_bytes: raw中每帧的字节数; avi没有记录帧数时逐帧grab计数.
+    '''
+    extension = os.path.splitext(video_path)[1]
+
+    if is_recording(video_path):
+        return len(RecordingReader(video_path))
+
+    if extension == '.npy':
+        return np.load(video_path, mmap_mode='r').shape[0]
+
+    if extension == '.raw':
+        return os.path.getsize(video_path) // frame_bytes
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(video_path)
+    try:
+        frame_num = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_num <= 0:
+            frame_num = 0
+            while cap.grab():
+                frame_num += 1
+        return frame_num
+    finally:
+        cap.release()
+
+
+def replay(
+    video_path: str, times_s: np.ndarray, start_time_s: float, realtime: bool, bayer_pattern: str,
+    exchange: FrameExchange, quit_signal: QuitSignal, trace_ring: TraceRing | None
+) -> None:
+    '''
+    代替capture进程, 通过同样的共享内存把录像交给主进程.
+    realtime: True时按录制时的节奏发布, 主进程来不及处理的帧被丢弃;
+              False时等主进程拿走上一帧后立即发布下一帧, 不丢帧.
+    共享内存为单通道而录像为BGR时, 按bayer_pattern合成Bayer图像.
+    '''
+    logging.info('Replay started.')
+
+    trace_id = 0
+    bayer = (len(exchange.shape) == 2)
+
+    # 解码在预取线程中, 与等待和复制重叠
+    for frame, time_s in zip(prefetch(open_frames(video_path, exchange.shape)), times_s):
+        read_time_s = start_time_s + time_s - times_s[0]
+
+        if realtime:
+            if quit_signal.wait(max(read_time_s - time.time(), 0)):
+                break
+        else:
+            while not exchange.wait_consumed(0.1) and not quit_signal.is_set():
+                pass
+
+        if quit_signal.is_set():
+            break
+
+        buffer_index = exchange.acquire_write()
+        if buffer_index is None:
+            logging.debug('Replay has no free buffer!')
+            continue
+        exchange.array(buffer_index)[:] = mosaic(frame, bayer_pattern) if bayer and frame.ndim == 3 else frame
+
+        trace_id += 1
+        if trace_ring is not None:
+            capture_ns = time.monotonic_ns() - int((time.time() - read_time_s) * 1e9)
+            trace_ring.write(trace_id, Stage.CAPTURE, capture_ns)
+
+        exchange.publish(buffer_index, read_time_s, trace_id)
+
+    # 等待主进程拿走最后一帧
+    while not exchange.wait_consumed(0.1) and not quit_signal.is_set():
+        pass
+
+    logging.info('Replay ended.')
+
+
+class SimulatedCamera(ParallelCamera):
+    '''与ParallelCamera接口一致, 录像播放完后update抛出EOFError'''
+
+    def __init__(
+        self, video_path: str, times_s: np.ndarray, start_time_s: float, realtime: bool = True,
+        trace_ring: TraceRing | None = None, buffer_num: int = 5, bayer: bool = False, bayer_pattern: str = 'RG'
+    ) -> None:
+        '''bayer: 将BGR录像转为bayer_pattern排列的Bayer图像, 模拟相机的原始输出'''
+        self._setup(buffer_num, bayer)
+        self._bayer_pattern.value = bayer_pattern.encode()
+        self._process = Process(
+            target=replay,
+            name='replay',
+            args=(video_path, times_s, start_time_s, realtime, bayer_pattern, self._exchange, self._quit_signal, trace_ring)
+        )
+
+        self._process.start()
+        process_profile.apply(self._process.name, self._process.pid)
+
+    def update(self) -> None:
+        '''注意阻塞'''
+        self._release()
+
+        while True:
+            frame = self._exchange.acquire_latest(0.1)
+            if frame is not None:
+                break
+            if not self._process.is_alive():
+                raise EOFError('Replay finished.')
+
+        self._set_frame(frame)
+
+
+class SimulatedRxCommunicator(ContextManager):
+    '''与ParallelRxCommunicator接口一致, 把状态txt作为下位机数据包回放'''
+
+    def __init__(self, times_s: np.ndarray, statuses: list[tuple[float, float, float, int]], start_time_s: float, realtime: bool = True) -> None:
+        self._read_times_s = start_time_s + times_s - times_s[0]
+        self._statuses = statuses
+        self._realtime = realtime
+        self._next_index = 0
+
+        self.attitude = AttitudeHistory()
+        self.latest_read_time_s: float = None
+        self.latest_status: Status = None
+
+    def _close(self) -> None:
+        logging.info('SimulatedRxCommunicator closed.')
+
+    def _receive(self) -> None:
+        index = self._next_index
+        yaw_degree, pitch_degree, bullet_speed, flag = self._statuses[index]
+        self.latest_read_time_s = self._read_times_s[index]
+        self.latest_status = (index % 256, yaw_degree, pitch_degree, bullet_speed, flag)
+        self.attitude.append(self.latest_read_time_s, self.latest_status)
+        self._next_index += 1
+
+    def update(self, timeout_s: float | None = None) -> bool:
+        '''
+        注意阻塞, 实时回放时收下所有已到时刻的数据包, 否则收下一个.
+        timeout_s: 实时回放时最多等待的时间, None时一直等待, 超时返回False
+        '''
+        if self._next_index == len(self._statuses):
+            raise EOFError('Replay finished.')
+
+        if self._realtime:
+            wait_s = max(self._read_times_s[self._next_index] - time.time(), 0)
+            if timeout_s is not None and wait_s > timeout_s:
+                time.sleep(timeout_s)
+                return False
+            time.sleep(wait_s)
+            self._receive()
+            while self._next_index < len(self._statuses) and self._read_times_s[self._next_index] <= time.time():
+                self._receive()
+        else:
+            self._receive()
+
+        return True
+
+
+class CommandLogger(ContextManager):
+    '''与Communicator的发送接口一致, 把命令连同发送时刻(clock.time())写入文件'''
+
+    def __init__(self, path: str, use_rx=True, ues_tx=True, clock: Clock = real_clock) -> None:
+        self._path = path
+        self._clock = clock
+        self._file = open(path, 'w')
+        logging.info('CommandLogger opened.')
+
+    def _close(self) -> None:
+        self._file.close()
+        logging.info(f'Commands are saved at {self._path}')
+
+    def reopen(self) -> None:
+        pass
+
+    def send(
+        self,
+        x_in_imu_mm: float, y_in_imu_mm: float, z_in_imu_mm: float, flag: int = TX_FLAG_EMPTY,
+        debug: bool = False
+    ) -> None:
+        command: Command = (float(x_in_imu_mm), float(y_in_imu_mm), float(z_in_imu_mm), int(flag))
+        self._file.write(f'{(self._clock.time(), *command)}\n')
+
+        if debug:
+            print(f'sent x={x_in_imu_mm} y={y_in_imu_mm} z={z_in_imu_mm} {flag=}')
+
+
+class Replay:
+    '''
+    一次离线回放的配置, 为Robot提供相机, 接收与发送的替代品.
+    video_path: 录像目录, 命令记录到其中的commands.txt;
+                或录像文件, 同名txt为状态, 不存在时按FPS生成时刻, 姿态为0;
+    realtime: 是否按录制时的节奏回放, False则尽可能快, 用于测量整条流水线的吞吐;
+              此时clock跟随当前帧的img_time_s(由Robot推进), 追踪器, 发送进程和录像器都应使用它, 否则外推按墙上时间会出错;
+    flag: 没有状态txt时使用的下位机flag;
+    bayer_pattern: 相机为bayer模式时, 合成Bayer图像所用的排列, 录像为Bayer原始图像时使用录像的排列.
+    '''
+
+    def __init__(
+        self, video_path: str, realtime: bool = True, flag: int = 3, delay_s: float = 1.0, bayer_pattern: str = 'RG'
+    ) -> None:
+        self.video_path = video_path
+        self.realtime = realtime
+        self.bayer_pattern = bayer_pattern
+
+        if is_recording(video_path):
+            self.commands_path = os.path.join(video_path, 'commands.txt')
+            self.bayer_pattern = RecordingReader(video_path).bayer_pattern or bayer_pattern
+        else:
+            self.commands_path = f'{os.path.splitext(video_path)[0]}.commands.txt'
+
+        statuses = load_statuses(video_path)
+        if statuses is not None:
+            self.times_s, self.statuses = statuses
+        else:
+            # raw的帧大小取决于相机是否为bayer模式, 按单通道计数得到上限, 回放在帧读完时结束
+            frame_num = count_frames(video_path, frame_bytes=H * W)
+            logging.warning(f'No status for {video_path}, replay {frame_num} frames at {FPS}fps with zero attitude.')
+            self.times_s = np.arange(frame_num) / FPS
+            self.statuses = [(0.0, 0.0, 15.0, flag)] * frame_num
+
+        # 留出子进程启动的时间
+        self.start_time_s = time.time() + delay_s
+
+        # 实时回放时img_time_s与墙上时间一致, 否则时间只随帧前进. 须在创建子进程之前创建, 见SharedRecordedClock
+        self.clock: Clock = real_clock if realtime else SharedRecordedClock()
+
+    def camera(self, trace_ring: TraceRing | None = None, bayer: bool = False) -> SimulatedCamera:
+        return SimulatedCamera(
+            self.video_path, self.times_s, self.start_time_s, self.realtime, trace_ring,
+            bayer=bayer, bayer_pattern=self.bayer_pattern
+        )
+
+    def rx_communicator(self) -> SimulatedRxCommunicator:
+        return SimulatedRxCommunicator(self.times_s, self.statuses, self.start_time_s, self.realtime)
+
+    def tx_communicator(self, stream_hz: float, trace_ring: TraceRing | None = None) -> ParallelTxCommunicator:
+        '''发送的命令记录到commands_path'''
+        command_logger = functools.partial(CommandLogger, clock=self.clock)
+        return ParallelTxCommunicator(self.commands_path, stream_hz, trace_ring, command_logger, self.clock)
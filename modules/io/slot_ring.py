@@ -0,0 +1,114 @@
+import ctypes
+from multiprocessing import Condition, RawArray
+
+
+SLOT_STATS_FIELDS = ('committed', 'encoded', 'dropped', 'encode_total_s', 'encode_max_s')
+
+FREE, FILLING, FILLED, ENCODING = range(4)
+
+DROP_NEWEST = 'newest'  # 没有空闲槽位时丢弃新帧, 已排队的帧按顺序写完
+DROP_OLDEST = 'oldest'  # 没有空闲槽位时覆盖最旧的一个尚未开始编码的帧
+
+
+class SlotRing:
+    '''
+    生产者与编码进程之间的有界槽位环, 每个槽位在任一时刻只属于一方.
+    生产者: acquire -> 填充 -> commit, 槽位 FREE -> FILLING -> FILLED
+    编码者: take -> 编码 -> done, 槽位 FILLED -> ENCODING -> FREE
+    编码者按提交顺序取帧, 没有帧时阻塞; 生产者从不阻塞, 编码跟不上时按drop_policy丢帧.
+    每个槽位附带meta_size个double, 随帧一起交给编码者.
+    可以有多个编码者, take给出连续的取帧序号, 用于按序重组编码结果.
+    '''
+
+    def __init__(self, slot_num: int, meta_size: int, drop_policy: str = DROP_NEWEST) -> None:
+        if drop_policy not in (DROP_NEWEST, DROP_OLDEST):
+            raise ValueError(f'Unknown drop policy {drop_policy}')
+
+        self.slot_num = slot_num
+        self._meta_size = meta_size
+        self._drop_policy = drop_policy
+
+        self._condition = Condition()
+        self._states = RawArray(ctypes.c_int64, slot_num)
+        self._seqs = RawArray(ctypes.c_int64, slot_num)  # 提交序号, 编码者按此顺序取帧
+        self._metas = RawArray(ctypes.c_double, slot_num * meta_size)
+        self._next_seq = RawArray(ctypes.c_int64, 1)
+        self._taken = RawArray(ctypes.c_int64, 1)
+        self._closed = RawArray(ctypes.c_int64, 1)
+        self._stats = RawArray(ctypes.c_double, len(SLOT_STATS_FIELDS))
+
+    def _count(self, field: str, value: float = 1) -> None:
+        self._stats[SLOT_STATS_FIELDS.index(field)] += value
+
+    def _oldest(self, state: int) -> int | None:
+        indices = [i for i in range(self.slot_num) if self._states[i] == state]
+        return min(indices, key=lambda i: self._seqs[i]) if indices else None
+
+    def _meta(self, index: int) -> tuple[float, ...]:
+        return tuple(self._metas[index * self._meta_size:(index + 1) * self._meta_size])
+
+    def acquire(self) -> tuple[int, tuple[float, ...] | None] | None:
+        '''
+        生产者获得一个槽位, 按丢帧策略没有可用槽位时返回None.
+        return: 槽位, 被覆盖的帧的meta(没有覆盖时为None), 生产者据此归还该帧占用的资源
+        '''
+        with self._condition:
+            index = self._oldest(FREE)
+            if index is None and self._drop_policy == DROP_OLDEST:
+                index = self._oldest(FILLED)
+            if index is None:
+                self._count('dropped')
+                return None
+
+            dropped_meta = None
+            if self._states[index] == FILLED:
+                self._count('dropped')
+                dropped_meta = self._meta(index)
+            self._states[index] = FILLING
+            return index, dropped_meta
+
+    def commit(self, index: int, meta: tuple[float, ...]) -> None:
+        with self._condition:
+            self._metas[index * self._meta_size:(index + 1) * self._meta_size] = meta
+            self._seqs[index] = self._next_seq[0]
+            self._next_seq[0] += 1
+            self._states[index] = FILLED
+            self._count('committed')
+            self._condition.notify_all()
+
+    def take(self) -> tuple[int, int, tuple[float, ...]] | None:
+        '''
+        注意阻塞, 编码者按提交顺序取一帧, 关闭且没有剩余帧时返回None.
+        return: 槽位, 取帧序号(从0开始连续, 不受丢帧影响), meta
+        '''
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed[0] or self._oldest(FILLED) is not None)
+            index = self._oldest(FILLED)
+            if index is None:
+                return None
+
+            self._states[index] = ENCODING
+            seq = self._taken[0]
+            self._taken[0] += 1
+            return index, seq, self._meta(index)
+
+    def done(self, index: int, encode_time_s: float) -> None:
+        with self._condition:
+            self._states[index] = FREE
+            self._count('encoded')
+            self._count('encode_total_s', encode_time_s)
+            max_index = SLOT_STATS_FIELDS.index('encode_max_s')
+            self._stats[max_index] = max(self._stats[max_index], encode_time_s)
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        '''编码者写完已提交的帧后退出'''
+        with self._condition:
+            self._closed[0] = 1
+            self._condition.notify_all()
+
+    @property
+    def stats(self) -> dict[str, float]:
+        stats = dict(zip(SLOT_STATS_FIELDS, self._stats))
+        stats['queued'] = sum(1 for i in range(self.slot_num) if self._states[i] in (FILLED, ENCODING))
+        return stats
@@ -0,0 +1,71 @@
+import ctypes
+import numpy as np
+from multiprocessing import Condition, RawArray, RawValue
+from modules.io.communication import Status
+from modules.io.attitude import sample_dtype
+
+
+class StatusRing:
+    '''
+    接收进程到主进程的下位机状态共享内存环形缓冲区, 单写者.
+    记录为固定大小的结构体(attitude.sample_dtype, 角度为原始值), 写入方写完记录后才增加写入序号,
+    读取方无锁地复制新记录, 复制后再检查写入序号, 丢弃期间可能被覆盖的记录.
+    Condition只用于读取方需要等待新数据的时候.
+    '''
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self._capacity = capacity
+        self._buffer = RawArray(ctypes.c_uint8, capacity * sample_dtype.itemsize)
+        self._count = RawValue(ctypes.c_int64, 0)  # 已写入的记录总数, 只增不减
+        self._condition = Condition()
+        self._records: np.ndarray = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_records'] = None
+        return state
+
+    @property
+    def records(self) -> np.ndarray:
+        if self._records is None:
+            self._records = np.frombuffer(self._buffer, dtype=sample_dtype)
+        return self._records
+
+    @property
+    def count(self) -> int:
+        return self._count.value
+
+    def write(self, samples: list[tuple[float, Status]]) -> None:
+        '''samples: 按到达顺序排列的(到达时刻, 状态)'''
+        count = self._count.value + len(samples)
+        samples = samples[-self._capacity:]
+        indices = (count - len(samples) + np.arange(len(samples))) % self._capacity
+        self.records[indices] = [
+            (time_s, yaw, pitch, bullet_speed, flag, stamp, time_s) for time_s, (stamp, yaw, pitch, bullet_speed, flag) in samples
+        ]
+        self._count.value = count
+
+        with self._condition:
+            self._condition.notify_all()
+
+    def read(self, start: int) -> tuple[np.ndarray, int, int]:
+        '''
+        不阻塞地复制序号start之后的新记录.
+        return: 新记录, 下一次读取的序号, 来不及读取而被覆盖的记录数
+        '''
+        end = self._count.value
+        first = max(start, end - self._capacity)
+        records = self.records[np.arange(first, end) % self._capacity].copy()
+
+        # 复制期间写入方可能又覆盖了最旧的几条
+        overwritten = max(self._count.value - self._capacity - first, 0)
+        records = records[overwritten:]
+
+        return records, end, first + overwritten - start
+
+    def wait(self, start: int, timeout_s: float | None = None) -> bool:
+        '''等待序号start之后有新记录, 超时返回False'''
+        if self._count.value > start:
+            return True
+        with self._condition:
+            return self._condition.wait_for(lambda: self._count.value > start, timeout_s)
@@ -0,0 +1,123 @@
+import json
+import time
+import ctypes
+import numpy as np
+from enum import IntEnum
+from multiprocessing import RawArray, RawValue
+
+
+class Stage(IntEnum):
+    CAPTURE = 0  # 相机取图
+    HANDOFF = 1  # 主进程拿到图像
+    DETECT = 2  # 识别完成
+    SOLVE = 3  # 解算完成
+    TRACK = 4  # 跟踪完成
+    AIM = 5  # 瞄准完成
+    QUEUED = 6  # 命令交给发送进程
+    WRITTEN = 7  # 命令写入串口
+
+
+record_dtype = np.dtype([('trace_id', np.int64), ('stage', np.int64), ('time_ns', np.int64)])
+
+
+class TraceRing:
+    '''单写者共享内存环形缓冲区, 写入方只在记录写完后更新索引, 因此无需加锁'''
+
+    def __init__(self, capacity: int) -> None:
+        self._capacity = capacity
+        self._buffer = RawArray(ctypes.c_int64, capacity * len(record_dtype.names))
+        self._count = RawValue(ctypes.c_int64, 0)  # 已写入的记录总数
+        self._records: np.ndarray = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_records'] = None
+        return state
+
+    @property
+    def records(self) -> np.ndarray:
+        if self._records is None:
+            self._records = np.frombuffer(self._buffer, dtype=record_dtype)
+        return self._records
+
+    def write(self, trace_id: int, stage: Stage, time_ns: int | None = None) -> None:
+        if time_ns is None:
+            time_ns = time.monotonic_ns()
+        count = self._count.value
+        self.records[count % self._capacity] = (trace_id, stage, time_ns)
+        self._count.value = count + 1
+
+    def snapshot(self) -> np.ndarray:
+        '''复制出当前所有有效记录, 按写入顺序排列'''
+        end = self._count.value
+        start = max(0, end - self._capacity)
+        return self.records[np.arange(start, end) % self._capacity].copy()
+
+
+class Tracer:
+    '''
+    逐帧延迟追踪, 时间均为time.monotonic_ns().
+    每个写入进程使用各自的TraceRing: capture, main, transmit.
+    '''
+
+    producers = ('capture', 'main', 'transmit')
+
+    def __init__(self, capacity: int = 8192) -> None:
+        self.rings = {producer: TraceRing(capacity) for producer in self.producers}
+
+    def snapshot(self) -> dict[str, np.ndarray]:
+        return {producer: ring.snapshot() for producer, ring in self.rings.items()}
+
+    def latencies_s(self, from_stage: Stage, to_stage: Stage) -> np.ndarray:
+        '''各帧from_stage到to_stage的延迟, 按trace_id排序'''
+        records = np.concatenate(list(self.snapshot().values()))
+
+        def first_time_ns(stage: Stage) -> dict[int, int]:
+            selected = records[records['stage'] == stage]
+            selected = selected[np.argsort(selected['time_ns'], kind='stable')]
+            trace_ids, index = np.unique(selected['trace_id'], return_index=True)
+            return dict(zip(trace_ids.tolist(), selected['time_ns'][index].tolist()))
+
+        from_ns = first_time_ns(from_stage)
+        to_ns = first_time_ns(to_stage)
+        trace_ids = sorted(from_ns.keys() & to_ns.keys())
+        return np.float64([to_ns[i] - from_ns[i] for i in trace_ids]) / 1e9
+
+    def percentiles_s(
+        self, from_stage: Stage = Stage.CAPTURE, to_stage: Stage = Stage.WRITTEN,
+        percentiles: tuple[float, ...] = (50, 90, 99), window: int = 500
+    ) -> dict[float, float] | None:
+        '''最近window帧的延迟分位数, 没有数据时返回None'''
+        latencies_s = self.latencies_s(from_stage, to_stage)[-window:]
+        if latencies_s.size == 0:
+            return None
+        return dict(zip(percentiles, np.percentile(latencies_s, percentiles).tolist()))
+
+    def export_chrome_trace(self, path: str) -> None:
+        '''导出Chrome trace/Perfetto可读的json, 每一帧的相邻阶段之间为一个事件'''
+        events = []
+        for tid, producer in enumerate(self.producers):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tid, 'args': {'name': producer}})
+
+        records: list[tuple[int, int, int, int]] = []
+        for tid, (producer, ring_records) in enumerate(self.snapshot().items()):
+            records.extend((int(r['trace_id']), int(r['time_ns']), int(r['stage']), tid) for r in ring_records)
+        records.sort()
+
+        last: tuple[int, int, int, int] = None
+        for record in records:
+            trace_id, time_ns, stage, tid = record
+            if last is not None and last[0] == trace_id:
+                events.append({
+                    'name': Stage(stage).name,
+                    'ph': 'X',
+                    'pid': 0,
+                    'tid': tid,
+                    'ts': last[1] / 1e3,
+                    'dur': (time_ns - last[1]) / 1e3,
+                    'args': {'trace_id': trace_id},
+                })
+            last = record
+
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
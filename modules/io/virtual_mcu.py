@@ -0,0 +1,201 @@
+import os
+import tty
+import math
+import time
+import random
+import select
+import serial
+import ctypes
+import logging
+from multiprocessing import Process, RawArray
+from modules.io.communication import FrameParser, pack_status_frame, decode_command, tx_frame_struct, BAUDRATE, RX_FRAME_LEN
+from modules.io.context_manager import ContextManager
+from modules.io.quit_signal import QuitSignal
+from modules.io import process_profile
+
+
+'''
+虚拟下位机: 创建一对伪终端, 上位机像打开真实串口一样打开VirtualMcu.port.
+下位机以rate_hz发送状态帧, 可加入发送时刻抖动, 损坏的帧和突发(若干帧攒在一起发送, 模拟USB延迟);
+或按波特率回放串口原始字节的录制文件(capture_serial录制).
+收到的命令帧连同到达时刻写入文件, 格式与CommandLogger一致, 可用load_commands读取.
+'''
+
+MCU_STATS_FIELDS = ('status_sent', 'status_corrupted', 'bytes_sent', 'bytes_dropped', 'commands', 'command_crc_errors')
+
+# 状态帧中yaw, pitch随时间按正弦变化, 便于检查插值
+yaw_amplitude_degree, yaw_hz = 20.0, 0.5
+pitch_amplitude_degree, pitch_hz = 5.0, 0.3
+
+
+def attitude_at(time_s: float) -> tuple[float, float]:
+    '''return: 虚拟下位机在time_s(time.time()时钟)时的yaw_degree, pitch_degree'''
+    yaw_degree = yaw_amplitude_degree * math.sin(2 * math.pi * yaw_hz * time_s)
+    pitch_degree = pitch_amplitude_degree * math.sin(2 * math.pi * pitch_hz * time_s)
+    return yaw_degree, pitch_degree
+
+
+def corrupt(frame: bytes, rng: random.Random) -> bytes:
+    '''翻转帧中的一个字节(CRC错误), 或截断(需要重新同步)'''
+    if rng.random() < 0.5:
+        index = rng.randrange(1, RX_FRAME_LEN - 2)
+        return frame[:index] + bytes((frame[index] ^ 0xff,)) + frame[index + 1:]
+    return frame[:rng.randrange(1, RX_FRAME_LEN)]
+
+
+def simulate(
+    master_fd: int, quit_signal: QuitSignal, stats: RawArray,
+    rate_hz: float, jitter_s: float, corrupt_prob: float, burst_prob: float, burst_len: int,
+    capture_path: str | None, commands_path: str | None, flag: int, bullet_speed: float, seed: int
+) -> None:
+    logging.info('Virtual MCU started.')
+
+    def count(field: str, n: int = 1) -> None:
+        stats[MCU_STATS_FIELDS.index(field)] += n
+
+    def write(data: bytes) -> None:
+        # 上位机不读时伪终端缓冲区会满, 与真实串口一样丢弃, 不阻塞
+        try:
+            written = os.write(master_fd, data)
+        except BlockingIOError:
+            written = 0
+        count('bytes_sent', written)
+        count('bytes_dropped', len(data) - written)
+
+    rng = random.Random(seed)
+    parser = FrameParser(tx_frame_struct, decode_command)
+    commands_file = None if commands_path is None else open(commands_path, 'w')
+
+    capture = b''
+    if capture_path is not None:
+        with open(capture_path, 'rb') as f:
+            capture = f.read()
+    capture_pos = 0
+
+    period_s = 1 / rate_hz
+    start_s = time.monotonic()
+    tick = 0
+    next_send_s = start_s
+    held: list[bytes] = []
+    burst_left = 0
+
+    while True:
+        timeout_s = max(next_send_s - time.monotonic(), 0)
+        readable, _, _ = select.select([master_fd, quit_signal], [], [], timeout_s)
+        if quit_signal in readable:
+            break
+
+        # 接收命令
+        if master_fd in readable:
+            try:
+                data = os.read(master_fd, 4096)
+            except (BlockingIOError, OSError):
+                data = b''
+            crc_errors = parser.crc_error_count
+            for arrival_time_s, command in parser.feed(data, time.time()):
+                count('commands')
+                if commands_file is not None:
+                    commands_file.write(f'{(arrival_time_s, *command)}\n')
+            count('command_crc_errors', parser.crc_error_count - crc_errors)
+
+        now_s = time.monotonic()
+        if now_s < next_send_s:
+            continue
+
+        # 按波特率回放录制的原始字节, 放完后停止发送
+        if capture_path is not None:
+            end = min(int((now_s - start_s) * BAUDRATE / 10), len(capture))
+            if end > capture_pos:
+                write(capture[capture_pos:end])
+                capture_pos = end
+            next_send_s = now_s + 1e-3 if capture_pos < len(capture) else math.inf
+            continue
+
+        # 发送状态帧, 计划时刻不累积抖动
+        yaw_degree, pitch_degree = attitude_at(time.time())
+        frame = pack_status_frame(tick % 256, yaw_degree, pitch_degree, bullet_speed, flag)
+        count('status_sent')
+        if rng.random() < corrupt_prob:
+            frame = corrupt(frame, rng)
+            count('status_corrupted')
+
+        held.append(frame)
+        if burst_left == 0 and rng.random() < burst_prob:
+            burst_left = burst_len
+        if burst_left > 0:
+            burst_left -= 1
+        if burst_left == 0:
+            write(b''.join(held))
+            held.clear()
+
+        tick += 1
+        next_send_s = start_s + tick * period_s + (rng.uniform(-jitter_s, jitter_s) if jitter_s > 0 else 0)
+
+    if commands_file is not None:
+        commands_file.close()
+
+    logging.info('Virtual MCU ended.')
+
+
+class VirtualMcu(ContextManager):
+    def __init__(
+        self, rate_hz: float = 1000, jitter_s: float = 0.0, corrupt_prob: float = 0.0,
+        burst_prob: float = 0.0, burst_len: int = 10, capture_path: str | None = None,
+        commands_path: str | None = None, flag: int = 3, bullet_speed: float = 15.0, seed: int = 0
+    ) -> None:
+        '''
+        rate_hz: 状态帧的发送频率;
+        jitter_s: 每帧发送时刻在计划时刻附近均匀抖动的范围;
+        corrupt_prob: 每帧被损坏的概率;
+        burst_prob, burst_len: 每帧开始一次突发的概率, 突发时连续burst_len帧攒在一起发送;
+        capture_path: 不为None时按波特率回放该文件中的原始字节, 代替生成状态帧;
+        commands_path: 收到的命令的记录文件, None时不记录.
+        '''
+        master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)  # 关闭回显, 否则下位机会收到自己发送的字节
+        os.set_blocking(master_fd, False)
+        self.port = os.ttyname(self._slave_fd)
+
+        self._quit_signal = QuitSignal()
+        self._stats = RawArray(ctypes.c_int64, len(MCU_STATS_FIELDS))
+        self._process = Process(
+            target=simulate,
+            name='mcu',
+            args=(
+                master_fd, self._quit_signal, self._stats,
+                rate_hz, jitter_s, corrupt_prob, burst_prob, burst_len,
+                capture_path, commands_path, flag, bullet_speed, seed
+            )
+        )
+
+        self._process.start()
+        process_profile.apply(self._process.name, self._process.pid)
+
+        # 主进程保留从端, 上位机重新打开串口时伪终端不会被关闭
+        os.close(master_fd)
+
+    def _close(self) -> None:
+        '''注意阻塞'''
+        self._quit_signal.set()
+        self._process.join()
+        os.close(self._slave_fd)
+
+        summary = ' '.join(f'{name}={value}' for name, value in self.stats.items())
+        logging.info(f'VirtualMcu closed: {summary}')
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return dict(zip(MCU_STATS_FIELDS, self._stats))
+
+
+def capture_serial(port: str, path: str, duration_s: float) -> int:
+    '''把真实串口收到的原始字节录制到path, 用于VirtualMcu回放, 返回录制的字节数'''
+    size = 0
+    with serial.Serial(port, BAUDRATE, timeout=0.1) as device, open(path, 'wb') as f:
+        device.reset_input_buffer()
+        end_s = time.monotonic() + duration_s
+        while time.monotonic() < end_s:
+            data = device.read(max(device.in_waiting, 1))
+            f.write(data)
+            size += len(data)
+    return size
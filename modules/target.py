@@ -2,6 +2,7 @@ import math
 import cv2
 import numpy as np
 import modules.tools as tools
+from modules import ballistics
 from modules.NewEKF import ExtendedKalmanFilter
 from modules.tools import shortest_angular_distance
 from modules.autoaim.armor import Armor
@@ -89,10 +90,12 @@ class NormalRobot():
         self.target_state = self.ekfilter.update(z)
 
     def getPreShotPtsInImu(self, deltatime, bulletSpeed, R_camera2gimbal, t_camera2gimbal, cameraMatrix, distCoeffs, yaw=0, pitch=0) -> np.ndarray(shape=(3,)):
-        '''获取预测时间后待击打点的位置(单位:mm)(无重力补偿)'''
+        '''获取预测时间后待击打点的位置(单位:mm)(无重力补偿), 打不到时返回None'''
         state = self.target_state
 
-        flyTime = tools.getParaTime(state[:3] * 1000, bulletSpeed) / 1000
+        _, (flyTime,) = ballistics.solve(state[:3], bulletSpeed)
+        if np.isnan(flyTime):
+            return None  # 打不到
 
         state = self.f(state, deltatime+flyTime)  # predicted
 
@@ -270,10 +273,12 @@ class BalanceInfantry(NormalRobot):
         self.armors_in_pixel = deque(maxlen=2)
 
     def getPreShotPtsInImu(self, deltatime, bulletSpeed, R_camera2gimbal, t_camera2gimbal, cameraMatrix, distCoeffs, yaw=0, pitch=0) -> np.ndarray(shape=(3,)):
-        '''获取预测时间后待击打点的位置(单位:mm)(无重力补偿)'''
+        '''获取预测时间后待击打点的位置(单位:mm)(无重力补偿), 打不到时返回None'''
         state = self.target_state
 
-        flyTime = tools.getParaTime(state[:3] * 1000, bulletSpeed) / 1000
+        _, (flyTime,) = ballistics.solve(state[:3], bulletSpeed)
+        if np.isnan(flyTime):
+            return None  # 打不到
 
         state = self.f(state, deltatime+flyTime)  # predicted
 
@@ -408,10 +413,12 @@ class Outpost(NormalRobot):
         return dhdx
 
     def getPreShotPtsInImu(self, deltatime, bulletSpeed, R_camera2gimbal, t_camera2gimbal, cameraMatrix, distCoeffs, yaw=0, pitch=0) -> np.ndarray(shape=(3,)):
-        '''获取预测时间后待击打点的位置(单位:mm)(无重力补偿)'''
+        '''获取预测时间后待击打点的位置(单位:mm)(无重力补偿), 打不到时返回None'''
         state = self.target_state
 
-        flyTime = tools.getParaTime(state[:3] * 1000, bulletSpeed) / 1000
+        _, (flyTime,) = ballistics.solve(state[:3], bulletSpeed)
+        if np.isnan(flyTime):
+            return None  # 打不到
 
         state = self.f(state, deltatime+flyTime)  # predicted
 
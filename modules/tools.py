@@ -7,7 +7,6 @@ import numpy as np
 from queue import Empty
 from multiprocessing import Queue
 from typing import Tuple
-from scipy.integrate import solve_ivp
 
     
 def config_logging():
@@ -57,62 +56,6 @@ def putText(img: cv2.Mat, text: str, point, color=(0, 0, 255), thickness=2) -> N
     cv2.putText(img, text, anchor, cv2.FONT_HERSHEY_SIMPLEX, 1, color, thickness)
 
 
-def getParaTime(pos, bulletSpeed):
-    '''
-    用抛物线求子弹到目标位置的时间.
-    pos:目标的坐标(mm);
-    bulletSpeed:子弹速度(m/s);
-    return: (ms).
-    '''
-    pos = np.reshape(pos, (3,))
-    x = pos[0]
-    y = pos[1]
-    z = pos[2]
-
-    dxz = math.sqrt(x*x+z*z)
-    a = 0.5*9.7940/1000*dxz*dxz/(bulletSpeed*bulletSpeed)
-    b = dxz
-    c = a - y
-
-    res1 = (-b + math.sqrt(b**2-4*a*c))/(2*a)
-    res2 = (-b - math.sqrt(b**2-4*a*c))/(2*a)
-
-    beta1 = math.atan(res1)
-    beta2 = math.atan(res2)
-
-    t1 = dxz/(bulletSpeed*math.cos(beta1))
-    t2 = dxz/(bulletSpeed*math.cos(beta2))
-
-    # t = math.sqrt(x**2+y**2+z**2)/bulletSpeed
-
-    t = t1 if t1 < t2 else t2
-
-    return t
-
-
-def shoot_pitch(x, y, z, bullet_speed) -> float:
-    g = 9.794 / 1000
-    distance = (x**2 + z**2)**0.5
-
-    a = 0.5 * g * distance**2 / bullet_speed**2
-    b = -distance
-    c = a - y
-
-    result1 = (-b + math.sqrt(b**2-4*a*c))/(2*a)
-    result2 = (-b - math.sqrt(b**2-4*a*c))/(2*a)
-    pitch1 = math.atan(result1)
-    pitch2 = math.atan(result2)
-    t1 = distance / (bullet_speed * math.cos(pitch1))
-    t2 = distance / (bullet_speed * math.cos(pitch2))
-
-    pitch = pitch1 if t1 < t2 else pitch2
-    pitch = math.degrees(pitch)
-
-    # print(f"calculate gravity -- pitch1: {math.degrees(pitch1)} pitch2: {math.degrees(pitch2)} pitch: {pitch}")
-
-    return pitch
-
-
 def R_gimbal2imu(yaw: float, pitch: float) -> np.ndarray:
     yaw, pitch = math.radians(yaw), math.radians(pitch)
     R_y = np.array([[math.cos(yaw), 0, math.sin(yaw)],
@@ -215,95 +158,6 @@ def find_closest_value(x: float, value: Tuple[float, ...]) -> float:
             
     return closest_val
 
-def trajectoryAdjust(target_pos, robot, enableAirRes=1):
-    '''
-    弹道调整，返回重力（及空气阻力）补偿后的目标位置。
-
-    target_pos: mm;
-    pitch_offset: 度;
-    robot: 本机;
-    enableAirRes: 是否计算空气阻力。
-
-    return: mm。
-    '''
-    pos = np.reshape(target_pos, (3,))
-    x, y, z = pos
-    try:
-        pitch = shoot_pitch(x, y, z, robot.bullet_speed) # 枪管向上抬为正
-    except:
-        print("error when calzulate pitch with gravity")
-        return None
-    
-    if enableAirRes==1:
-        try:
-            # Drag coefficient, projectile radius (m), area (m2) and mass (kg).
-            m = 41/1000 if robot.id==1 else 0.0032
-            g = 9.794
-            # k = 0.00021862500000000002 if robot.id==1 else 6.0896287678629725e-05 # 发光大弹丸/发光小弹丸
-            k = 0.00022802630547843214 if robot.id==1 else 6.0896287678629725e-05 # 老的大弹丸/发光小弹丸
-            pitch = findPitch(robot.bullet_speed, k, m, g, math.sqrt(x**2+z**2), y, pitch-5, pitch+10)
-            
-        except:
-            print("弹道空气阻力补偿计算出错")
-    
-    
-    armor_in_gun = np.array([x, y, z]).reshape(3, 1)
-    armor_in_gun[1] = (x*x + z*z) ** 0.5 * -math.tan(math.radians(pitch))
-
-    return armor_in_gun
-
-def calculateDrop(bulletSpeed, k, m, g, pitch, distance):
-    '''
-    计算弹丸在空气阻力和重力的作用下下坠距离,返回y坐标(mm)
-    
-    弹速(m/s); 空气阻力系数; 质量(kg); 重力加速度(m/s2); pitch(度); 水平飞行距离(mm);
-    '''
-    distanceM = distance/1000 # mm -> m
-
-    v0 = bulletSpeed
-    phi0 = np.radians(pitch)   
-    u0 = 0, v0 * np.cos(phi0), 0., v0 * np.sin(phi0)
-    t0, tf = 0, 10
-
-    def deriv(t, u):
-        x, xdot, z, zdot = u
-        speed = np.hypot(xdot, zdot)
-        xdotdot = -k/m * speed * xdot
-        zdotdot = -k/m * speed * zdot - g
-        return xdot, xdotdot, zdot, zdotdot
-
-    def hit_target(t, u):
-        # We've hit the target if the z-coordinate is 0.
-        return u[0]-distanceM
-    
-    # Stop the integration when we hit the target.
-    hit_target.terminal = True
-    # We must be moving downwards (don't stop before we begin moving upwards!)
-    hit_target.direction = 1
-
-    soln = solve_ivp(deriv, (t0, tf), u0, dense_output=False,
-                 events=(hit_target))
-    
-    y = soln.y_events[0][0][2]
-    y = -y*1000 # m -> mm
-
-    return y
-
-def findPitch(bulletSpeed, k, m, g, distance, y, x0, x1, tol=1, maxiter=100):
-    '''割线法求解'''
-    f0, f1 = y - calculateDrop(bulletSpeed, k, m, g, x0, distance), y - calculateDrop(bulletSpeed, k, m, g, x1, distance)
-
-    for i in range(maxiter):
-        if abs(f1) < tol:
-            # print("迭代次数:"+str(i))
-            return x1
-        dfdx = (f1 - f0) / (x1 - x0)
-        x2 = x1 - f1 / dfdx
-        f0, f1 = f1, y - calculateDrop(bulletSpeed, k, m, g, x2, distance)
-        x0, x1 = x1, x2
-
-    raise RuntimeError('Failed to converge')
-
 def printMsgWithTime(msg):
     now = datetime.datetime.now()
     time_now = now.strftime("%H:%M:%S.%f")
@@ -126,5 +126,5 @@ class Tracker:
                 self.lost_count = 0
 
     def getShotPoint(self, deltatime, bulletSpeed, R_camera2gimbal, t_camera2gimbal, cameraMatrix, distCoeffs, yaw=0, pitch=0):
-        '''获取预测时间后待击打点的位置(单位:mm)(无重力补偿)'''
+        '''获取预测时间后待击打点的位置(单位:mm)(无重力补偿), 打不到时返回None'''
         return self.tracking_target.getPreShotPtsInImu(deltatime, bulletSpeed, R_camera2gimbal, t_camera2gimbal, cameraMatrix, distCoeffs, yaw=0, pitch=0)
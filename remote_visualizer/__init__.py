@@ -1,8 +1,12 @@
 import cv2
-import time
+import math
 import queue
+import ctypes
 import logging
-from multiprocessing import Process, Queue
+import numpy as np
+from multiprocessing import Process, Queue, Condition, Value, RawArray, RawValue, shared_memory
+from modules.io import process_profile
+from modules.clock import Clock, real_clock
 
 
 def clear_queue(q: Queue) -> None:
@@ -27,7 +31,10 @@ def get_local_ip():
     return my_ip
 
 
-def visualizing(port: int, show_queue: Queue, plot_queue: Queue):
+def visualizing(
+    port: int, frame_buffer_name: str, frame_shape: RawArray, frame_seq: RawValue, frame_ready: Condition,
+    clients: Value, plot_queue: Queue, max_width: int | None, quality: int
+):
     import os
     import sys
     import json
@@ -38,6 +45,8 @@ def visualizing(port: int, show_queue: Queue, plot_queue: Queue):
     log = logging.getLogger('werkzeug')
     log.setLevel(logging.ERROR)
 
+    frame_buffer = shared_memory.SharedMemory(frame_buffer_name)
+
     app = Flask(__name__)
 
     @app.route('/data')
@@ -51,14 +60,37 @@ def visualizing(port: int, show_queue: Queue, plot_queue: Queue):
     def plot():
         return render_template('plot.html')
 
+    def read_frame(last_seq: int) -> tuple[int, cv2.Mat | None]:
+        '''等待新的一帧, 在锁内缩放或复制出来, 超时返回None'''
+        with frame_ready:
+            if not frame_ready.wait_for(lambda: frame_seq.value != last_seq, timeout=1):
+                return last_seq, None
+            h, w, c = frame_shape
+            img = np.ndarray((h, w, c), np.uint8, frame_buffer.buf)
+            if max_width is not None and w > max_width:
+                img = cv2.resize(img, (max_width, round(h * max_width / w)), interpolation=cv2.INTER_AREA)
+            else:
+                img = img.copy()
+            return frame_seq.value, img
+
     @app.route('/video_feed')
     def video_feed():
         def next_frame():
-            while True:
-                img = show_queue.get()
-                _, buffer = cv2.imencode('.jpg', img)
-                img = buffer.tobytes()
-                yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'+img+b'\r\n'
+            # 有客户端连接时主进程才写入新帧, 编码在锁外进行
+            with clients.get_lock():
+                clients.value += 1
+            try:
+                seq = frame_seq.value
+                while True:
+                    seq, img = read_frame(seq)
+                    if img is None:
+                        continue
+                    _, buffer = cv2.imencode('.jpg', img, (cv2.IMWRITE_JPEG_QUALITY, quality))
+                    img = buffer.tobytes()
+                    yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'+img+b'\r\n'
+            finally:
+                with clients.get_lock():
+                    clients.value -= 1
 
         return Response(next_frame(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
@@ -66,44 +98,79 @@ def visualizing(port: int, show_queue: Queue, plot_queue: Queue):
     def index():
         return render_template('index.html')
 
-    app.run(host="0.0.0.0", port=port, debug=False)
+    app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
 
 
 class Visualizer:
-    def __init__(self, port: int = 60000, enable: bool = True, fps: int = 30) -> None:
+    def __init__(
+        self, port: int = 60000, enable: bool = True, fps: int = 30, clock: Clock = real_clock,
+        max_shape: tuple[int, int, int] = (1024, 1280, 3), max_width: int | None = 640, quality: int = 80
+    ) -> None:
+        '''
+        clock: 限制显示帧率所用的时钟;
+        max_shape: 共享内存中帧的最大尺寸, 更大的图像先缩小再写入;
+        max_width: 网页上显示的最大宽度, 超过时在可视化进程中缩小, None时不缩小;
+        quality: jpeg质量.
+        '''
         self.enable = enable
+        self._clock = clock
         if not self.enable:
             return
 
-        self._show_queue = Queue(maxsize=1)
+        # 一个共享内存槽位, 主进程拿不到锁(可视化进程正在读取)时直接丢弃该帧
+        self._frame_buffer = shared_memory.SharedMemory(create=True, size=int(np.prod(max_shape)))
+        self._frame_shape = RawArray(ctypes.c_int, 3)
+        self._frame_seq = RawValue(ctypes.c_int64, 0)
+        self._frame_ready = Condition()
+        self._clients = Value(ctypes.c_int, 0)
+
         self._plot_queue = Queue(maxsize=1)
         self._plot_buffer = []
 
         self.visualizing = Process(
             target=visualizing,
-            args=(port, self._show_queue, self._plot_queue)
+            name='visualize',
+            args=(
+                port, self._frame_buffer.name, self._frame_shape, self._frame_seq, self._frame_ready,
+                self._clients, self._plot_queue, max_width, quality
+            )
         )
 
         self.visualizing.start()
+        process_profile.apply(self.visualizing.name, self.visualizing.pid)
         host_ip = get_local_ip()
         logging.info(f'Visualizer will be running on http://{host_ip}:{port}')
 
         self.fps = fps
-        self.last_put_time = 0
+        self.last_put_time = -math.inf
+
+    def will_accept(self) -> bool:
+        '''下一次show是否会被显示: 有网页打开且没有超过帧率. 为False时可以跳过调试绘图'''
+        if not self.enable or self._clients.value == 0:
+            return False
+        return self._clock.monotonic() - self.last_put_time >= 1 / self.fps
 
     def show(self, img: cv2.Mat) -> None:
-        if not self.enable:
+        if not self.will_accept():
             return
 
-        current_time = time.time()
-        if 1 / (current_time - self.last_put_time) > self.fps:
-            return
+        if img.nbytes > self._frame_buffer.size:
+            scale = (self._frame_buffer.size / img.nbytes) ** 0.5
+            img = cv2.resize(img, (int(img.shape[1] * scale), int(img.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        h, w = img.shape[:2]
+        c = img.shape[2] if img.ndim == 3 else 1
 
+        if not self._frame_ready.acquire(block=False):
+            return
         try:
-            self._show_queue.put_nowait(img)
-            self.last_put_time = current_time
-        except queue.Full:
-            pass
+            np.ndarray((h, w, c), np.uint8, self._frame_buffer.buf)[:] = img.reshape(h, w, c)
+            self._frame_shape[:] = (h, w, c)
+            self._frame_seq.value += 1
+            self._frame_ready.notify_all()
+        finally:
+            self._frame_ready.release()
+
+        self.last_put_time = self._clock.monotonic()
 
     def plot(self, values=(), names=()) -> None:
         if not self.enable:
@@ -129,10 +196,12 @@ class Visualizer:
         self.visualizing.terminate()
 
         clear_queue(self._plot_queue)
-        clear_queue(self._show_queue)
 
         self.visualizing.join()
 
+        self._frame_buffer.close()
+        self._frame_buffer.unlink()
+
         logging.info('Visualizer closed.')
 
         return ignore_error
@@ -6,6 +6,7 @@ import logging
 import numpy as np
 
 import modules.tools as tools
+from modules import ballistics
 from modules.io.robot import Robot
 from modules.io.recorder import Recorder
 from modules.io.communication import Communicator
@@ -32,7 +33,7 @@ if __name__ == '__main__':
         # 因为每次开机后第一次打开串口，其输出全都是0，原因未知。
         pass
 
-    with Robot(exposure_ms, port) as robot, Visualizer(enable=enable) as visualizer, Recorder() as recorder:
+    with Robot(exposure_ms, port) as robot, Visualizer(enable=enable) as visualizer, Recorder(robot.camera) as recorder:
         robot.update()
 
         if robot.id == 1:
@@ -72,13 +73,13 @@ if __name__ == '__main__':
 
                 aim_point_m = armor.in_imu_m
 
-                x, y, z = (aim_point_m * 1e3).T[0]
-                shoot_pitch_degree = tools.shoot_pitch(x, y, z, robot.bullet_speed)
-                shoot_y_mm = (x*x + z*z) ** 0.5 * -math.tan(math.radians(shoot_pitch_degree))
+                gun_pitch_rad, _ = ballistics.solve(aim_point_m, robot.bullet_speed)
+                # 打不到时跳过这次射击
+                if not np.isnan(gun_pitch_rad).any():
+                    aim_point_m = ballistics.compensate(aim_point_m, gun_pitch_rad)
 
-                aim_point_m[1, 0] = shoot_y_mm / 1e3
-
-                robot.shoot(gun_up_degree, gun_right_degree, aim_point_m)
+                    robot.shoot(gun_up_degree, gun_right_degree, aim_point_m)
+                    recorder.trigger('shoot')
 
             # 调试分割线
 
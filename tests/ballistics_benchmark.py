@@ -0,0 +1,83 @@
+import sys
+import math
+import time
+import numpy as np
+from scipy.integrate import solve_ivp
+import parent_folder
+from modules import ballistics
+
+'''
+弹道解算基准, 不需要硬件.
+对比批量阻力弹道(ballistics.solve)与原先逐点的solve_ivp+割线法(tools.findPitch)的耗时,
+并以小步长, 密集候选的结果和原先的割线法(容差1mm)为参考, 统计目标处的高度误差.
+用法: python ballistics_benchmark.py [point_num] [repeat]
+'''
+
+
+def secant_pitch_rad(distance_m: float, y_m: float, bullet_speed_m_per_s: float, k_over_m: float) -> float:
+    '''原先的tools.trajectoryAdjust: 以重力弹道为初值, solve_ivp积分, 割线法求pitch, 容差1mm'''
+    def drop_m(pitch_degree: float) -> float:
+        phi = math.radians(pitch_degree)
+
+        def deriv(t, u):
+            _, vx, _, vz = u
+            speed = math.hypot(vx, vz)
+            return vx, -k_over_m * speed * vx, vz, -k_over_m * speed * vz - ballistics.g
+
+        def hit_target(t, u):
+            return u[0] - distance_m
+        hit_target.terminal = True
+        hit_target.direction = 1
+
+        solution = solve_ivp(deriv, (0, 10), (0, bullet_speed_m_per_s * math.cos(phi), 0, bullet_speed_m_per_s * math.sin(phi)), events=hit_target)
+        return -solution.y_events[0][0][2]
+
+    gravity_pitch_rad, _ = ballistics.gravity_trajectory(distance_m, y_m, bullet_speed_m_per_s)
+    x0, x1 = math.degrees(gravity_pitch_rad) - 5, math.degrees(gravity_pitch_rad) + 10
+    f0, f1 = y_m - drop_m(x0), y_m - drop_m(x1)
+    for _ in range(100):
+        if abs(f1) < 1e-3:
+            return math.radians(x1)
+        x2 = x1 - f1 * (x1 - x0) / (f1 - f0)
+        f0, f1 = f1, y_m - drop_m(x2)
+        x0, x1 = x1, x2
+    return math.nan
+
+
+def per_call_ms(function, repeat: int) -> float:
+    function()
+    start_s = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start_s) / repeat * 1e3
+
+
+if __name__ == '__main__':
+    point_num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    # 1~8m内的目标, 小弹丸15m/s
+    rng = np.random.default_rng(0)
+    points_m = rng.uniform([-3, -1, 1], [3, 1, 8], (point_num, 3)).T
+    bullet_speed_m_per_s = 15.0
+    k_over_m = ballistics.k_over_m_small
+    distance_m = np.hypot(points_m[0], points_m[2])
+
+    one_ms = per_call_ms(lambda: ballistics.solve(points_m[:, :1], bullet_speed_m_per_s, k_over_m), repeat)
+    batch_ms = per_call_ms(lambda: ballistics.solve(points_m, bullet_speed_m_per_s, k_over_m), repeat)
+    secant_ms = per_call_ms(lambda: secant_pitch_rad(distance_m[0], points_m[1, 0], bullet_speed_m_per_s, k_over_m), max(repeat // 5, 1))
+    print(f'solve: 1 point {one_ms:.3f}ms, {point_num} points {batch_ms:.3f}ms ({batch_ms / point_num:.3f}ms/point)')
+    print(f'solve_ivp + secant: 1 point {secant_ms:.3f}ms')
+
+    # 参考: 小步长积分, 在更密的候选中搜索
+    pitch_rad, _ = ballistics.solve(points_m, bullet_speed_m_per_s, k_over_m)
+    dt_s, bracket_num = ballistics.dt_s, ballistics.bracket_num
+    ballistics.dt_s, ballistics.bracket_num = 1e-3, 64
+    reference_rad, _ = ballistics.solve(points_m, bullet_speed_m_per_s, k_over_m)
+    ballistics.dt_s, ballistics.bracket_num = dt_s, bracket_num
+
+    secant_rad = np.array([secant_pitch_rad(d, y, bullet_speed_m_per_s, k_over_m) for d, y in zip(distance_m, points_m[1])])
+
+    for name, expected_rad in (('reference', reference_rad), ('solve_ivp + secant', secant_rad)):
+        error_mm = np.abs(pitch_rad - expected_rad) * distance_m * 1e3
+        print(f'height error vs {name}: max={np.nanmax(error_mm):.4f}mm mean={np.nanmean(error_mm):.4f}mm')
@@ -0,0 +1,66 @@
+import sys
+import cv2
+import time
+import tempfile
+import numpy as np
+import parent_folder
+from modules.io.recording import RecordingWriter, RecordingReader, encode
+from modules.io.bayer import mosaic
+
+'''
+录像读写基准, 不需要硬件.
+生成合成帧, 分别以jpeg和bayer格式写入分段录像, 统计写入吞吐, 随机访问与顺序预取读取的速度.
+用法: python recording_benchmark.py [frame_num] [segment_mb]
+'''
+
+
+if __name__ == '__main__':
+    frame_num = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    segment_bytes = int(float(sys.argv[2]) * 1e6) if len(sys.argv) > 2 else 64e6
+
+    # 暗背景加灯条, 循环使用16帧
+    frames = []
+    for i in range(16):
+        frame = np.full((1024, 1280, 3), 10, dtype=np.uint8)
+        for x in (400 + 10*i, 600 + 10*i):
+            cv2.rectangle(frame, (x, 400), (x + 10, 470), (255, 200, 100), -1)
+        frames.append(frame)
+
+    for format in ('jpeg', 'bayer'):
+        with tempfile.TemporaryDirectory() as path:
+            imgs = frames if format == 'jpeg' else [mosaic(frame, 'RG') for frame in frames]
+
+            start_s = time.perf_counter()
+            writer = RecordingWriter(path, format, imgs[0].shape, 'RG' if format == 'bayer' else None, int(segment_bytes))
+            for i in range(frame_num):
+                writer.write(encode(imgs[i % 16], format), (i / 100, 0.0, 0.0, 15.0, 3))
+            writer.close()
+            write_s = time.perf_counter() - start_s
+
+            reader = RecordingReader(path)
+            assert len(reader) == frame_num
+
+            # 随机访问: 只读索引, 以及读索引并解码
+            indices = np.random.default_rng(0).integers(0, frame_num, 1000)
+            start_s = time.perf_counter()
+            for i in indices:
+                reader.status(int(i))
+            status_us = (time.perf_counter() - start_s) / len(indices) * 1e6
+
+            start_s = time.perf_counter()
+            for i in indices[:100]:
+                reader.frame(int(i))
+            frame_ms = (time.perf_counter() - start_s) / 100 * 1e3
+
+            # 顺序读取, 解码在预取线程中, 主线程模拟每帧2ms的处理
+            start_s = time.perf_counter()
+            for _ in reader.frames():
+                time.sleep(2e-3)
+            iterate_fps = frame_num / (time.perf_counter() - start_s)
+
+            mb = writer.byte_count / 1e6
+            print(
+                f'{format}: {frame_num} frames {mb:.1f}MB in {writer._segment + 1} segments, '
+                f'write {frame_num / write_s:.0f}fps {mb / write_s:.0f}MB/s, '
+                f'status {status_us:.1f}us, frame {frame_ms:.2f}ms, prefetched {iterate_fps:.0f}fps'
+            )
@@ -0,0 +1,23 @@
+import sys
+import time
+import parent_folder
+from modules.io.robot import Robot
+from modules.io.simulation import Replay
+
+if __name__ == '__main__':
+    # 用法: python replay_test.py recordings/xxx [-f], -f为尽可能快地回放
+    replay = Replay(sys.argv[1], realtime=('-f' not in sys.argv))
+
+    count = 0
+    try:
+        with Robot(3, '/dev/ttyUSB0', replay=replay) as robot:
+            start_time_s = time.time()
+            while True:
+                robot.update()
+                yaw_degree, pitch_degree = robot.yaw_pitch_degree_at(robot.img_time_s)
+                count += 1
+                print(f'{robot.trace_id} {robot.img_time_s:.3f} yaw={yaw_degree:.2f} pitch={pitch_degree:.2f}')
+
+    except EOFError:
+        cost_s = time.time() - start_time_s
+        print(f'{count} frames in {cost_s:.2f}s, {count/cost_s:.1f}fps')
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import parent_folder
+from modules.io.communication import FrameParser, pack_status_frame
+from modules.io.parallel_rx_communicator import ParallelRxCommunicator
+from modules.io.clock_sync import format_stats
+from modules.io.parallel_tx_communicator import ParallelTxCommunicator
+from modules.io.parallel_serial_communicator import ParallelSerialCommunicator
+from modules.io.simulation import load_commands
+from modules.io.virtual_mcu import VirtualMcu
+
+'''
+串口收发基准, 不需要硬件, 使用虚拟下位机.
+接收: 解析器离线解码吞吐, 以及以rate_hz发送(含抖动, 损坏与突发)时主进程收到的帧率与IMU数据丢失;
+发送: 主进程调用send到虚拟下位机收到命令的延迟.
+分别测量接收与发送各用一个进程, 以及一个进程收发.
+用法: python serial_benchmark.py [seconds] [rate_hz] [capture_path]
+'''
+
+
+def percentiles_ms(values_s: list[float]) -> str:
+    values_ms = np.float64(values_s) * 1e3
+    return ' '.join(f'p{p}={np.percentile(values_ms, p):.3f}ms' for p in (50, 90, 99)) + f' max={values_ms.max():.3f}ms'
+
+
+def measure(seconds: float, rate_hz: float, capture_path: str | None, single_process: bool) -> None:
+    commands_path = os.path.join(tempfile.mkdtemp(), 'commands.txt')
+    mcu = VirtualMcu(
+        rate_hz, jitter_s=0.2 / rate_hz, corrupt_prob=0.01, burst_prob=0.002, burst_len=10,
+        capture_path=capture_path, commands_path=commands_path
+    )
+    with mcu:
+        if single_process:
+            rx_communicator = tx_communicator = ParallelSerialCommunicator(mcu.port, mcu_rate_hz=rate_hz)
+        else:
+            rx_communicator, tx_communicator = ParallelRxCommunicator(mcu.port, mcu_rate_hz=rate_hz), ParallelTxCommunicator(mcu.port)
+
+        stamps = []
+        send_times_s = []
+        last_read_time_s = 0
+
+        start_s = time.time()
+        while time.time() - start_s < seconds:
+            rx_communicator.update()
+
+            # 收集上次以来新到的帧
+            stamps.extend(rx_communicator.attitude.after(last_read_time_s)['stamp'])
+            last_read_time_s = rx_communicator.latest_read_time_s
+
+            # 命令的x为序号, 用于和下位机的记录对应
+            send_time_s = time.time()
+            if tx_communicator.send(len(send_times_s), 0, 1000):
+                send_times_s.append(send_time_s)
+        cost_s = time.time() - start_s
+        clock_stats = rx_communicator.clock_stats
+
+        rx_communicator._close()
+        if tx_communicator is not rx_communicator:
+            tx_communicator._close()
+
+        time.sleep(0.1)
+        stats = mcu.stats
+
+    print(f'rx: {len(stamps) / cost_s:.0f} frames/s received')
+    if capture_path is None:
+        # 帧序号为8位, 两帧之间缺少的序号即丢失的帧, 损坏的帧本来就无法解出
+        gaps = (np.diff(np.int64(stamps)) - 1) % 256
+        lost = int(gaps.sum())
+        print(f'imu: {lost} samples lost in {len(stamps) + lost} ({lost / (len(stamps) + lost):.2%}), mcu corrupted {stats["status_corrupted"] / stats["status_sent"]:.2%} in total')
+    print(f'mcu: {stats}')
+    print(f'clock: {format_stats(clock_stats)}')
+
+    commands = load_commands(commands_path)
+    latencies_s = [arrival_time_s - send_times_s[int(x)] for arrival_time_s, x, _, _, _ in commands if int(x) < len(send_times_s)]
+    print(f'tx: {len(commands)}/{len(send_times_s)} commands received, latency {percentiles_ms(latencies_s)}')
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rate_hz = float(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    capture_path = sys.argv[3] if len(sys.argv) > 3 else None
+
+    # 解析器离线解码吞吐, 每块约为1ms的数据
+    data = b''.join(pack_status_frame(i % 256, 0.0, 0.0, 15.0, 3) for i in range(100000))
+    parser = FrameParser()
+    start_s = time.perf_counter()
+    for i in range(0, len(data), 110):
+        parser.feed(data[i:i + 110], i)
+    print(f'decode: {parser.frame_count / (time.perf_counter() - start_s):.0f} frames/s')
+
+    for single_process in (False, True):
+        print(f'--- {"single serial process" if single_process else "separate rx and tx processes"}')
+        measure(seconds, rate_hz, capture_path, single_process)
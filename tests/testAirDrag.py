@@ -4,37 +4,24 @@ import sys
 tests_folder = os.path.dirname(__file__)
 parent_folder = os.path.dirname(tests_folder)
 sys.path.append(parent_folder)
-import modules.tools as tools
+from modules import ballistics
 
 
 import cv2
 import math
 import numpy as np
-from queue import Empty
-from multiprocessing import Queue
-from typing import Tuple
-from scipy.integrate import solve_ivp
 
-class Robot:
-    def __init__(self, exposure_ms: float, port: str) -> None:
-        self.bullet_speed=0
-        self.id=""
-
-
-robot = Robot(3,'/dev/ttyUSB0')
-robot.id = 'big_one_'
-robot.bullet_speed = 15
-pitch_offset = 0
-predictedPtsInWorld = [243.23, 873.45, 5109.56]
+bullet_speed = 15
+robot_id = 1
+predictedPtsInWorld = np.float64([[243.23, 873.45, 5109.56]]).T
 import time
 # 记录开始时间
 start_time = time.time()
 
 # 程序代码
 for i in range(1):
-    armor_in_gun = tools.trajectoryAdjust(predictedPtsInWorld,                                      
-                                      robot, 
-                                      enableAirRes=1)
+    gun_pitch_rad, _ = ballistics.solve(predictedPtsInWorld / 1e3, bullet_speed, ballistics.k_over_m_of(robot_id))
+    armor_in_gun = ballistics.compensate(predictedPtsInWorld, gun_pitch_rad)
 
 # 记录结束时间
 end_time = time.time()
@@ -0,0 +1,83 @@
+import os
+import sys
+import cv2
+import time
+import tempfile
+import numpy as np
+import multiprocessing
+import parent_folder
+from modules.io.robot import Robot
+from modules.io.recorder import Recorder
+from modules.io.simulation import Replay
+from modules.io.trace import Stage
+from modules.io import process_profile
+
+'''
+CPU占用与交接延迟基准, 不需要硬件.
+用离线回放以fps驱动Robot与Recorder, 统计各进程的CPU占用, 以及取图到主进程拿到图像的延迟.
+用法: python wakeup_benchmark.py [seconds] [fps] [encoder_num]
+'''
+
+
+def cpu_time_s(pid: int) -> float:
+    '''/proc/<pid>/stat中的utime+stime'''
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    fps = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+    encoder_num = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    # 生成暗背景加灯条的合成录像, 循环使用16帧
+    os.chdir(tempfile.mkdtemp())
+    frame_num = int(seconds * fps)
+    frames = []
+    for i in range(16):
+        frame = np.full((1024, 1280, 3), 10, dtype=np.uint8)
+        for x in (400 + 10*i, 600 + 10*i):
+            cv2.rectangle(frame, (x, 400), (x + 10, 470), (255, 200, 100), -1)
+        frames.append(frame)
+
+    video_writer = cv2.VideoWriter('bench.avi', cv2.VideoWriter_fourcc(*'MJPG'), fps, (1280, 1024))
+    with open('bench.txt', 'w') as f:
+        for i in range(frame_num):
+            video_writer.write(frames[i % 16])
+            f.write(f'{(i / fps, 0.0, 0.0, 15.0, 3)}\n')
+    video_writer.release()
+
+    with Robot(3, '/dev/null', replay=Replay('bench.avi', realtime=True)) as robot, Recorder(robot.camera, worker_num=encoder_num) as recorder:
+        # 同名的进程(多个encode)合计
+        pids = [('main', os.getpid())] + [(p.name, p.pid) for p in multiprocessing.active_children()]
+        start_cpu_s = [cpu_time_s(pid) for _, pid in pids]
+        start_s = time.time()
+
+        # 在回放结束前停止统计, 保证所有进程都还在运行
+        count = 0
+        while count < frame_num - fps:
+            robot.update()
+            yaw_degree, pitch_degree = robot.yaw_pitch_degree_at(robot.img_time_s)
+            cv2.threshold(robot.img[::4, ::4], 90, 255, cv2.THRESH_BINARY)
+            recorder.record(robot.img, (robot.img_time_s, yaw_degree, pitch_degree, robot.bullet_speed, robot.flag))
+            count += 1
+
+        cost_s = time.time() - start_s
+        cpu_percent: dict[str, float] = {}
+        for (name, pid), start_cpu in zip(pids, start_cpu_s):
+            cpu_percent[name] = cpu_percent.get(name, 0) + (cpu_time_s(pid) - start_cpu) / cost_s * 100
+        percentiles = robot.tracer.percentiles_s(Stage.CAPTURE, Stage.HANDOFF, window=frame_num)
+        placement = process_profile.report()
+        recorder_stats = recorder.stats
+        worker_stats = recorder.worker_stats
+
+    print(f'{count} frames in {cost_s:.2f}s')
+    for name, percent in cpu_percent.items():
+        print(f'{name}: {percent:.1f}% cpu')
+    print(f'total: {sum(cpu_percent.values()):.1f}% cpu')
+    print('capture to handoff: ' + ' '.join(f'p{p:g}={v*1e3:.3f}ms' for p, v in percentiles.items()))
+    print('recorder: ' + ' '.join(f'{name}={value:.6g}' for name, value in recorder_stats.items()))
+    for worker, stats in enumerate(worker_stats):
+        print(f'encoder {worker}: ' + ' '.join(f'{name}={value:.6g}' for name, value in stats.items()))
+    print(placement)